@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""End-to-end BatchProcessor throughput benchmark
+
+Generates a synthetic image/mask dataset in a temp directory and runs
+BatchProcessor.process over a matrix of worker counts, variant counts,
+mask on/off and pipelines (default: every file in workspace/pipelines/).
+Each case runs in a fresh subprocess so peak RSS is measured per case.
+
+Reported per case: images/sec, variants/sec, peak RSS (main process and
+largest worker), bytes written, and the time split between I/O (decode,
+mask load, write), encoding and compute (transforms) from the run's timing
+profile.
+
+Usage:
+    python scripts/benchmark_batch.py --output batch.json
+    python scripts/benchmark_batch.py --workers 1 4 8 --variants 3 --images 64 --size 2048
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import cv2
+
+# Add repo root to path
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+from src.components.batch_processor import BatchProcessor, load_run_results
+from src.components.pipeline_manager import PipelineConfig
+from benchmark_transforms import synthetic_image, synthetic_mask
+
+
+IO_STAGES = ("decode_image", "load_mask", "write", "cache_lookup", "cache_store")
+ENCODE_STAGES = ("color_convert", "encode", "encode_mask")
+COMPUTE_STAGES = ("geometric", "pixel")
+
+
+def make_dataset(root: Path, num_images: int, size: int) -> tuple[Path, Path]:
+    """Write a synthetic PNG image/mask dataset
+
+    Args:
+        root: Dataset directory
+        num_images: Number of image/mask pairs
+        size: Image width and height in pixels
+
+    Returns:
+        (image_dir, mask_dir)
+    """
+    image_dir = root / "images"
+    mask_dir = root / "masks"
+    image_dir.mkdir(parents=True, exist_ok=True)
+    mask_dir.mkdir(parents=True, exist_ok=True)
+    for i in range(num_images):
+        image = synthetic_image(size, "rgb", seed=i)
+        cv2.imwrite(str(image_dir / f"img_{i:04d}.png"), image)
+        cv2.imwrite(str(mask_dir / f"img_{i:04d}.png"), synthetic_mask(size, seed=i))
+    return image_dir, mask_dir
+
+
+def peak_rss_bytes(who: int) -> int:
+    """Peak resident set size of this process or its largest child"""
+    peak = resource.getrusage(who).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def stage_total_ms(profile: dict, stages: tuple) -> float:
+    return sum(profile["stages"][s]["total_ms"] for s in stages if s in profile["stages"])
+
+
+def run_case(case: dict) -> dict:
+    """Run one benchmark case in this process and return its metrics"""
+    output_dir = Path(case["output_dir"])
+    processor = BatchProcessor(
+        input_image_dir=case["image_dir"],
+        input_mask_dir=case["mask_dir"] if case["masks"] else None,
+        output_dir=str(output_dir),
+        pipeline_config=PipelineConfig(case["pipeline"]),
+        num_variants=case["variants"],
+        random_seed=42,
+        num_workers=case["workers"],
+        io_threads=case["io_threads"],
+        profile=True
+    )
+
+    start = time.perf_counter()
+    run_dir, _ = processor.process()
+    wall_seconds = time.perf_counter() - start
+    # Before the results are read back, which the run itself doesn't hold
+    peak_rss = peak_rss_bytes(resource.RUSAGE_SELF)
+
+    results = load_run_results(run_dir)
+
+    with open(run_dir / "manifest.json") as f:
+        manifest = json.load(f)
+    profile = manifest["profile"]
+
+    outputs = [o for r in results for o in r.get("outputs", []) if o["status"] == "success"]
+    io_ms = stage_total_ms(profile, IO_STAGES)
+    encode_ms = stage_total_ms(profile, ENCODE_STAGES)
+    compute_ms = stage_total_ms(profile, COMPUTE_STAGES)
+    busy_ms = io_ms + encode_ms + compute_ms
+
+    return {
+        "images": len(results),
+        "failed": sum(1 for r in results if r["status"] == "error"),
+        "wall_seconds": wall_seconds,
+        "images_per_sec": len(results) / wall_seconds if wall_seconds > 0 else 0.0,
+        "variants_per_sec": len(outputs) / wall_seconds if wall_seconds > 0 else 0.0,
+        "bytes_written": sum(o.get("bytes", 0) for o in outputs),
+        "peak_rss_bytes": peak_rss,
+        "peak_worker_rss_bytes": peak_rss_bytes(resource.RUSAGE_CHILDREN) if case["workers"] > 1 else None,
+        # Summed over all workers/threads, so can exceed wall time
+        "io_ms": io_ms,
+        "encode_ms": encode_ms,
+        "compute_ms": compute_ms,
+        "io_fraction": io_ms / busy_ms if busy_ms else 0.0,
+        "encode_fraction": encode_ms / busy_ms if busy_ms else 0.0,
+        "compute_fraction": compute_ms / busy_ms if busy_ms else 0.0,
+        "stages": profile["stages"]
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark BatchProcessor end to end")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--variants", type=int, nargs="+", default=[1, 3])
+    parser.add_argument("--masks", nargs="+", choices=["on", "off"], default=["on", "off"])
+    parser.add_argument("--io-threads", type=int, nargs="+", default=[0],
+                        help="I/O thread counts (only used with 1 worker)")
+    parser.add_argument("--pipelines", nargs="+",
+                        help="Pipeline JSON files (default: workspace/pipelines/*.json)")
+    parser.add_argument("--images", type=int, default=32, help="Synthetic images in the dataset")
+    parser.add_argument("--size", type=int, default=1024, help="Synthetic image size in pixels")
+    parser.add_argument("--workdir", help="Keep dataset and runs here instead of a temp directory")
+    parser.add_argument("--output", default="batch_benchmark.json", help="Report path")
+    parser.add_argument("--run-case", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_case:
+        # Child mode: one case per process so peak RSS is per case
+        print(json.dumps(run_case(json.loads(args.run_case))))
+        return 0
+
+    pipelines = args.pipelines or sorted(str(p) for p in (REPO_ROOT / "workspace" / "pipelines").glob("*.json"))
+
+    with tempfile.TemporaryDirectory(prefix="batch_benchmark_") as tmp:
+        workdir = Path(args.workdir) if args.workdir else Path(tmp)
+        print(f"Generating {args.images} synthetic {args.size}px images in {workdir}...")
+        image_dir, mask_dir = make_dataset(workdir / "dataset", args.images, args.size)
+
+        cases = []
+        for pipeline in pipelines:
+            for masks in args.masks:
+                for variants in args.variants:
+                    for workers in args.workers:
+                        for io_threads in (args.io_threads if workers == 1 else [0]):
+                            cases.append({
+                                "pipeline": pipeline,
+                                "masks": masks == "on",
+                                "variants": variants,
+                                "workers": workers,
+                                "io_threads": io_threads,
+                                "image_dir": str(image_dir),
+                                "mask_dir": str(mask_dir),
+                                "output_dir": str(workdir / "runs")
+                            })
+
+        results = []
+        for case in cases:
+            label = (f"{Path(case['pipeline']).stem:<24} masks={'on ' if case['masks'] else 'off'} "
+                     f"variants={case['variants']} workers={case['workers']} io_threads={case['io_threads']}")
+            completed = subprocess.run(
+                [sys.executable, __file__, "--run-case", json.dumps(case)],
+                capture_output=True, text=True
+            )
+            entry = {k: case[k] for k in ("pipeline", "masks", "variants", "workers", "io_threads")}
+            if completed.returncode != 0:
+                entry["error"] = completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else "failed"
+                print(f"{label}  ERROR {entry['error']}")
+            else:
+                entry.update(json.loads(completed.stdout.strip().splitlines()[-1]))
+                print(f"{label}  {entry['images_per_sec']:7.2f} img/s  "
+                      f"RSS {entry['peak_rss_bytes'] / 2**20:7.1f} MiB  "
+                      f"written {entry['bytes_written'] / 2**20:7.1f} MiB  "
+                      f"io/encode/compute {entry['io_fraction']:.0%}/{entry['encode_fraction']:.0%}/"
+                      f"{entry['compute_fraction']:.0%}")
+            results.append(entry)
+
+    report = {
+        "benchmark": "batch",
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "opencv": cv2.__version__
+        },
+        "config": {"images": args.images, "size": args.size},
+        "results": results
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Report saved to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""Per-transform microbenchmark over TransformRegistry.list_all()
+
+Times every registered transform on synthetic SEM-like images (grayscale and
+RGB, several resolutions, with and without a mask target) using the defaults
+from TRANSFORM_METADATA, always applied (p=1). Writes a JSON report and can
+compare it against a saved baseline.
+
+Usage:
+    python scripts/benchmark_transforms.py --output transforms.json
+    python scripts/benchmark_transforms.py --sizes 1024 2048 --transforms Blur Rotate
+    python scripts/benchmark_transforms.py --baseline baseline.json --threshold 0.2
+
+To refresh the baseline, copy a report over it. Exit status is 1 if any case
+regressed by more than the threshold.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+import warnings
+from pathlib import Path
+
+import albumentations as A
+import cv2
+import numpy as np
+
+# Add repo root to path
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src.components.profiling import summarize
+from src.components.transform_registry import TransformRegistry
+
+
+DEFAULT_SIZES = [1024, 2048, 4096, 8192]
+
+
+def synthetic_image(size: int, channels: str, seed: int = 0) -> np.ndarray:
+    """SEM-like test image: smooth background, grain texture and bright edges
+
+    Args:
+        size: Width and height in pixels
+        channels: "gray" (HxW) or "rgb" (HxWx3)
+        seed: Noise seed
+
+    Returns:
+        uint8 image
+    """
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:size, 0:size].astype(np.float32) / size
+    background = 90 + 40 * np.sin(6 * x) * np.cos(4 * y)
+    grain = cv2.GaussianBlur(rng.normal(0, 25, (size, size)).astype(np.float32), (0, 0), 2)
+    image = np.clip(background + grain, 0, 255).astype(np.uint8)
+    edges = cv2.Canny(image, 40, 120)
+    image = np.maximum(image, edges)
+    if channels == "rgb":
+        image = np.stack([image] * 3, axis=-1)
+    return image
+
+
+def synthetic_mask(size: int, seed: int = 0) -> np.ndarray:
+    """Binary mask (0/255) with a few filled ellipses"""
+    rng = np.random.default_rng(seed + 1)
+    mask = np.zeros((size, size), dtype=np.uint8)
+    for _ in range(8):
+        center = tuple(int(c) for c in rng.integers(0, size, 2))
+        axes = tuple(int(a) for a in rng.integers(size // 40, size // 8, 2))
+        cv2.ellipse(mask, center, axes, float(rng.uniform(0, 180)), 0, 360, 255, -1)
+    return mask
+
+
+def transform_params(name: str, size: int) -> dict:
+    """Benchmark parameters: TRANSFORM_METADATA defaults, always applied
+
+    Crop/resize transforms without defaults get a target of half the input
+    size, so they do real work at every resolution.
+    """
+    params = {p["name"]: p["default"] for p in TransformRegistry.get_param_schema(name)}
+    half = size // 2
+    required = {
+        "Resize": {"height": half, "width": half},
+        "RandomCrop": {"height": half, "width": half},
+        "CenterCrop": {"height": half, "width": half},
+        "Crop": {"x_max": half, "y_max": half},
+        "RandomResizedCrop": {"height": half, "width": half},
+        "RandomSizedCrop": {"min_max_height": (half, size), "height": half, "width": half},
+    }
+    params.update(required.get(name, {}))
+    params["p"] = 1.0
+    return params
+
+
+def benchmark_case(name: str,
+                   image: np.ndarray,
+                   mask,
+                   repeats: int,
+                   warmup: int,
+                   time_budget: float) -> dict:
+    """Time one transform on one input
+
+    Args:
+        name: Transform name
+        image: Input image
+        mask: Mask target or None
+        repeats: Timed calls (fewer if the time budget runs out)
+        warmup: Untimed calls before measuring
+        time_budget: Stop repeating after this many seconds (at least one sample)
+
+    Returns:
+        Case result with timing summary, or an "error" entry
+    """
+    size = image.shape[0]
+    try:
+        transform = getattr(A, name)(**transform_params(name, size))
+        targets = {"image": image} if mask is None else {"image": image, "mask": mask}
+
+        random.seed(0)
+        np.random.seed(0)
+        for _ in range(warmup):
+            transform(**targets)
+
+        samples = []
+        budget_start = time.perf_counter()
+        for _ in range(repeats):
+            start = time.perf_counter()
+            transform(**targets)
+            samples.append((time.perf_counter() - start) * 1000)
+            if time.perf_counter() - budget_start > time_budget:
+                break
+    except Exception as e:
+        return {"error": f"{type(e).__name__}: {e}"}
+
+    summary = summarize(samples)
+    megapixels = size * size / 1e6
+    summary["ms_per_megapixel"] = summary["p50_ms"] / megapixels
+    return summary
+
+
+def case_key(case: dict) -> tuple:
+    return case["transform"], case["size"], case["channels"], case["mask"]
+
+
+def compare(report: dict, baseline: dict, threshold: float) -> list[dict]:
+    """Cases whose median got slower than baseline by more than threshold
+
+    Args:
+        report: Current report
+        baseline: Baseline report
+        threshold: Allowed relative slowdown (0.2 = 20%)
+
+    Returns:
+        Regression entries
+    """
+    previous = {case_key(c): c for c in baseline.get("results", []) if "p50_ms" in c}
+    regressions = []
+    for case in report["results"]:
+        base = previous.get(case_key(case))
+        if base is None or "p50_ms" not in case or base["p50_ms"] <= 0:
+            continue
+        ratio = case["p50_ms"] / base["p50_ms"]
+        if ratio > 1 + threshold:
+            regressions.append({
+                "transform": case["transform"],
+                "size": case["size"],
+                "channels": case["channels"],
+                "mask": case["mask"],
+                "baseline_p50_ms": base["p50_ms"],
+                "p50_ms": case["p50_ms"],
+                "ratio": ratio
+            })
+    return regressions
+
+
+def environment() -> dict:
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "albumentations": A.__version__,
+        "opencv": cv2.__version__,
+        "opencv_threads": cv2.getNumThreads(),
+        "numpy": np.__version__
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark each registered transform")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES,
+                        help="Square image sizes in pixels (default: 1024 2048 4096 8192)")
+    parser.add_argument("--channels", nargs="+", choices=["gray", "rgb"], default=["gray", "rgb"])
+    parser.add_argument("--transforms", nargs="+", help="Only these transforms (default: all registered)")
+    parser.add_argument("--no-mask", action="store_true", help="Skip the cases with a mask target")
+    parser.add_argument("--repeats", type=int, default=5, help="Timed calls per case")
+    parser.add_argument("--warmup", type=int, default=1, help="Untimed calls per case")
+    parser.add_argument("--time-budget", type=float, default=10.0,
+                        help="Max seconds of timed calls per case")
+    parser.add_argument("--threads", type=int, help="cv2.setNumThreads value (default: OpenCV default)")
+    parser.add_argument("--output", default="transform_benchmark.json", help="Report path")
+    parser.add_argument("--baseline", help="Baseline report to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="Allowed relative slowdown vs baseline (default: 0.2)")
+    args = parser.parse_args()
+
+    # Per-call library warnings (e.g. grayscale input) would drown the table
+    warnings.filterwarnings("ignore")
+
+    if args.threads is not None:
+        cv2.setNumThreads(args.threads)
+
+    names = TransformRegistry.list_all()
+    if args.transforms:
+        unknown = sorted(set(args.transforms) - set(names))
+        if unknown:
+            parser.error(f"Unknown transforms: {', '.join(unknown)}")
+        names = [n for n in names if n in args.transforms]
+
+    mask_options = [False] if args.no_mask else [False, True]
+    results = []
+    for size in args.sizes:
+        mask = None if args.no_mask else synthetic_mask(size)
+        for channels in args.channels:
+            image = synthetic_image(size, channels)
+            for name in names:
+                for with_mask in mask_options:
+                    case = {
+                        "transform": name,
+                        "category": "geometric" if TransformRegistry.is_geometric(name) else "pixel",
+                        "size": size,
+                        "channels": channels,
+                        "mask": with_mask
+                    }
+                    case.update(benchmark_case(
+                        name, image, mask if with_mask else None,
+                        args.repeats, args.warmup, args.time_budget
+                    ))
+                    results.append(case)
+
+                    if "error" in case:
+                        status = f"ERROR {case['error']}"
+                    else:
+                        status = f"p50 {case['p50_ms']:9.2f} ms  {case['ms_per_megapixel']:8.3f} ms/MP"
+                    print(f"{name:<26} {size:>5}px {channels:<4} {'mask' if with_mask else '    '}  {status}")
+
+    report = {
+        "benchmark": "transforms",
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "environment": environment(),
+        "config": {
+            "sizes": args.sizes,
+            "channels": args.channels,
+            "repeats": args.repeats,
+            "warmup": args.warmup,
+            "time_budget": args.time_budget
+        },
+        "results": results
+    }
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold)
+        report["comparison"] = {
+            "baseline": args.baseline,
+            "threshold": args.threshold,
+            "regressions": regressions
+        }
+        if regressions:
+            exit_code = 1
+            print(f"\n{len(regressions)} regression(s) over {args.threshold:.0%}:")
+            for r in regressions:
+                print(f"  {r['transform']} {r['size']}px {r['channels']} mask={r['mask']}: "
+                      f"{r['baseline_p50_ms']:.2f} -> {r['p50_ms']:.2f} ms ({r['ratio']:.2f}x)")
+        else:
+            print(f"\nNo regressions over {args.threshold:.0%} against {args.baseline}")
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Report saved to {args.output}")
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
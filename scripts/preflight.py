@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""Validate an image/mask dataset from file headers before a batch run
+
+Reads only PNG IHDR / TIFF tags / JPEG markers and .npy headers, in
+parallel, and reports unreadable files, image/mask dimension mismatches,
+masks load_mask can't use and unpaired files. Exit status is 1 if any
+error was found (unpaired files are warnings), so it can gate a run.
+
+Usage:
+    python scripts/preflight.py /workspace/input/images --masks /workspace/input/masks
+    python scripts/preflight.py images --masks masks --index /workspace/dataset_index.sqlite --output preflight.json
+"""
+
+import argparse
+import json
+import sys
+from pathlib import Path
+
+# Add repo root to path
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src.components.dataset_index import DatasetIndex
+from src.components.preflight import run_preflight
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Header-only dataset validation")
+    parser.add_argument("image_dir", help="Directory containing images")
+    parser.add_argument("--masks", help="Directory containing masks")
+    parser.add_argument("--workers", type=int, default=8, help="Header reader threads (default: 8)")
+    parser.add_argument("--index", help="Dataset index database to read headers from (and refresh)")
+    parser.add_argument("--output", help="Save the full report as JSON")
+    parser.add_argument("--max-issues", type=int, default=50, help="Issues to print (default: 50)")
+    args = parser.parse_args()
+
+    dataset_index = DatasetIndex(args.index, workers=args.workers) if args.index else None
+    report = run_preflight(Path(args.image_dir), Path(args.masks) if args.masks else None,
+                           workers=args.workers, dataset_index=dataset_index)
+
+    print(f"{report['images']} images, {report['masks']} masks, {report['pairs']} pairs "
+          f"checked in {report['elapsed_seconds']:.2f}s")
+    for issue in report["issues"][:args.max_issues]:
+        name = Path(issue["image"] or issue["mask"]).name
+        print(f"  {issue['severity']:<7} {issue['type']:<22} {name}: {issue['message']}")
+    if len(report["issues"]) > args.max_issues:
+        print(f"  ... and {len(report['issues']) - args.max_issues} more")
+    print(f"{report['errors']} errors, {report['warnings']} warnings")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report saved to {args.output}")
+    return 0 if report["ok"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,287 @@
+"""Archive Reader - Use tar/zip archives as input directories without extracting
+
+A path that runs through an archive file addresses a directory or member
+inside it, e.g. /data/sem.tar/images or /data/sem.zip/masks/a.png. Input
+listing and reading go through the helpers here, which hand object storage
+URLs (s3://bucket/images) and ordinary paths to their storage backend (see
+storage.open_storage).
+
+Each archive's member index (name -> data offset and size) is built once
+per process and cached until the archive changes. Uncompressed tar members
+are read with positioned reads straight from the archive; zip members are
+decompressed from their own entry. Compressed tars (.tar.gz) have no random
+access and are not supported - repack them as .tar or .zip.
+"""
+
+import io
+import os
+import tarfile
+import threading
+import zipfile
+from pathlib import Path
+from typing import Optional
+
+import cv2
+import numpy as np
+
+from .storage import is_storage_url, open_storage
+
+
+ARCHIVE_SUFFIXES = (".tar", ".zip")
+
+
+class _MemberFile(io.RawIOBase):
+    """Seekable read-only view of one byte range of an open file"""
+
+    def __init__(self, fd: int, offset: int, size: int):
+        super().__init__()
+        self._fd = fd
+        self._offset = offset
+        self._size = size
+        self._position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        count = min(len(buffer), self._size - self._position)
+        if count <= 0:
+            return 0
+        # pread leaves the shared descriptor's position alone, so threads
+        # can read different members concurrently
+        data = os.pread(self._fd, count, self._offset + self._position)
+        buffer[:len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._position, io.SEEK_END: self._size}[whence]
+        self._position = max(0, base + offset)
+        return self._position
+
+    def tell(self) -> int:
+        return self._position
+
+
+class ArchiveIndex:
+    """Member index of one tar or zip archive"""
+
+    def __init__(self, path: Path):
+        """Read the archive's member list
+
+        Args:
+            path: Archive file (.tar or .zip)
+        """
+        self.path = Path(path)
+        stat = self.path.stat()
+        self.stamp = (stat.st_size, stat.st_mtime_ns)
+        self.kind = "zip" if self.path.suffix.lower() == ".zip" else "tar"
+        # Member name -> (data offset, size); offsets are only used for tar
+        self.members: dict[str, tuple[int, int]] = {}
+
+        if self.kind == "zip":
+            with zipfile.ZipFile(self.path) as archive:
+                for info in archive.infolist():
+                    if not info.is_dir():
+                        self.members[_normalize(info.filename)] = (0, info.file_size)
+        else:
+            try:
+                with tarfile.open(self.path, mode="r:") as archive:
+                    for info in archive:
+                        if info.isfile() and not info.issparse():
+                            self.members[_normalize(info.name)] = (info.offset_data, info.size)
+            except tarfile.ReadError as e:
+                raise ValueError(f"{self.path} is not an uncompressed tar archive ({e}); "
+                                 f"compressed tars can't be read without extracting") from e
+
+        self._fd: Optional[int] = None
+        self._zip: Optional[zipfile.ZipFile] = None
+        self._lock = threading.Lock()
+
+    def __getstate__(self) -> dict:
+        """Pickle support for pool workers (the index travels, handles don't)"""
+        state = self.__dict__.copy()
+        state["_fd"] = None
+        state["_zip"] = None
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def list_dir(self, directory: str) -> list[str]:
+        """Names of the files directly inside a directory of the archive
+
+        Args:
+            directory: Directory inside the archive ("" for the top level)
+        """
+        directory = _normalize(directory)
+        names = []
+        for member in self.members:
+            parent, _, name = member.rpartition("/")
+            if parent == directory:
+                names.append(name)
+        return names
+
+    def is_dir(self, directory: str) -> bool:
+        directory = _normalize(directory)
+        return directory == "" or any(m.startswith(directory + "/") for m in self.members)
+
+    def open(self, member: str) -> io.BufferedIOBase:
+        """Open one member for reading (seekable)"""
+        member = _normalize(member)
+        if member not in self.members:
+            raise FileNotFoundError(f"{member} not found in {self.path}")
+        with self._lock:
+            if self.kind == "zip":
+                if self._zip is None:
+                    self._zip = zipfile.ZipFile(self.path)
+                return self._zip.open(member)
+            if self._fd is None:
+                self._fd = os.open(self.path, os.O_RDONLY)
+        offset, size = self.members[member]
+        return io.BufferedReader(_MemberFile(self._fd, offset, size))
+
+    def read(self, member: str) -> bytes:
+        """Contents of one member"""
+        with self.open(member) as f:
+            return f.read()
+
+
+def _normalize(name: str) -> str:
+    """Member name without leading "./" or "/" and trailing "/" """
+    name = name.replace("\\", "/")
+    while name.startswith("./"):
+        name = name[2:]
+    return name.strip("/")
+
+
+# Archive path -> ArchiveIndex, shared by this process's threads
+_indexes: dict[str, ArchiveIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_archive_index(archive_path: Path) -> ArchiveIndex:
+    """Cached member index of an archive, rebuilt if the archive changed"""
+    key = os.path.abspath(archive_path)
+    stat = os.stat(key)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is not None and index.stamp == (stat.st_size, stat.st_mtime_ns):
+            return index
+    index = ArchiveIndex(Path(key))
+    with _indexes_lock:
+        _indexes[key] = index
+    return index
+
+
+def cached_archive_indexes() -> dict[str, ArchiveIndex]:
+    """Snapshot of this process's archive indexes (to hand to pool workers)"""
+    with _indexes_lock:
+        return dict(_indexes)
+
+
+def register_archive_indexes(indexes: dict[str, ArchiveIndex]) -> None:
+    """Adopt indexes built by another process, so they aren't rebuilt"""
+    with _indexes_lock:
+        _indexes.update(indexes)
+
+
+def split_archive_path(path: Path) -> Optional[tuple[Path, str]]:
+    """Split a path running through an archive into (archive, member)
+
+    Only path components with an archive suffix are checked on disk, so
+    ordinary paths cost no filesystem calls.
+
+    Returns:
+        (archive file, member or directory inside it), or None for a
+        plain filesystem path
+    """
+    if is_storage_url(path):
+        return None
+    path = Path(path)
+    for candidate in (path, *path.parents):
+        if candidate.suffix.lower() in ARCHIVE_SUFFIXES and candidate.is_file():
+            return candidate, "/".join(path.relative_to(candidate).parts)
+    return None
+
+
+def is_archive_path(path: Optional[Path]) -> bool:
+    """True if path is an archive or lies inside one"""
+    return path is not None and split_archive_path(path) is not None
+
+
+def is_virtual_path(path: Optional[Path]) -> bool:
+    """True if path is read through an archive or object storage, not the filesystem"""
+    return path is not None and (is_storage_url(path) or is_archive_path(path))
+
+
+def input_exists(path: Path) -> bool:
+    """Path.exists() that also understands archive members and storage URLs"""
+    split = split_archive_path(path)
+    if split is None:
+        storage, key = open_storage(path)
+        return storage.exists(key)
+    archive, member = split
+    index = get_archive_index(archive)
+    member = _normalize(member)
+    return member in index.members or index.is_dir(member)
+
+
+def list_input_files(directory: Path) -> list[Path]:
+    """Files directly inside a directory or an archive directory
+
+    Args:
+        directory: Filesystem directory, archive, directory inside one or
+            storage URL
+
+    Returns:
+        Paths of the files (archive members as archive/member paths)
+    """
+    split = split_archive_path(directory)
+    if split is None:
+        # One scandir, or one batched listing for object storage (1000 keys per request)
+        storage, prefix = open_storage(directory)
+        return [Path(directory) / name for name in storage.list_dir(prefix)]
+    archive, member_dir = split
+    return [Path(directory) / name for name in get_archive_index(archive).list_dir(member_dir)]
+
+
+def open_input(path: Path) -> io.BufferedIOBase:
+    """Open an input file, archive member or stored object for binary reading"""
+    split = split_archive_path(path)
+    if split is None:
+        storage, key = open_storage(path)
+        return storage.open(key)
+    archive, member = split
+    return get_archive_index(archive).open(member)
+
+
+def read_input_bytes(path: Path) -> bytes:
+    """Contents of an input file, archive member or stored object"""
+    split = split_archive_path(path)
+    if split is None:
+        storage, key = open_storage(path)
+        return storage.read(key)
+    archive, member = split
+    with get_archive_index(archive).open(member) as f:
+        return f.read()
+
+
+def imread_input(path: Path, flags: int = cv2.IMREAD_COLOR) -> Optional[np.ndarray]:
+    """cv2.imread that decodes archive members and stored objects from memory
+
+    Returns:
+        Decoded image, or None if it can't be read
+    """
+    if not is_virtual_path(path):
+        return cv2.imread(str(path), flags)
+    try:
+        data = read_input_bytes(path)
+    except (OSError, ValueError):
+        return None
+    return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), flags)
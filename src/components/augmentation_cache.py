@@ -0,0 +1,250 @@
+"""Augmentation Cache - Reuse variant outputs across runs
+
+Entries are content-addressed: the key covers the input image and mask
+bytes, the pipeline fingerprint, the variant's random stream and the output
+format, so a hit is guaranteed to be byte-identical to recomputing it.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+import albumentations as A
+import cv2
+
+
+def hash_file(path: Optional[Path]) -> str:
+    """SHA-256 of a file's contents ("" for no file)
+
+    Args:
+        path: File to hash (optional)
+
+    Returns:
+        Hex digest, or empty string if path is None
+    """
+    if path is None:
+        return ""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def link_or_copy(src: Path, dst: Path) -> None:
+    """Hardlink src to dst, falling back to a copy across filesystems
+
+    The link is created under a temp name and renamed into place so dst is
+    never partially written.
+
+    Args:
+        src: Existing file
+        dst: Destination path (replaced if it exists)
+    """
+    tmp_path = dst.with_name(f".{dst.name}.tmp")
+    tmp_path.unlink(missing_ok=True)
+    try:
+        os.link(src, tmp_path)
+    except OSError:
+        shutil.copyfile(src, tmp_path)
+    os.replace(tmp_path, dst)
+
+
+class AugmentationCache:
+    """Persistent, size-capped cache of encoded variant outputs
+
+    Layout under cache_dir:
+        index.sqlite          # key -> size, last_used (for LRU eviction)
+        objects/ab/<key>/     # image file, optional mask file, meta.json
+
+    Outputs are written into runs via hardlinks where possible. That is safe
+    because BatchProcessor always replaces output files (rename), never
+    modifies them in place.
+    """
+
+    def __init__(self, cache_dir: str, max_size_bytes: int = 10 * 1024 ** 3):
+        """Initialize cache
+
+        Args:
+            cache_dir: Cache root directory (created if missing)
+            max_size_bytes: Total size above which least recently used
+                entries are evicted
+        """
+        self.cache_dir = Path(cache_dir)
+        self.objects_dir = self.cache_dir / "objects"
+        self.objects_dir.mkdir(parents=True, exist_ok=True)
+        self.index_path = self.cache_dir / "index.sqlite"
+        self.max_size_bytes = max_size_bytes
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT PRIMARY KEY, size INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+
+    def __getstate__(self) -> dict:
+        """Pickle support for pool workers (each process opens its own connection)"""
+        state = self.__dict__.copy()
+        state["_conn"] = None
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _execute(self, sql: str, params: tuple = ()) -> list:
+        """Run one statement on the index and return all rows
+
+        The connection is opened lazily and shared by this process's threads;
+        WAL mode lets pool workers use the same index concurrently.
+        """
+        with self._lock:
+            if self._conn is None:
+                self._conn = sqlite3.connect(self.index_path, timeout=30,
+                                             isolation_level=None, check_same_thread=False)
+                self._conn.execute("PRAGMA journal_mode=WAL")
+            return self._conn.execute(sql, params).fetchall()
+
+    @staticmethod
+    def make_key(input_hash: str, pipeline_fingerprint: str, variant_seed: str, output_format: dict) -> str:
+        """Build the content address of one variant output
+
+        Args:
+            input_hash: Combined hash of the image and mask contents
+            pipeline_fingerprint: PipelineConfig.fingerprint()
+            variant_seed: Identifier of the variant's random stream
+            output_format: Anything else that changes the output bytes
+                (extensions, encoder settings)
+
+        Returns:
+            Hex cache key
+        """
+        payload = json.dumps({
+            "input": input_hash,
+            "pipeline": pipeline_fingerprint,
+            "seed": variant_seed,
+            "format": output_format,
+            # Different library versions may produce different pixels
+            "albumentations": A.__version__,
+            "opencv": cv2.__version__
+        }, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _entry_dir(self, key: str) -> Path:
+        return self.objects_dir / key[:2] / key
+
+    def lookup(self, key: str) -> Optional[dict]:
+        """Find an entry and mark it as recently used
+
+        Args:
+            key: Cache key
+
+        Returns:
+            Entry metadata with absolute "image"/"mask" paths, or None
+        """
+        entry_dir = self._entry_dir(key)
+        meta_path = entry_dir / "meta.json"
+        if not meta_path.exists():
+            return None
+
+        with open(meta_path) as f:
+            meta = json.load(f)
+
+        self._execute("UPDATE entries SET last_used = ? WHERE key = ?", (time.time(), key))
+        return {
+            "image": entry_dir / meta["image"],
+            "mask": entry_dir / meta["mask"] if meta.get("mask") else None
+        }
+
+    def materialize(self, key: str, image_dst: Path, mask_dst: Optional[Path]) -> Optional[dict]:
+        """Place a cached output at the given paths
+
+        Args:
+            key: Cache key
+            image_dst: Destination for the image
+            mask_dst: Destination for the mask, if the run writes masks
+
+        Returns:
+            {"image": path, "mask": path or None} on a hit, None on a miss
+        """
+        entry = self.lookup(key)
+        if entry is None:
+            return None
+        try:
+            link_or_copy(entry["image"], image_dst)
+            written_mask = None
+            if mask_dst is not None and entry["mask"] is not None:
+                link_or_copy(entry["mask"], mask_dst)
+                written_mask = mask_dst
+        except FileNotFoundError:
+            # Evicted by another process between lookup and link
+            return None
+        return {"image": image_dst, "mask": written_mask}
+
+    def store(self, key: str, image_path: Path, mask_path: Optional[Path]) -> None:
+        """Add a freshly written output to the cache
+
+        Args:
+            key: Cache key
+            image_path: Written image file
+            mask_path: Written mask file (optional)
+        """
+        entry_dir = self._entry_dir(key)
+        if (entry_dir / "meta.json").exists():
+            return
+
+        # Assemble in a private directory, then rename into place
+        tmp_dir = entry_dir.with_name(f".{key}.{os.getpid()}.tmp")
+        tmp_dir.mkdir(parents=True, exist_ok=True)
+        meta = {"image": "image" + image_path.suffix, "mask": None}
+        link_or_copy(image_path, tmp_dir / meta["image"])
+        size = (tmp_dir / meta["image"]).stat().st_size
+        if mask_path is not None:
+            meta["mask"] = "mask" + mask_path.suffix
+            link_or_copy(mask_path, tmp_dir / meta["mask"])
+            size += (tmp_dir / meta["mask"]).stat().st_size
+        with open(tmp_dir / "meta.json", "w") as f:
+            json.dump(meta, f)
+
+        try:
+            os.rename(tmp_dir, entry_dir)
+        except OSError:
+            # Another worker stored the same key first
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            return
+
+        self._execute(
+            "INSERT OR REPLACE INTO entries (key, size, last_used) VALUES (?, ?, ?)",
+            (key, size, time.time())
+        )
+
+    def total_size(self) -> int:
+        """Total size of all entries in bytes"""
+        return self._execute("SELECT COALESCE(SUM(size), 0) FROM entries")[0][0]
+
+    def evict(self) -> int:
+        """Remove least recently used entries until the cache fits max_size_bytes
+
+        Returns:
+            Number of entries evicted
+        """
+        excess = self.total_size() - self.max_size_bytes
+        if excess <= 0:
+            return 0
+
+        evicted = 0
+        for key, size in self._execute("SELECT key, size FROM entries ORDER BY last_used"):
+            if excess <= 0:
+                break
+            shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+            self._execute("DELETE FROM entries WHERE key = ?", (key,))
+            excess -= size
+            evicted += 1
+        return evicted
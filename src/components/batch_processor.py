@@ -1,8 +1,19 @@
 """Batch Processor - Execute pipeline on directory of images"""
 
+import hashlib
 import json
 import logging
+import multiprocessing
+import multiprocessing.util
+import os
 import random
+import tempfile
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from contextlib import nullcontext
 from datetime import datetime
 from pathlib import Path
 from typing import Optional
@@ -10,8 +21,414 @@ import cv2
 import numpy as np
 from tqdm import tqdm
 
+from .archive_reader import (
+    cached_archive_indexes, imread_input, input_exists, is_virtual_path, read_input_bytes, register_archive_indexes
+)
+from .augmentation_cache import AugmentationCache, hash_file
+from .dataset_index import DatasetIndex
+from .output_store import (
+    ARRAYS_DIRNAME, OUTPUT_LAYOUTS, SHARDS_DIRNAME, ArrayStoreWriter, OutputEncoder, ShardWriter
+)
 from .pipeline_manager import PipelineConfig
-from .mask_handler import scan_image_mask_pairs, load_mask, validate_mask
+from .preflight import failed_images, run_preflight
+from .profiling import PipelineProfiler, StageTimings, TimingAggregator, measure
+from .remap_cache import DEFAULT_MAX_BYTES as REMAP_CACHE_MAX_BYTES, RemapGridCache
+from .storage import (
+    DEFAULT_MAX_CONNECTIONS, StorageUploader, configure_storage, get_storage, is_storage_url, split_storage_url,
+    storage_url
+)
+from .mask_handler import read_mask_rle_info, scan_image_mask_pairs, load_mask, validate_mask
+
+
+def derive_variant_seed(base_seed: int, image_key: str, variant_index: int) -> np.random.SeedSequence:
+    """Derive an independent random stream for one (image, variant) output
+
+    The stream depends only on the base seed, the image identity and the
+    variant index - never on processing order - so any image can be
+    processed on any worker, in any order, with identical results.
+
+    Args:
+        base_seed: Run-level random seed
+        image_key: Stable image identity (the image file name)
+        variant_index: Zero-based variant index
+
+    Returns:
+        SeedSequence for this (image, variant)
+    """
+    # hashlib rather than hash(): str hashes are salted per process
+    image_hash = int.from_bytes(hashlib.sha256(image_key.encode("utf-8")).digest()[:8], "little")
+    return np.random.SeedSequence(entropy=base_seed, spawn_key=(image_hash, variant_index))
+
+
+def seed_variant_rngs(base_seed: int, image_key: str, variant_index: int) -> None:
+    """Seed the global random/np.random state used by Albumentations
+
+    Albumentations draws from the global generators, so the derived stream
+    is used to (re)seed both of them before each variant.
+
+    Args:
+        base_seed: Run-level random seed
+        image_key: Stable image identity (the image file name)
+        variant_index: Zero-based variant index
+    """
+    state = derive_variant_seed(base_seed, image_key, variant_index).generate_state(4)
+    np.random.seed(state)
+    random.seed(int.from_bytes(state.tobytes(), "little"))
+
+
+JOURNAL_FILENAME = "journal.jsonl"
+RESULTS_FILENAME = "results.jsonl"
+MANIFEST_FILENAME = "manifest.json"
+
+# Output settings a resumed run must share with the original one, with the
+# values journals written before the setting existed imply
+RESUME_OUTPUT_SETTINGS = {
+    "output_layout": "files",
+    "image_encoder": "source",
+    "mask_encoder": "png",
+    "fuse_geometric": False,
+    "optimize": False
+}
+
+
+def write_atomic(path: Path, data: bytes) -> None:
+    """Write bytes through a temp file + rename
+
+    Readers (and resumed runs) never see a half-written file: the final name
+    only appears once the data is complete.
+
+    Args:
+        path: Destination path
+        data: File contents
+    """
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def read_journal(run_dir: Path) -> tuple[Optional[dict], dict[str, dict[str, dict]]]:
+    """Read a run's completion journal
+
+    Args:
+        run_dir: Run directory
+
+    Returns:
+        (header, completed) where completed maps image name -> variant name ->
+        output entry. header is None if the run has no journal.
+    """
+    journal_path = Path(run_dir) / JOURNAL_FILENAME
+    header = None
+    completed: dict[str, dict[str, dict]] = {}
+    if not journal_path.exists():
+        return header, completed
+
+    with open(journal_path) as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # A crash can leave the last line truncated
+                continue
+            if entry.get("type") == "run":
+                header = entry
+            elif entry.get("type") == "output":
+                completed.setdefault(entry["image"], {})[entry["output"]["variant"]] = entry["output"]
+
+    return header, completed
+
+
+def _read_jsonl(path: Path) -> list[dict]:
+    """Read a JSONL file, skipping a line torn by a crash or a live writer"""
+    records = []
+    if not path.exists():
+        return records
+    with open(path) as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    return records
+
+
+def load_run_results(run_dir: Path) -> list[dict]:
+    """Load the per-image results of a run, finished or still in progress
+
+    Args:
+        run_dir: Run directory
+
+    Returns:
+        Result dictionaries in input order (latest record per image)
+    """
+    run_dir = Path(run_dir)
+    results_path = run_dir / RESULTS_FILENAME
+    if not results_path.exists():
+        # Runs written before results were streamed keep them in the manifest
+        manifest_path = run_dir / MANIFEST_FILENAME
+        if manifest_path.exists():
+            with open(manifest_path) as f:
+                return json.load(f).get("results", [])
+        return []
+
+    # A resumed image can appear more than once; its last record wins
+    by_image = {r["input_image"]: r for r in _read_jsonl(results_path)}
+    return [by_image[k] for k in sorted(by_image)]
+
+
+def load_run_manifest(run_dir: Path) -> Optional[dict]:
+    """Load a run's manifest together with its results
+
+    Works for finished runs (manifest footer + results.jsonl), runs that
+    are still in progress or were interrupted (no footer yet: summary is
+    derived from the journal and the results so far), and older runs whose
+    manifest.json embeds the results.
+
+    Args:
+        run_dir: Run directory
+
+    Returns:
+        Manifest dict with a "results" list and an "in_progress" flag, or
+        None if the directory does not look like a run
+    """
+    run_dir = Path(run_dir)
+    manifest_path = run_dir / MANIFEST_FILENAME
+    results = load_run_results(run_dir)
+
+    if manifest_path.exists():
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        manifest["results"] = results
+        manifest["in_progress"] = False
+        return manifest
+
+    header, _ = read_journal(run_dir)
+    if header is None:
+        return None
+
+    config = header["configuration"]
+    pipeline_name = "Untitled"
+    pipeline_path = run_dir / "pipeline.json"
+    if pipeline_path.exists():
+        pipeline_name = PipelineConfig(str(pipeline_path)).metadata.get("name", "Untitled")
+
+    successful = sum(1 for r in results if r["status"] == "success")
+    started_at = header.get("started_at")
+    duration = (datetime.now() - datetime.fromisoformat(started_at)).total_seconds() if started_at else 0.0
+
+    return {
+        "run_id": header.get("run_id", run_dir.name),
+        "timestamp": datetime.now().isoformat(),
+        "pipeline": {"name": pipeline_name, "path": "pipeline.json"},
+        "configuration": dict(config, has_masks=any(r.get("input_mask") for r in results)),
+        "statistics": {
+            "total_images": len(results),
+            "successful": successful,
+            "failed": len(results) - successful,
+            "duration_seconds": duration
+        },
+        "results": results,
+        "in_progress": True
+    }
+
+
+class RunStatistics:
+    """Running totals of a run's result records for the manifest footer
+
+    Results are streamed to results.jsonl as images finish; only these
+    counters, the errors of failed images and (when profiling) the timing
+    values stay in memory.
+    """
+
+    def __init__(self):
+        self.total_images = 0
+        self.successful = 0
+        self.failed = 0
+        self.empty_masks = 0
+        self.new_outputs = 0
+        self.cache_hits = 0
+        self.timed_images = 0
+        self.timed_ms = 0.0
+        self.errors: list[dict] = []
+        self.timings = TimingAggregator()
+
+    def add(self, result: dict) -> None:
+        """Count one image's result record (new or resumed)"""
+        self.total_images += 1
+        for output in result.get("outputs", []):
+            if output.get("mask_info", {}).get("empty"):
+                self.empty_masks += 1
+            if output["status"] == "success" and not output.get("resumed"):
+                self.new_outputs += 1
+                self.cache_hits += bool(output.get("cached"))
+
+        if result["status"] == "error":
+            self.failed += 1
+            self.errors.append({
+                "image": result["input_image"],
+                "error": result.get("error") or "; ".join(result.get("variant_errors", [])),
+                "timestamp": result["timestamp"]
+            })
+        elif result["status"] == "success":
+            self.successful += 1
+            if not result.get("resumed"):
+                self.timed_images += 1
+                self.timed_ms += result.get("processing_time_ms", 0)
+                self.timings.add(result.get("timings"))
+
+    def summary(self) -> dict:
+        """Image counts of the run so far"""
+        return {
+            "total_images": self.total_images,
+            "successful": self.successful,
+            "failed": self.failed
+        }
+
+
+class ProgressReporter:
+    """Throttled, atomic progress channel for a run (progress.json)
+
+    The file is rewritten at most once per interval (plus forced first and
+    final updates) through a temp file + rename, so readers never see a torn
+    file and the hot path does not pay for a write per image. Besides
+    current/total it reports throughput, bytes written, a moving-average
+    ETA and the latest activity of each worker.
+    """
+
+    def __init__(self,
+                 progress_file: Path,
+                 total: int,
+                 completed: int = 0,
+                 interval: float = 1.0,
+                 smoothing: float = 0.3):
+        """Initialize reporter
+
+        Args:
+            progress_file: File to write
+            total: Total number of images in the run
+            completed: Images already complete before this session (resume)
+            interval: Minimum seconds between writes
+            smoothing: Weight of the newest window in the ETA moving average
+        """
+        self.progress_file = progress_file
+        self.total = total
+        self.completed = completed
+        self.interval = interval
+        self.smoothing = smoothing
+        self.variants = 0
+        self.bytes_written = 0
+        self.workers: dict[str, dict] = {}
+        self._session_start_completed = completed
+        self._start = time.monotonic()
+        self._last_write: Optional[float] = None
+        self._last_completed = completed
+        self._rate: Optional[float] = None
+
+    def record(self, result: dict) -> None:
+        """Account for one finished image (writes only if the interval elapsed)
+
+        Args:
+            result: Result dictionary of the image
+        """
+        new_outputs = [o for o in result.get("outputs", [])
+                       if o["status"] == "success" and not o.get("resumed")]
+        self.completed += 1
+        self.variants += len(new_outputs)
+        self.bytes_written += sum(o.get("bytes", 0) for o in new_outputs)
+
+        worker = self.workers.setdefault(str(result.get("worker", "main")), {"completed": 0})
+        worker["completed"] += 1
+        worker["last_image"] = Path(result["input_image"]).name
+        worker["last_status"] = result["status"]
+        worker["updated_at"] = datetime.now().isoformat()
+
+        self.write()
+
+    def write(self, status: str = "running", force: bool = False) -> None:
+        """Write the progress file if due
+
+        Args:
+            status: "running", "complete", "cancelled" or "failed"
+            force: Write even if the interval has not elapsed
+        """
+        now = time.monotonic()
+        if not force and self._last_write is not None and now - self._last_write < self.interval:
+            return
+
+        # Exponential moving average of images/sec over write windows
+        if self._last_write is not None and now > self._last_write:
+            window_rate = (self.completed - self._last_completed) / (now - self._last_write)
+            if self._rate is None:
+                self._rate = window_rate
+            else:
+                self._rate = self.smoothing * window_rate + (1 - self.smoothing) * self._rate
+        self._last_write = now
+        self._last_completed = self.completed
+
+        elapsed = now - self._start
+        session_images = self.completed - self._session_start_completed
+        remaining = self.total - self.completed
+        progress_data = {
+            "current": self.completed,
+            "total": self.total,
+            "status": status,
+            "elapsed_seconds": elapsed,
+            "images_per_sec": session_images / elapsed if elapsed > 0 else 0.0,
+            "variants_per_sec": self.variants / elapsed if elapsed > 0 else 0.0,
+            "bytes_written": self.bytes_written,
+            "eta_seconds": remaining / self._rate if self._rate and status == "running" else None,
+            "workers": self.workers,
+            "timestamp": datetime.now().isoformat()
+        }
+        write_atomic(self.progress_file, json.dumps(progress_data).encode("utf-8"))
+
+
+# Per-process state for pool workers, populated once by _init_worker
+_worker_state: dict = {}
+
+
+def _init_worker(processor: "BatchProcessor") -> None:
+    """Initialize a pool worker: build the pipelines once per process
+
+    Args:
+        processor: Pickled copy of the parent BatchProcessor
+    """
+    # One OpenCV thread per worker - the pool already provides the parallelism
+    cv2.setNumThreads(1)
+
+    # Spawned workers start with an unconfigured logger
+    if not processor.logger.handlers:
+        processor.logger = processor._setup_logging()
+
+    # Archive member indexes come from the parent instead of being rebuilt
+    register_archive_indexes(processor._archive_indexes)
+    configure_storage(**processor.storage_options)
+
+    # Each worker appends to shards of its own, finished when the worker exits
+    processor._open_output()
+    multiprocessing.util.Finalize(None, processor._close_output, exitpriority=10)
+
+    _worker_state["processor"] = processor
+    _worker_state["pipelines"] = processor._build_pipelines()
+
+
+def _process_pair_in_worker(img_path: Path,
+                            mask_path: Optional[Path],
+                            variant_dirs: list[Path],
+                            has_masks: bool) -> dict:
+    """Process one image-mask pair inside a pool worker"""
+    processor = _worker_state["processor"]
+    geometric_pipeline, pixel_pipeline = _worker_state["pipelines"]
+    result = processor._process_pair_safe(
+        img_path,
+        mask_path,
+        variant_dirs,
+        geometric_pipeline,
+        pixel_pipeline,
+        has_masks
+    )
+    result["worker"] = os.getpid()
+    return result
 
 
 class BatchProcessor:
@@ -23,28 +440,172 @@ class BatchProcessor:
                  output_dir: str,
                  pipeline_config: PipelineConfig,
                  num_variants: int = 3,
-                 random_seed: Optional[int] = None):
+                 random_seed: Optional[int] = None,
+                 num_workers: int = 1,
+                 io_threads: int = 0,
+                 queue_depth: int = 8,
+                 resume_run_dir: Optional[str] = None,
+                 cache_dir: Optional[str] = None,
+                 cache_max_bytes: int = 10 * 1024 ** 3,
+                 progress_interval: float = 1.0,
+                 profile: bool = False,
+                 output_layout: str = "files",
+                 shard_max_bytes: int = 1024 ** 3,
+                 image_encoder: str = "source",
+                 mask_encoder: str = "png",
+                 dataset_index: Optional[str] = None,
+                 preflight: Optional[str] = None,
+                 staging_dir: Optional[str] = None,
+                 storage_options: Optional[dict] = None,
+                 fuse_geometric: bool = False,
+                 fuse_pixel: bool = True,
+                 share_prefix: bool = True,
+                 optimize: bool = False,
+                 remap_cache_bytes: int = REMAP_CACHE_MAX_BYTES):
         """Initialize batch processor
 
         Args:
-            input_image_dir: Path to directory with images
+            input_image_dir: Path to directory with images (or a tar/zip
+                archive path or object storage URL, see archive_reader)
             input_mask_dir: Path to directory with masks (optional)
-            output_dir: Path to output directory
+            output_dir: Path to output directory, or an object storage URL
+                (s3://bucket/prefix) the run is mirrored to
             pipeline_config: Pipeline configuration
             num_variants: Number of variants per image
             random_seed: Base random seed (optional)
+            num_workers: Number of worker processes (1 = serial, in-process)
+            io_threads: Reader/writer threads for the staged in-process
+                pipeline (0 = read, transform and write strictly in sequence)
+            queue_depth: Max decoded pairs prefetched and max variants queued
+                for writing in the staged pipeline (bounds memory use)
+            resume_run_dir: Existing run directory to resume instead of
+                starting a new timestamped run (see BatchProcessor.resume)
+            cache_dir: Augmentation cache directory (optional). Only used
+                with a fixed random_seed, since outputs must be reproducible
+            cache_max_bytes: Cache size above which LRU entries are evicted
+            progress_interval: Minimum seconds between progress.json updates
+            profile: Record per-stage and per-transform timings and add
+                p50/p95/p99 summaries to the manifest
+            output_layout: "files" (one file per image/mask), "shards"
+                (size-capped tar shards with offset indexes) or "arrays"
+                (unencoded, memory-mappable arrays), see output_store
+            shard_max_bytes: Size cap of one shard or array file
+            image_encoder: Encoder spec for images (see OutputEncoder):
+                "source", "png", "png:<level>", "webp", "jpeg:<quality>", "npy"
+            mask_encoder: Encoder spec for masks (lossless only: "png",
+                "png:<level>", "webp", "npy", "rle"). With "rle", output
+                entries get a "mask_info" with the empty flag and bounding box
+            dataset_index: Dataset index database (optional). Inputs are
+                listed through it and cache keys reuse its content hashes
+            preflight: Check all image/mask headers before processing
+                (see preflight.run_preflight): "gate" aborts the run if any
+                error is found, "filter" skips the failing images, None
+                disables the check
+            staging_dir: Local directory runs are written to before being
+                uploaded, when output_dir is a URL (default: a directory
+                under the system temp dir)
+            storage_options: S3Storage options for URLs (endpoint_url,
+                max_connections, ...), see storage.configure_storage
+            fuse_geometric: Resample each run of consecutive geometric
+                transforms once instead of once per transform (see
+                geometric_fusion). Faster, but outputs differ slightly from
+                the transforms applied one by one, so it is off by default
+            fuse_pixel: Apply each run of consecutive point-wise pixel
+                transforms as a single lookup table per variant (see
+                pixel_fusion). Outputs are bit-identical. Profiled runs
+                apply them one by one, so their timings keep the
+                transforms' names
+            share_prefix: Apply the leading deterministic transforms (p=1,
+                fixed parameters) once per image instead of once per variant
+                (see prefix_sharing). Outputs are bit-identical
+            optimize: Run the optimized plan of the pipeline (no-ops dropped,
+                trailing downscale moved earlier, flip runs collapsed, see
+                pipeline_optimizer) instead of the transforms as listed.
+                The plan is saved in pipeline.json. Some rewrites are
+                approximate, so it is off by default
+            remap_cache_bytes: Memory cap of the per-process cache of
+                OpticalDistortion/GridDistortion remap grids, reused across
+                images of the same size with the same sampled parameters
+                (see remap_cache; 0 disables it)
         """
         self.input_image_dir = Path(input_image_dir)
         self.input_mask_dir = Path(input_mask_dir) if input_mask_dir else None
-        self.output_dir = Path(output_dir)
+        self.storage_options = dict(storage_options or {})
+        configure_storage(**self.storage_options)
+        if is_storage_url(output_dir):
+            # Runs are written locally, then mirrored to object storage
+            self.output_url = storage_url(output_dir)
+            self.output_dir = Path(staging_dir or Path(tempfile.gettempdir()) / "image_distortion_staging")
+        else:
+            self.output_url = None
+            self.output_dir = Path(output_dir)
+        self._uploader: Optional[StorageUploader] = None
         self.pipeline_config = pipeline_config
         self.num_variants = num_variants
         self.random_seed = random_seed
+        self.num_workers = max(1, int(num_workers))
+        self.io_threads = max(0, int(io_threads))
+        self.queue_depth = max(1, int(queue_depth))
+        self.progress_interval = progress_interval
+        self._progress: Optional[ProgressReporter] = None
+        self.profile = profile
+        self._profiler = PipelineProfiler() if profile else None
+        self.fuse_geometric = fuse_geometric
+        # Fused lookup tables have no per-transform timings; skipping the
+        # fusion doesn't change any output
+        self.fuse_pixel = fuse_pixel and not profile
+        self.share_prefix = share_prefix
+        self.optimize = optimize
+        self._shared_prefix = None
+        self._remap_cache = RemapGridCache(remap_cache_bytes) if remap_cache_bytes > 0 else None
+
+        if output_layout not in OUTPUT_LAYOUTS:
+            raise ValueError(f"Unknown output layout '{output_layout}', expected one of {OUTPUT_LAYOUTS}")
+        if cache_dir and random_seed is not None and output_layout != "files":
+            raise ValueError("The augmentation cache requires the 'files' output layout")
+        self.output_layout = output_layout
+        self.shard_max_bytes = shard_max_bytes
+
+        self.image_encoder = OutputEncoder(image_encoder)
+        self.mask_encoder = OutputEncoder(mask_encoder)
+        if self.mask_encoder.format == "source" or not self.mask_encoder.is_lossless:
+            raise ValueError(f"Mask encoder must be lossless (png, webp, npy or rle), got '{mask_encoder}'")
+        if self.image_encoder.format == "rle":
+            raise ValueError("The rle encoder is for masks only")
+        self._output_writer = None
+        self._expected_outputs = 0
+
+        self.dataset_index = DatasetIndex(dataset_index) if dataset_index else None
+
+        if preflight not in (None, "gate", "filter"):
+            raise ValueError(f"Unknown preflight mode '{preflight}', expected 'gate', 'filter' or None")
+        self.preflight = preflight
+        self._preflight_skipped = 0
+        self._archive_indexes = {}
+
+        # Augmentation cache (outputs are only reproducible with a fixed seed)
+        self.cache = None
+        if cache_dir and random_seed is not None:
+            self.cache = AugmentationCache(cache_dir, cache_max_bytes)
 
-        # Create timestamped run directory
-        self.run_id = datetime.now().strftime("run_%Y%m%d_%H%M%S")
-        self.run_dir = self.output_dir / self.run_id
-        self.run_dir.mkdir(parents=True, exist_ok=True)
+        # Create timestamped run directory (or reuse the one being resumed)
+        if resume_run_dir:
+            self.run_dir = Path(resume_run_dir)
+            self.run_id = self.run_dir.name
+            if not self.run_dir.is_dir():
+                raise ValueError(f"Run directory to resume does not exist: {self.run_dir}")
+        else:
+            self.run_id = datetime.now().strftime("run_%Y%m%d_%H%M%S")
+            self.run_dir = self.output_dir / self.run_id
+            self.run_dir.mkdir(parents=True, exist_ok=True)
+        self.resume = bool(resume_run_dir)
+
+        # Completion journal: (image, variant) outputs already on disk
+        self.journal_file = self.run_dir / JOURNAL_FILENAME
+        self._completed: dict[str, dict[str, dict]] = {}
+        self._resumed_count = 0
+        self._cache_evictions = 0
+        self._statistics = RunStatistics()
 
         # Progress tracking file
         self.progress_file = self.run_dir / "progress.json"
@@ -75,108 +636,686 @@ class BatchProcessor:
 
         return logger
 
-    def _update_progress(self, current: int, total: int):
-        """Update progress file for UI to read
+    def __getstate__(self) -> dict:
+        """Pickle support for pool workers (the journal stays with the parent)"""
+        state = self.__dict__.copy()
+        state.pop("_journal", None)
+        state.pop("_results_stream", None)
+        state.pop("_statistics", None)
+        state["_output_writer"] = None
+        state["_uploader"] = None
+        # Workers build their own pipelines (and prefix) in _init_worker
+        state["_shared_prefix"] = None
+        return state
+
+    @classmethod
+    def resume(cls, run_dir: str, **kwargs) -> "BatchProcessor":
+        """Create a processor that continues an interrupted run
+
+        Input directories, pipeline, variant count and seed are taken from the
+        run itself, so the remaining outputs match what the original run would
+        have produced.
 
         Args:
-            current: Current image number
-            total: Total number of images
+            run_dir: Existing run directory (the local staging directory
+                for runs mirrored to object storage)
+            **kwargs: Execution options (num_workers, io_threads, queue_depth,
+                storage_options)
+
+        Returns:
+            BatchProcessor writing into run_dir
         """
-        progress_data = {
-            "current": current,
-            "total": total,
-            "timestamp": datetime.now().isoformat()
+        run_dir = Path(run_dir)
+        header, _ = read_journal(run_dir)
+        if header is None:
+            raise ValueError(f"No journal found in {run_dir} - only runs with a journal can be resumed")
+
+        config = header["configuration"]
+        return cls(
+            input_image_dir=config["input_image_dir"],
+            input_mask_dir=config["input_mask_dir"],
+            output_dir=config.get("output_url") or str(run_dir.parent),
+            pipeline_config=PipelineConfig(str(run_dir / "pipeline.json")),
+            num_variants=config["num_variants"],
+            random_seed=config["random_seed"],
+            resume_run_dir=str(run_dir),
+            output_layout=config.get("output_layout", "files"),
+            image_encoder=config.get("image_encoder", "source"),
+            mask_encoder=config.get("mask_encoder", "png"),
+            fuse_geometric=config.get("fuse_geometric", False),
+            optimize=config.get("optimize", False),
+            staging_dir=str(run_dir.parent),
+            **kwargs
+        )
+
+    def _journal_configuration(self) -> dict:
+        """Settings that must match for a run to be resumed"""
+        return {
+            "input_image_dir": str(self.input_image_dir),
+            "input_mask_dir": str(self.input_mask_dir) if self.input_mask_dir else None,
+            "num_variants": self.num_variants,
+            "random_seed": self.random_seed,
+            "pipeline_fingerprint": self.pipeline_config.fingerprint(),
+            "output_layout": self.output_layout,
+            "image_encoder": self.image_encoder.spec,
+            "mask_encoder": self.mask_encoder.spec,
+            "output_url": self.output_url,
+            "fuse_geometric": self.fuse_geometric,
+            "optimize": self.optimize
         }
-        with open(self.progress_file, 'w') as f:
-            json.dump(progress_data, f)
 
-    def process(self) -> tuple[Path, list[dict]]:
+    def _open_journal(self) -> None:
+        """Load completed outputs when resuming, then open the journal and
+        results stream for appending"""
+        configuration = self._journal_configuration()
+
+        if self.resume:
+            header, self._completed = read_journal(self.run_dir)
+            if header is not None:
+                saved = header["configuration"]
+                mismatched = [k for k in ("num_variants", "random_seed", "pipeline_fingerprint")
+                              if saved.get(k) != configuration[k]]
+                # Different formats or pipelines would mix in one run directory
+                mismatched += [k for k, default in RESUME_OUTPUT_SETTINGS.items()
+                               if saved.get(k, default) != configuration[k]]
+                if mismatched:
+                    raise ValueError(
+                        f"Cannot resume {self.run_id}: {', '.join(mismatched)} differ from the original run"
+                    )
+            # A leftover stop flag would cancel the resumed run immediately
+            self.stop_flag_file.unlink(missing_ok=True)
+            # The run is in progress again until a new footer is written
+            (self.run_dir / MANIFEST_FILENAME).unlink(missing_ok=True)
+        else:
+            header = None
+
+        self._journal = self._open_append_log(self.journal_file)
+        self._results_stream = self._open_append_log(self.run_dir / RESULTS_FILENAME)
+        if header is None:
+            self._append_journal({
+                "type": "run",
+                "run_id": self.run_id,
+                "started_at": datetime.now().isoformat(),
+                "configuration": configuration
+            })
+
+    @staticmethod
+    def _open_append_log(path: Path):
+        """Open a JSONL log for appending, terminating a line torn by a crash"""
+        needs_newline = False
+        if path.exists() and path.stat().st_size > 0:
+            with open(path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                needs_newline = f.read(1) != b"\n"
+
+        stream = open(path, "a")
+        if needs_newline:
+            stream.write("\n")
+        return stream
+
+    def _close_logs(self) -> None:
+        """Close the journal and results streams"""
+        self._journal.close()
+        self._results_stream.close()
+
+    def _input_index(self) -> Optional[DatasetIndex]:
+        """The dataset index, unless the inputs live in archives or object storage (which it can't list)"""
+        if self.dataset_index and (is_virtual_path(self.input_image_dir) or is_virtual_path(self.input_mask_dir)):
+            return None
+        return self.dataset_index
+
+    def _run_preflight(self, pairs: list[tuple[Path, Optional[Path]]]) -> list[tuple[Path, Optional[Path]]]:
+        """Validate the dataset from headers and save the report as preflight.json
+
+        Args:
+            pairs: Scanned (image, mask) pairs
+
+        Returns:
+            The pairs to process (failing images removed in "filter" mode)
+
+        Raises:
+            ValueError: In "gate" mode, if the preflight found errors
+        """
+        report = run_preflight(self.input_image_dir, self.input_mask_dir, dataset_index=self._input_index())
+        write_atomic(self.run_dir / "preflight.json", json.dumps(report, indent=2).encode("utf-8"))
+        self.logger.info(f"Preflight: {report['errors']} errors, {report['warnings']} warnings "
+                         f"in {report['elapsed_seconds']:.2f}s {report['counts']}")
+
+        if report["ok"]:
+            return pairs
+        if self.preflight == "gate":
+            self._close_logs()
+            raise ValueError(f"Preflight found {report['errors']} errors {report['counts']} - "
+                             f"see {self.run_dir / 'preflight.json'}")
+
+        failed = failed_images(report)
+        kept = [(img_path, mask_path) for img_path, mask_path in pairs if str(img_path) not in failed]
+        self._preflight_skipped = len(pairs) - len(kept)
+        self.logger.warning(f"Preflight: skipping {self._preflight_skipped} images with errors")
+        return kept
+
+    def _new_uploader(self) -> StorageUploader:
+        """Uploader mirroring the run directory to its object storage URL"""
+        return StorageUploader(
+            f"{self.output_url}/{self.run_id}",
+            self.run_dir,
+            workers=self.storage_options.get("max_connections", DEFAULT_MAX_CONNECTIONS)
+        )
+
+    def _open_output(self) -> None:
+        """Start this process's shard or array writer (files need none) and,
+        for runs mirrored to object storage, its uploader
+
+        File names carry a per-writer tag, so pool workers and resumed
+        sessions never append to each other's files.
+        """
+        if self.output_url and self._uploader is None:
+            self._uploader = self._new_uploader()
+        if self._output_writer is not None:
+            return
+        tag = uuid.uuid4().hex[:8]
+        # Finished shards and array files are uploaded while the run goes on
+        on_finish = self._uploader.put_file if self._uploader else None
+        if self.output_layout == "shards":
+            self._output_writer = ShardWriter(
+                self.run_dir / SHARDS_DIRNAME,
+                prefix=f"shard-{tag}",
+                max_shard_bytes=self.shard_max_bytes,
+                on_finish=on_finish
+            )
+        elif self.output_layout == "arrays":
+            self._output_writer = ArrayStoreWriter(
+                self.run_dir / ARRAYS_DIRNAME,
+                prefix=f"store-{tag}",
+                max_file_bytes=self.shard_max_bytes,
+                capacity_hint=self._expected_outputs,
+                on_finish=on_finish
+            )
+
+    def _close_output(self) -> None:
+        """Finish this process's current shard or array files and wait for
+        its uploads"""
+        if self._output_writer is not None:
+            self._output_writer.close()
+            self._output_writer = None
+        if self._uploader is not None:
+            self._uploader.close()
+            for error in self._uploader.errors:
+                self.logger.warning(f"Upload failed (retried at the end of the run): {error}")
+            self._uploader = None
+
+    def _sync_output(self) -> None:
+        """Upload whatever the run has not mirrored yet, plus its metadata
+
+        A single listing of the destination finds files that are missing
+        (written by pool workers, or whose upload failed), so they are
+        retried here.
+
+        Raises:
+            OSError: If files still could not be uploaded
+        """
+        uploader = self._new_uploader()
+        try:
+            uploader.sync(always=(MANIFEST_FILENAME, RESULTS_FILENAME, JOURNAL_FILENAME,
+                                  "progress.json", "preflight.json", "pipeline.json"))
+        finally:
+            uploader.close()
+        self.logger.info(f"Synced {uploader.uploaded_files} files ({uploader.uploaded_bytes / 1024 ** 2:.1f} MB) "
+                         f"to {uploader.location}")
+        if uploader.errors:
+            for error in uploader.errors:
+                self.logger.error(f"Upload failed: {error}")
+            raise OSError(f"{len(uploader.errors)} files of {self.run_id} could not be uploaded to "
+                          f"{uploader.location} (the run is complete in {self.run_dir})")
+
+    def _append_journal(self, entry: dict) -> None:
+        """Append one entry to the journal (flushed so it survives a crash)"""
+        self._journal.write(json.dumps(entry) + "\n")
+        self._journal.flush()
+
+    def _completed_output(self, img_path: Path, variant_dir: Path) -> Optional[dict]:
+        """Journaled output for (image, variant) from a previous attempt, if any"""
+        return self._completed.get(img_path.name, {}).get(variant_dir.name)
+
+    def _complete_result(self, result: dict) -> None:
+        """Record a finished image: stream its result, count it for the
+        manifest, journal its new outputs and report progress
+
+        The result record is written before the journal entries, so every
+        output the journal marks as done has a result record.
+
+        Args:
+            result: Result dictionary for the image
+        """
+        self._results_stream.write(json.dumps(result) + "\n")
+        self._results_stream.flush()
+        self._statistics.add(result)
+
+        image_name = Path(result["input_image"]).name
+        for output in result.get("outputs", []):
+            if output["status"] == "success" and not output.get("resumed"):
+                self._append_journal({"type": "output", "image": image_name, "output": output})
+
+        self._progress.record(result)
+
+    def process(self) -> tuple[Path, dict]:
         """Process all images in input directory
 
+        Per-image results are streamed to results.jsonl rather than kept in
+        memory; load_run_results() reads them back.
+
         Returns:
-            (run_directory, results)
+            (run_directory, statistics): "total_images", "successful" and
+            "failed" counts, including images completed by a resumed attempt
         """
         start_time = datetime.now()
+        self._statistics = RunStatistics()
         self.logger.info(f"Starting batch processing: {self.run_id}")
 
         # Build pipelines
-        geometric_pipeline, pixel_pipeline = self.pipeline_config.build_albumentations_pipeline()
+        geometric_pipeline, pixel_pipeline = self._build_pipelines()
         self.logger.info(f"Built pipelines: geometric={geometric_pipeline is not None}, pixel={pixel_pipeline is not None}")
 
         # Save pipeline config
         pipeline_path = self.run_dir / "pipeline.json"
-        self.pipeline_config.save(str(pipeline_path))
-        self.logger.info(f"Saved pipeline config to {pipeline_path}")
+        if not self.resume:
+            self.pipeline_config.save(str(pipeline_path), optimize=self.optimize)
+            self.logger.info(f"Saved pipeline config to {pipeline_path}")
+
+        self._open_journal()
 
         # Scan images and pair with masks
-        pairs = scan_image_mask_pairs(self.input_image_dir, self.input_mask_dir)
+        if self._input_index():
+            pairs = self.dataset_index.pairs(self.input_image_dir, self.input_mask_dir)
+        else:
+            pairs = scan_image_mask_pairs(self.input_image_dir, self.input_mask_dir)
+        # Inputs read from tar/zip archives: workers reuse the member indexes
+        self._archive_indexes = cached_archive_indexes()
         has_masks = any(mask_path is not None for _, mask_path in pairs)
         self.logger.info(f"Found {len(pairs)} images, has_masks={has_masks}")
 
+        if self.preflight:
+            pairs = self._run_preflight(pairs)
+
         if not pairs:
             self.logger.warning("No images found in input directory")
-            return self.run_dir, []
+            self._close_logs()
+            return self.run_dir, self._statistics.summary()
+
+        # Images whose variants are all journaled are not processed again;
+        # their result records are already in results.jsonl, so they are
+        # only counted
+        self._resumed_count = 0
+        if self._completed:
+            todo = []
+            for img_path, mask_path in pairs:
+                done = self._completed.get(img_path.name, {})
+                if len(done) >= self.num_variants:
+                    outputs = [dict(done[name], resumed=True) for name in sorted(done)]
+                    result = self._build_result(img_path, mask_path, outputs, 0.0)
+                    result["resumed"] = True
+                    self._statistics.add(result)
+                    self._resumed_count += 1
+                else:
+                    todo.append((img_path, mask_path))
+            self.logger.info(f"Resuming {self.run_id}: {self._resumed_count} images already complete, "
+                             f"{len(todo)} remaining")
+            all_pairs, pairs = pairs, todo
+            # Workers only need the partially completed images
+            self._completed = {p.name: self._completed[p.name] for p, _ in todo if p.name in self._completed}
+        else:
+            all_pairs = pairs
 
         # Initialize progress tracking
-        total = len(pairs)
-        self._update_progress(0, total)
+        self._progress = ProgressReporter(
+            self.progress_file,
+            total=len(all_pairs),
+            completed=self._resumed_count,
+            interval=self.progress_interval
+        )
+        self._progress.write(force=True)
+
+        # Upper bound on outputs per writer, used to size preallocated array files
+        self._expected_outputs = len(pairs) * self.num_variants
 
-        # Create variant directories
+        # Create variant directories (shards and arrays only use their names)
         variant_dirs = []
         for i in range(self.num_variants):
             variant_dir = self.run_dir / f"distortion_{i+1:03d}"
-            (variant_dir / "images").mkdir(parents=True, exist_ok=True)
-            if has_masks:
-                (variant_dir / "masks").mkdir(parents=True, exist_ok=True)
+            if self.output_layout == "files":
+                (variant_dir / "images").mkdir(parents=True, exist_ok=True)
+                if has_masks:
+                    (variant_dir / "masks").mkdir(parents=True, exist_ok=True)
             variant_dirs.append(variant_dir)
 
         # Process each image
-        results = []
+        self.logger.info(f"Processing with num_workers={self.num_workers}, io_threads={self.io_threads}")
+        try:
+            if self.num_workers > 1:
+                self._process_parallel(pairs, variant_dirs, has_masks)
+            elif self.io_threads > 0:
+                self._open_output()
+                self._process_staged(
+                    pairs, variant_dirs, geometric_pipeline, pixel_pipeline, has_masks
+                )
+            else:
+                self._open_output()
+                self._process_serial(
+                    pairs, variant_dirs, geometric_pipeline, pixel_pipeline, has_masks
+                )
+        except Exception:
+            self._progress.write(status="failed", force=True)
+            raise
+        finally:
+            self._close_output()
+            self._close_logs()
+
+        self._cache_evictions = self.cache.evict() if self.cache else 0
+
+        # Calculate statistics
+        end_time = datetime.now()
+        duration = (end_time - start_time).total_seconds()
+        statistics = self._statistics.summary()
+
+        self.logger.info(f"Processing complete: {statistics['successful']} successful, "
+                         f"{statistics['failed']} failed, {duration:.1f}s")
+
+        # Save manifest
+        self._save_manifest(has_masks, duration)
+
+        # Final progress update, once the manifest is in place
+        self._progress.write(status="cancelled" if self.stop_flag_file.exists() else "complete", force=True)
+
+        if self.output_url:
+            self._sync_output()
+
+        return self.run_dir, statistics
+
+    def _process_serial(self,
+                        pairs: list[tuple[Path, Optional[Path]]],
+                        variant_dirs: list[Path],
+                        geometric_pipeline,
+                        pixel_pipeline,
+                        has_masks: bool) -> None:
+        """Process all pairs one after another in this process
+
+        Args:
+            pairs: List of (image_path, mask_path) tuples
+            variant_dirs: List of variant output directories
+            geometric_pipeline: Geometric transforms
+            pixel_pipeline: Pixel-level transforms
+            has_masks: Whether run has masks
+        """
+        total = len(pairs)
         for idx, (img_path, mask_path) in enumerate(tqdm(pairs, desc="Processing images"), 1):
             # Check for stop flag
             if self.stop_flag_file.exists():
                 self.logger.warning(f"Stop flag detected. Canceling processing at {idx}/{total}")
                 break
 
+            result = self._process_pair_safe(
+                img_path,
+                mask_path,
+                variant_dirs,
+                geometric_pipeline,
+                pixel_pipeline,
+                has_masks
+            )
+
+            # Journal outputs and update progress file (also on error)
+            self._complete_result(result)
+
+    def _process_parallel(self,
+                          pairs: list[tuple[Path, Optional[Path]]],
+                          variant_dirs: list[Path],
+                          has_masks: bool) -> None:
+        """Spread pairs across a process pool and record the results as they finish
+
+        Workers build their own pipelines once (see _init_worker). At most a
+        few tasks per worker are in flight so the stop flag stays responsive.
+
+        Args:
+            pairs: List of (image_path, mask_path) tuples
+            variant_dirs: List of variant output directories
+            has_masks: Whether run has masks
+        """
+        total = len(pairs)
+        max_in_flight = self.num_workers * 4
+        next_idx = 0
+        completed = 0
+        stopped = False
+
+        # spawn instead of fork: Streamlit and OpenCV both run threads in the parent
+        mp_context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=self.num_workers,
+                                 mp_context=mp_context,
+                                 initializer=_init_worker,
+                                 initargs=(self,)) as executor, \
+                tqdm(total=total, desc="Processing images") as pbar:
+            pending = set()
+            while True:
+                if not stopped and next_idx < total and self.stop_flag_file.exists():
+                    self.logger.warning(f"Stop flag detected. Canceling processing at {completed + 1}/{total}")
+                    stopped = True
+
+                while not stopped and next_idx < total and len(pending) < max_in_flight:
+                    img_path, mask_path = pairs[next_idx]
+                    future = executor.submit(
+                        _process_pair_in_worker, img_path, mask_path, variant_dirs, has_masks
+                    )
+                    pending.add(future)
+                    next_idx += 1
+
+                if not pending:
+                    break
+
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    pending.remove(future)
+                    result = future.result()
+                    completed += 1
+                    pbar.update(1)
+                    self._complete_result(result)
+
+    def _process_staged(self,
+                        pairs: list[tuple[Path, Optional[Path]]],
+                        variant_dirs: list[Path],
+                        geometric_pipeline,
+                        pixel_pipeline,
+                        has_masks: bool) -> None:
+        """Process pairs with overlapped decode, transform and encode stages
+
+        Reader threads decode up to queue_depth pairs ahead of the transform
+        stage (this thread), and writer threads encode and write variants in
+        the background with at most queue_depth variants waiting. Both bounds
+        apply backpressure, so memory stays at roughly 2 * queue_depth decoded
+        images however large the dataset is.
+
+        Args:
+            pairs: List of (image_path, mask_path) tuples
+            variant_dirs: List of variant output directories
+            geometric_pipeline: Geometric transforms
+            pixel_pipeline: Pixel-level transforms
+            has_masks: Whether run has masks
+        """
+        total = len(pairs)
+        write_slots = threading.BoundedSemaphore(self.queue_depth)
+        pair_iter = iter(pairs)
+        prefetch = deque()
+        in_flight = deque()  # images whose variants are still being written
+
+        def write_variant_task(img_path, variant_dir, aug_image, aug_mask, cache_key, timings):
+            start = time.perf_counter()
             try:
-                result = self._process_single_pair(
-                    img_path,
-                    mask_path,
-                    variant_dirs,
-                    geometric_pipeline,
-                    pixel_pipeline,
-                    has_masks
-                )
-                results.append(result)
+                return self._write_variant(img_path, variant_dir, aug_image, aug_mask, has_masks, cache_key, timings), \
+                    (time.perf_counter() - start) * 1000
+            finally:
+                write_slots.release()
 
-                # Update progress file
-                self._update_progress(idx, total)
+        def finish_written(block: bool) -> None:
+            # Results are emitted in input order once all their writes are done
+            while in_flight and (block or all(f.done() for _, f in in_flight[0]["writes"])):
+                entry = in_flight.popleft()
+                elapsed_ms = entry["elapsed_ms"]
+                for i, future in entry["writes"]:
+                    try:
+                        output, write_ms = future.result()
+                        entry["outputs"][i] = output
+                        elapsed_ms += write_ms
+                    except Exception as e:
+                        entry["outputs"][i] = self._variant_error(entry["img_path"], i, variant_dirs[i], e)
+                self._complete_result(self._build_result(
+                    entry["img_path"], entry["mask_path"], entry["outputs"], elapsed_ms, entry["timings"]
+                ))
 
-            except Exception as e:
-                self.logger.error(f"Failed to process {img_path}: {e}", exc_info=True)
-                results.append({
-                    "input_image": str(img_path),
-                    "input_mask": str(mask_path) if mask_path else None,
-                    "status": "error",
-                    "error": str(e),
-                    "timestamp": datetime.now().isoformat()
-                })
-
-                # Update progress file even on error
-                self._update_progress(idx, total)
+        with ThreadPoolExecutor(self.io_threads, thread_name_prefix="reader") as readers, \
+                ThreadPoolExecutor(self.io_threads, thread_name_prefix="writer") as writers:
 
-        # Calculate statistics
-        end_time = datetime.now()
-        duration = (end_time - start_time).total_seconds()
-        successful = sum(1 for r in results if r["status"] == "success")
-        failed = sum(1 for r in results if r["status"] == "error")
+            def refill() -> None:
+                while len(prefetch) < self.queue_depth:
+                    pair = next(pair_iter, None)
+                    if pair is None:
+                        return
+                    prefetch.append((pair, readers.submit(
+                        self._prepare_pair_timed, *pair, variant_dirs, has_masks
+                    )))
 
-        self.logger.info(f"Processing complete: {successful} successful, {failed} failed, {duration:.1f}s")
+            refill()
+            for idx in tqdm(range(1, total + 1), desc="Processing images"):
+                if self.stop_flag_file.exists():
+                    self.logger.warning(f"Stop flag detected. Canceling processing at {idx}/{total}")
+                    for _, future in prefetch:
+                        future.cancel()
+                    break
 
-        # Save manifest
-        self._save_manifest(results, has_masks, duration)
+                (img_path, mask_path), load_future = prefetch.popleft()
+                refill()
+
+                try:
+                    prepared, load_ms = load_future.result()
+                    start = time.perf_counter()
+                    self._apply_shared_prefix(prepared)
+                    load_ms += (time.perf_counter() - start) * 1000
+                except Exception as e:
+                    finish_written(block=True)
+                    self._complete_result(self._error_result(img_path, mask_path, e))
+                    continue
+
+                entry = {
+                    "img_path": img_path,
+                    "mask_path": mask_path,
+                    "outputs": prepared["outputs"],
+                    "writes": [],
+                    "elapsed_ms": load_ms,
+                    "timings": prepared["timings"]
+                }
+                for i, variant_dir in enumerate(variant_dirs):
+                    if entry["outputs"][i] is not None:
+                        continue
 
-        return self.run_dir, results
+                    start = time.perf_counter()
+                    try:
+                        aug_image, aug_mask = self._augment_variant(
+                            prepared["image"], prepared["mask"], img_path, i,
+                            geometric_pipeline, pixel_pipeline, prepared["timings"]
+                        )
+                    except Exception as e:
+                        entry["outputs"][i] = self._variant_error(img_path, i, variant_dir, e)
+                        continue
+                    finally:
+                        entry["elapsed_ms"] += (time.perf_counter() - start) * 1000
+
+                    # Blocks while queue_depth variants are already waiting to be written
+                    write_slots.acquire()
+                    entry["writes"].append((i, writers.submit(
+                        write_variant_task, img_path, variant_dir, aug_image, aug_mask,
+                        prepared["cache_keys"][i], prepared["timings"]
+                    )))
+                in_flight.append(entry)
+                finish_written(block=False)
+
+            finish_written(block=True)
+
+    def _build_pipelines(self) -> tuple:
+        """Build the geometric and pixel pipelines, instrumented when profiling
+
+        With share_prefix, their deterministic prefix is kept in
+        self._shared_prefix and the returned pipelines only hold the rest.
+
+        Returns:
+            (geometric_pipeline, pixel_pipeline), either may be None
+        """
+        options = {
+            "fuse_geometric": self.fuse_geometric,
+            "fuse_pixel": self.fuse_pixel,
+            "remap_cache": self._remap_cache,
+            "optimize": self.optimize
+        }
+        if self.share_prefix:
+            self._shared_prefix, geometric_pipeline, pixel_pipeline = \
+                self.pipeline_config.build_shared_prefix_pipeline(**options)
+        else:
+            geometric_pipeline, pixel_pipeline = self.pipeline_config.build_albumentations_pipeline(**options)
+        if self._profiler is not None:
+            geometric_pipeline = self._profiler.instrument(geometric_pipeline)
+            pixel_pipeline = self._profiler.instrument(pixel_pipeline)
+            if self._shared_prefix is not None:
+                self._shared_prefix.geometric = self._profiler.instrument(self._shared_prefix.geometric)
+                self._shared_prefix.pixel = self._profiler.instrument(self._shared_prefix.pixel)
+        return geometric_pipeline, pixel_pipeline
+
+    def _apply_shared_prefix(self, prepared: dict) -> None:
+        """Run the shared prefix once on a decoded pair, so that variants
+        start from its output
+
+        Runs on the transform thread, since the prefix draws from the global
+        random generators like the per-variant pipelines do.
+        """
+        if self._shared_prefix is None or prepared["image"] is None:
+            return
+        timings = prepared["timings"]
+        recording = self._profiler.recording(timings) if self._profiler else nullcontext()
+        with recording, measure(timings, "shared_prefix"):
+            prepared["image"], prepared["mask"] = self._shared_prefix.apply(prepared["image"], prepared["mask"])
+
+    def _new_timings(self) -> Optional[StageTimings]:
+        """Timing recorder for one image (None unless profiling)"""
+        return StageTimings() if self.profile else None
+
+    def _process_pair_safe(self,
+                           img_path: Path,
+                           mask_path: Optional[Path],
+                           variant_dirs: list[Path],
+                           geometric_pipeline,
+                           pixel_pipeline,
+                           has_masks: bool) -> dict:
+        """Process one pair, turning any failure into an error result
+
+        Returns:
+            Result dictionary
+        """
+        try:
+            return self._process_single_pair(
+                img_path,
+                mask_path,
+                variant_dirs,
+                geometric_pipeline,
+                pixel_pipeline,
+                has_masks
+            )
+        except Exception as e:
+            return self._error_result(img_path, mask_path, e)
+
+    def _error_result(self, img_path: Path, mask_path: Optional[Path], error: Exception) -> dict:
+        """Log a failed pair and build its error result"""
+        self.logger.error(f"Failed to process {img_path}: {error}", exc_info=error)
+        return {
+            "input_image": str(img_path),
+            "input_mask": str(mask_path) if mask_path else None,
+            "status": "error",
+            "error": str(error),
+            "timestamp": datetime.now().isoformat()
+        }
 
     def _process_single_pair(self,
                              img_path: Path,
@@ -198,18 +1337,173 @@ class BatchProcessor:
         Returns:
             Result dictionary
         """
-        proc_start = datetime.now()
+        proc_start = time.perf_counter()
+        timings = self._new_timings()
+
+        prepared = self._prepare_pair(img_path, mask_path, variant_dirs, has_masks, timings)
+        self._apply_shared_prefix(prepared)
+        outputs = prepared["outputs"]
+
+        # Process each remaining variant (handle per-variant failures gracefully)
+        for i, variant_dir in enumerate(variant_dirs):
+            if outputs[i] is not None:
+                continue
+            try:
+                aug_image, aug_mask = self._augment_variant(
+                    prepared["image"], prepared["mask"], img_path, i, geometric_pipeline, pixel_pipeline, timings
+                )
+                outputs[i] = self._write_variant(
+                    img_path, variant_dir, aug_image, aug_mask, has_masks, prepared["cache_keys"][i], timings
+                )
+            except Exception as e:
+                outputs[i] = self._variant_error(img_path, i, variant_dir, e)
+
+        processing_time_ms = (time.perf_counter() - proc_start) * 1000
+
+        return self._build_result(img_path, mask_path, outputs, processing_time_ms, timings)
+
+    def _prepare_pair(self,
+                      img_path: Path,
+                      mask_path: Optional[Path],
+                      variant_dirs: list[Path],
+                      has_masks: bool,
+                      timings: Optional[StageTimings] = None) -> dict:
+        """Resolve what an image still needs before it is transformed
+
+        Variants journaled by a previous attempt and cache hits are filled in
+        directly. The image is only decoded if some variant still has to be
+        computed.
+
+        Args:
+            img_path: Path to image
+            mask_path: Path to mask (optional)
+            variant_dirs: List of variant output directories
+            has_masks: Whether run has masks
+            timings: Timing recorder of this image (optional)
 
+        Returns:
+            Dict with "outputs" (None for variants still to compute),
+            "cache_keys" (one per variant, None without a cache), and the
+            decoded "image"/"mask" (None if nothing is left to compute)
+        """
+        outputs: list[Optional[dict]] = [None] * len(variant_dirs)
+        for i, variant_dir in enumerate(variant_dirs):
+            completed_output = self._completed_output(img_path, variant_dir)
+            if completed_output:
+                outputs[i] = dict(completed_output, resumed=True)
+
+        cache_keys: list[Optional[str]] = [None] * len(variant_dirs)
+        if self.cache is not None and any(o is None for o in outputs):
+            with measure(timings, "cache_lookup"):
+                cache_keys = self._cache_keys(img_path, mask_path, len(variant_dirs))
+                for i, variant_dir in enumerate(variant_dirs):
+                    if outputs[i] is not None:
+                        continue
+                    output_img_path, output_mask_path = self._output_paths(img_path, variant_dir)
+                    hit = self.cache.materialize(
+                        cache_keys[i], output_img_path, output_mask_path if has_masks and mask_path else None
+                    )
+                    if hit:
+                        if self._uploader:
+                            for path in (hit["image"], hit["mask"]):
+                                if path:
+                                    self._uploader.put_file(path)
+                        extra = {}
+                        if hit["mask"] and self.mask_encoder.format == "rle":
+                            extra["mask_info"] = read_mask_rle_info(hit["mask"].read_bytes())
+                        outputs[i] = self._output_entry(variant_dir, hit["image"], hit["mask"], cached=True, **extra)
+
+        image = mask = None
+        if any(o is None for o in outputs):
+            image, mask = self._load_pair(img_path, mask_path, timings)
+
+        return {"outputs": outputs, "cache_keys": cache_keys, "image": image, "mask": mask, "timings": timings}
+
+    def _prepare_pair_timed(self,
+                            img_path: Path,
+                            mask_path: Optional[Path],
+                            variant_dirs: list[Path],
+                            has_masks: bool) -> tuple[dict, float]:
+        """_prepare_pair for the reader stage, also returning its duration in ms"""
+        start = time.perf_counter()
+        prepared = self._prepare_pair(img_path, mask_path, variant_dirs, has_masks, self._new_timings())
+        return prepared, (time.perf_counter() - start) * 1000
+
+    def _content_hash(self, path: Optional[Path]) -> str:
+        """SHA-256 of an input, from the dataset index when it is up to date
+        (size and ETag for objects in object storage)"""
+        if path is not None and is_storage_url(path):
+            # Size and ETag change with the contents - no download needed
+            return "s3:" + get_storage(path).content_tag(split_storage_url(path)[1])
+        if path is not None and is_virtual_path(path):
+            return hashlib.sha256(read_input_bytes(path)).hexdigest()
+        if self.dataset_index:
+            digest = self.dataset_index.content_hash(path)
+            if digest is not None:
+                return digest
+        return hash_file(path)
+
+    def _cache_keys(self, img_path: Path, mask_path: Optional[Path], num_variants: int) -> list[str]:
+        """Cache key of every variant of an image
+
+        Args:
+            img_path: Path to image
+            mask_path: Path to mask (optional)
+            num_variants: Number of variants
+
+        Returns:
+            One cache key per variant
+        """
+        input_hash = self._content_hash(img_path) + ":" + self._content_hash(mask_path)
+        fingerprint = self.pipeline_config.fingerprint()
+        output_img_path, output_mask_path = self._output_paths(img_path, Path())
+        output_format = {
+            "image": output_img_path.suffix,
+            "mask": output_mask_path.suffix,
+            "image_encoder": self.image_encoder.spec,
+            "mask_encoder": self.mask_encoder.spec
+        }
+        if self.fuse_geometric:
+            output_format["geometric"] = "fused"
+        if self.optimize:
+            output_format["plan"] = "optimized"
+        return [
+            AugmentationCache.make_key(
+                input_hash,
+                fingerprint,
+                derive_variant_seed(self.random_seed, img_path.name, i).generate_state(4).tobytes().hex(),
+                output_format
+            )
+            for i in range(num_variants)
+        ]
+
+    def _load_pair(self,
+                   img_path: Path,
+                   mask_path: Optional[Path],
+                   timings: Optional[StageTimings] = None) -> tuple[np.ndarray, Optional[np.ndarray]]:
+        """Decode an image and its (validated) mask
+
+        Args:
+            img_path: Path to image
+            mask_path: Path to mask (optional)
+            timings: Timing recorder of this image (optional)
+
+        Returns:
+            (RGB image, mask or None)
+        """
         # Read image
-        image = cv2.imread(str(img_path))
-        if image is None:
-            raise ValueError(f"Failed to read image: {img_path}")
-        image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        with measure(timings, "decode_image"):
+            image = imread_input(img_path)
+            if image is None:
+                raise ValueError(f"Failed to read image: {img_path}")
+            image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
 
         # Read mask if exists
         mask = None
-        if mask_path and mask_path.exists():
-            mask = load_mask(mask_path)
+        if mask_path and input_exists(mask_path):
+            with measure(timings, "load_mask"):
+                value_max = self.dataset_index.value_max(mask_path) if self.dataset_index else None
+                mask = load_mask(mask_path, value_max)
             if mask is not None:
                 # Validate dimensions
                 is_valid, error_msg = validate_mask(image, mask)
@@ -217,23 +1511,42 @@ class BatchProcessor:
                     self.logger.warning(f"Mask validation failed for {img_path}: {error_msg}")
                     mask = None
 
-        # Process each variant (handle per-variant failures gracefully)
-        outputs = []
-        variant_errors = []
+        return image, mask
 
-        for i, variant_dir in enumerate(variant_dirs):
-            try:
-                # Set seed for reproducibility
-                if self.random_seed is not None:
-                    seed = self.random_seed + i
-                    np.random.seed(seed)
-                    random.seed(seed)
+    def _augment_variant(self,
+                         image: np.ndarray,
+                         mask: Optional[np.ndarray],
+                         img_path: Path,
+                         variant_index: int,
+                         geometric_pipeline,
+                         pixel_pipeline,
+                         timings: Optional[StageTimings] = None) -> tuple[np.ndarray, Optional[np.ndarray]]:
+        """Apply the pipelines for one variant
 
-                # Apply geometric transforms to both image and mask
-                aug_image = image.copy()
-                aug_mask = mask.copy() if mask is not None else None
+        Args:
+            image: Decoded RGB image
+            mask: Decoded mask (optional)
+            img_path: Path to image (its name identifies the random stream)
+            variant_index: Zero-based variant index
+            geometric_pipeline: Geometric transforms
+            pixel_pipeline: Pixel-level transforms
+            timings: Timing recorder of this image (optional)
 
-                if geometric_pipeline:
+        Returns:
+            (augmented_image, augmented_mask)
+        """
+        # Seed this (image, variant) independently of processing order
+        if self.random_seed is not None:
+            seed_variant_rngs(self.random_seed, img_path.name, variant_index)
+
+        # Apply geometric transforms to both image and mask
+        aug_image = image.copy()
+        aug_mask = mask.copy() if mask is not None else None
+
+        recording = self._profiler.recording(timings) if self._profiler else nullcontext()
+        with recording:
+            if geometric_pipeline:
+                with measure(timings, "geometric"):
                     if aug_mask is not None:
                         result = geometric_pipeline(image=aug_image, mask=aug_mask)
                         aug_image = result["image"]
@@ -241,43 +1554,168 @@ class BatchProcessor:
                     else:
                         aug_image = geometric_pipeline(image=aug_image)["image"]
 
-                # Apply pixel-level transforms to image only
-                if pixel_pipeline:
+            # Apply pixel-level transforms to image only
+            if pixel_pipeline:
+                with measure(timings, "pixel"):
                     aug_image = pixel_pipeline(image=aug_image)["image"]
 
-                # Save augmented image (apply transforms exactly as specified)
-                output_img_path = variant_dir / "images" / img_path.name
-                aug_image_bgr = cv2.cvtColor(aug_image, cv2.COLOR_RGB2BGR)
-                cv2.imwrite(str(output_img_path), aug_image_bgr)
+        return aug_image, aug_mask
+
+    def _write_variant(self,
+                       img_path: Path,
+                       variant_dir: Path,
+                       aug_image: np.ndarray,
+                       aug_mask: Optional[np.ndarray],
+                       has_masks: bool,
+                       cache_key: Optional[str] = None,
+                       timings: Optional[StageTimings] = None) -> dict:
+        """Encode and save one variant
 
-                # Save augmented mask
+        Args:
+            img_path: Path to source image (determines output names)
+            variant_dir: Variant output directory
+            aug_image: Augmented RGB image
+            aug_mask: Augmented mask (optional)
+            has_masks: Whether run has masks
+            cache_key: Store the written files in the cache under this key
+            timings: Timing recorder of this image (optional)
+
+        Returns:
+            Output entry for the manifest
+        """
+        output_img_path, output_mask_path = self._output_paths(img_path, variant_dir)
+
+        if self.output_layout == "arrays":
+            return self._store_arrays(img_path, variant_dir, aug_image, aug_mask if has_masks else None, timings)
+
+        # Save augmented image (apply transforms exactly as specified)
+        if not self.image_encoder.is_raw:
+            with measure(timings, "color_convert"):
+                aug_image = cv2.cvtColor(aug_image, cv2.COLOR_RGB2BGR)
+        with measure(timings, "encode"):
+            image_bytes = self.image_encoder.encode(aug_image, output_img_path.suffix)
+        with measure(timings, "write"):
+            refs = {"image_ref": self._store_output(output_img_path, image_bytes)}
+        bytes_written = len(image_bytes)
+
+        # Save augmented mask
+        if has_masks and aug_mask is not None:
+            with measure(timings, "encode_mask"):
+                mask_bytes = self.mask_encoder.encode(aug_mask, output_mask_path.suffix)
+            with measure(timings, "write"):
+                refs["mask_ref"] = self._store_output(output_mask_path, mask_bytes)
+            bytes_written += len(mask_bytes)
+            if self.mask_encoder.format == "rle":
+                # Empty flag and bounding box, so viewers can skip or crop
+                refs["mask_info"] = read_mask_rle_info(mask_bytes)
+        else:
+            output_mask_path = None
+
+        if cache_key is not None:
+            with measure(timings, "cache_store"):
+                self.cache.store(cache_key, output_img_path, output_mask_path)
+
+        # Shard references tell readers where the bytes are; files need none
+        refs = {k: v for k, v in refs.items() if v is not None}
+        return self._output_entry(variant_dir, output_img_path, output_mask_path, bytes=bytes_written, **refs)
+
+    def _store_output(self, output_path: Path, data: bytes) -> Optional[dict]:
+        """Write one encoded output in the run's layout
+
+        Args:
+            output_path: Output path in the files layout (also the shard member name)
+            data: Encoded contents
+
+        Returns:
+            Shard reference, or None for the files layout
+        """
+        if self.output_layout == "shards":
+            return self._output_writer.add(str(output_path.relative_to(self.run_dir)), data)
+        write_atomic(output_path, data)
+        if self._uploader:
+            self._uploader.put_bytes(output_path, data)
+        return None
+
+    def _store_arrays(self,
+                      img_path: Path,
+                      variant_dir: Path,
+                      aug_image: np.ndarray,
+                      aug_mask: Optional[np.ndarray],
+                      timings: Optional[StageTimings] = None) -> dict:
+        """Save one variant into the array store (no color conversion or encoding)
+
+        Args:
+            img_path: Path to source image
+            variant_dir: Variant output directory (its name identifies the variant)
+            aug_image: Augmented RGB image
+            aug_mask: Augmented mask (optional)
+            timings: Timing recorder of this image (optional)
+
+        Returns:
+            Output entry for the manifest
+        """
+        output_img_path, output_mask_path = self._output_paths(img_path, variant_dir)
+        with measure(timings, "write"):
+            refs = {"image_ref": self._output_writer.add("image", img_path.name, variant_dir.name, aug_image)}
+            bytes_written = aug_image.nbytes
+            if aug_mask is not None:
+                refs["mask_ref"] = self._output_writer.add("mask", img_path.name, variant_dir.name, aug_mask)
+                bytes_written += aug_mask.nbytes
+            else:
                 output_mask_path = None
-                if has_masks and aug_mask is not None:
-                    mask_filename = img_path.stem + '.png'
-                    output_mask_path = variant_dir / "masks" / mask_filename
-                    cv2.imwrite(str(output_mask_path), aug_mask)
-
-                outputs.append({
-                    "variant": variant_dir.name,
-                    "image": str(output_img_path.relative_to(self.run_dir)),
-                    "mask": str(output_mask_path.relative_to(self.run_dir)) if output_mask_path else None,
-                    "status": "success"
-                })
-            except Exception as e:
-                # Log variant failure but continue with other variants
-                self.logger.warning(f"Variant {i+1} ({variant_dir.name}) failed for {img_path.name}: {e}")
-                variant_errors.append(f"{variant_dir.name}: {str(e)}")
-                outputs.append({
-                    "variant": variant_dir.name,
-                    "image": None,
-                    "mask": None,
-                    "status": "error",
-                    "error": str(e)
-                })
-
-        proc_end = datetime.now()
-        processing_time_ms = (proc_end - proc_start).total_seconds() * 1000
+        return self._output_entry(variant_dir, output_img_path, output_mask_path, bytes=bytes_written, **refs)
 
+    def _output_paths(self, img_path: Path, variant_dir: Path) -> tuple[Path, Path]:
+        """Output image and mask paths of one variant (extensions follow the encoders)"""
+        return (
+            variant_dir / "images" / (img_path.stem + self.image_encoder.extension(img_path.suffix)),
+            variant_dir / "masks" / (img_path.stem + self.mask_encoder.extension(".png"))
+        )
+
+    def _output_entry(self,
+                      variant_dir: Path,
+                      output_img_path: Path,
+                      output_mask_path: Optional[Path],
+                      **extra) -> dict:
+        """Manifest entry of a successfully written variant"""
+        return {
+            "variant": variant_dir.name,
+            "image": str(output_img_path.relative_to(self.run_dir)),
+            "mask": str(output_mask_path.relative_to(self.run_dir)) if output_mask_path else None,
+            "status": "success",
+            **extra
+        }
+
+    def _variant_error(self, img_path: Path, variant_index: int, variant_dir: Path, error: Exception) -> dict:
+        """Log a variant failure and build its output entry"""
+        # Log variant failure but continue with other variants
+        self.logger.warning(f"Variant {variant_index+1} ({variant_dir.name}) failed for {img_path.name}: {error}")
+        return {
+            "variant": variant_dir.name,
+            "image": None,
+            "mask": None,
+            "status": "error",
+            "error": str(error)
+        }
+
+    def _build_result(self,
+                      img_path: Path,
+                      mask_path: Optional[Path],
+                      outputs: list[dict],
+                      processing_time_ms: float,
+                      timings: Optional[StageTimings] = None) -> dict:
+        """Assemble the per-image result from its variant outputs
+
+        Args:
+            img_path: Path to image
+            mask_path: Path to mask (optional)
+            outputs: Output entries, one per variant
+            processing_time_ms: Time spent on this image
+            timings: Timing recorder of this image (optional)
+
+        Returns:
+            Result dictionary
+        """
         # Mark as success if ANY variant succeeded
         successful_variants = sum(1 for o in outputs if o["status"] == "success")
         overall_status = "success" if successful_variants > 0 else "error"
@@ -288,27 +1726,31 @@ class BatchProcessor:
             "status": overall_status,
             "outputs": outputs,
             "successful_variants": successful_variants,
-            "total_variants": len(variant_dirs),
+            "total_variants": len(outputs),
             "processing_time_ms": processing_time_ms,
             "timestamp": datetime.now().isoformat()
         }
 
         # Add error info if some variants failed
+        variant_errors = [f"{o['variant']}: {o['error']}" for o in outputs if o["status"] == "error"]
         if variant_errors:
             result["variant_errors"] = variant_errors
 
+        if timings is not None:
+            result["timings"] = timings.to_dict()
+
         return result
 
-    def _save_manifest(self, results: list[dict], has_masks: bool, duration: float) -> None:
-        """Save processing manifest
+    def _save_manifest(self, has_masks: bool, duration: float) -> None:
+        """Save the manifest footer (summary only - results are in results.jsonl)
+
+        Statistics come from the results counted so far (self._statistics).
 
         Args:
-            results: List of processing results
             has_masks: Whether run included masks
             duration: Total processing time in seconds
         """
-        successful = [r for r in results if r["status"] == "success"]
-        failed = [r for r in results if r["status"] == "error"]
+        stats = self._statistics
 
         manifest = {
             "run_id": self.run_id,
@@ -320,31 +1762,56 @@ class BatchProcessor:
             "configuration": {
                 "num_variants": self.num_variants,
                 "random_seed": self.random_seed,
+                "seed_scheme": "per_image_variant",
+                "num_workers": self.num_workers,
+                "io_threads": self.io_threads,
+                "queue_depth": self.queue_depth,
+                "profile": self.profile,
+                "output_layout": self.output_layout,
+                "shard_max_bytes": self.shard_max_bytes if self.output_layout != "files" else None,
+                "image_encoder": self.image_encoder.spec if self.output_layout != "arrays" else None,
+                "mask_encoder": self.mask_encoder.spec if self.output_layout != "arrays" else None,
                 "has_masks": has_masks,
                 "input_image_dir": str(self.input_image_dir),
-                "input_mask_dir": str(self.input_mask_dir) if self.input_mask_dir else None
+                "input_mask_dir": str(self.input_mask_dir) if self.input_mask_dir else None,
+                "dataset_index": str(self.dataset_index.index_path) if self.dataset_index else None,
+                "preflight": self.preflight,
+                "output_url": self.output_url,
+                "fuse_geometric": self.fuse_geometric,
+                "fuse_pixel": self.fuse_pixel,
+                "optimize": self.optimize,
+                "shared_prefix": self._shared_prefix.transform_names if self._shared_prefix else []
             },
             "statistics": {
-                "total_images": len(results),
-                "successful": len(successful),
-                "failed": len(failed),
-                "total_outputs": len(successful) * self.num_variants,
+                "total_images": stats.total_images,
+                "successful": stats.successful,
+                "failed": stats.failed,
+                "total_outputs": stats.successful * self.num_variants,
                 "duration_seconds": duration,
-                "avg_time_per_image_ms": sum(r.get("processing_time_ms", 0) for r in successful) / len(successful) if successful else 0
+                "resumed_images": self._resumed_count,
+                "preflight_skipped": self._preflight_skipped,
+                "empty_masks": stats.empty_masks,
+                "avg_time_per_image_ms": stats.timed_ms / stats.timed_images if stats.timed_images else 0
             },
-            "results": results,
-            "errors": [
-                {
-                    "image": r["input_image"],
-                    "error": r["error"],
-                    "timestamp": r["timestamp"]
-                }
-                for r in failed
-            ]
+            "cache": {
+                "enabled": self.cache is not None,
+                "cache_dir": str(self.cache.cache_dir) if self.cache else None,
+                "hits": stats.cache_hits,
+                "misses": stats.new_outputs - stats.cache_hits if self.cache else 0,
+                "evictions": self._cache_evictions,
+                "size_bytes": self.cache.total_size() if self.cache else 0
+            },
+            # Pool workers keep caches of their own, only in-process runs report counters
+            "remap_cache": (self._remap_cache.stats() if self._remap_cache and self.num_workers == 1
+                            else {"max_bytes": self._remap_cache.max_bytes if self._remap_cache else 0}),
+            "results_file": RESULTS_FILENAME,
+            "errors": stats.errors
         }
 
-        manifest_path = self.run_dir / "manifest.json"
-        with open(manifest_path, 'w') as f:
-            json.dump(manifest, f, indent=2)
+        if self.profile:
+            manifest["profile"] = stats.timings.summary()
+
+        manifest_path = self.run_dir / MANIFEST_FILENAME
+        write_atomic(manifest_path, json.dumps(manifest, indent=2).encode("utf-8"))
 
         self.logger.info(f"Saved manifest to {manifest_path}")
@@ -0,0 +1,353 @@
+"""Dataset Index - Persistent metadata of the input images and masks
+
+One SQLite row per file: size, mtime, dimensions, channel count, bit depth
+and SHA-256 of the contents. refresh() lists a directory once and only
+re-reads entries whose size or mtime changed, so rescanning an unchanged
+dataset costs one stat per file - no decoding, no hashing.
+
+Dimensions come from headers only: PIL reads PNG IHDR / TIFF tags / JPEG
+markers without decoding pixels, and .npy / .rle headers are parsed
+directly.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+from PIL import Image
+
+from .archive_reader import open_input
+from .augmentation_cache import hash_file
+from .mask_handler import IMAGE_EXTENSIONS, MASK_EXTENSIONS, index_mask_paths, read_mask_rle_info
+
+
+DEFAULT_INDEX_PATH = "/workspace/dataset_index.sqlite"
+INDEXED_EXTENSIONS = frozenset(IMAGE_EXTENSIONS) | frozenset(MASK_EXTENSIONS)
+
+# Only headers are read, so PIL's decompression bomb check would just reject
+# large SEM scans that OpenCV decodes fine later
+Image.MAX_IMAGE_PIXELS = None
+
+# PIL mode -> bits per channel (everything else is 8-bit)
+_PIL_BIT_DEPTHS = {"1": 1, "I;16": 16, "I;16B": 16, "I;16L": 16, "I;16N": 16, "I": 32, "F": 32}
+
+_COLUMNS = ("path", "directory", "name", "size", "mtime_ns", "width", "height",
+            "channels", "bit_depth", "shape", "sha256", "error", "value_max")
+
+
+def read_file_header(path: Path) -> dict:
+    """Dimensions and pixel format of an image or .npy file, from its header
+
+    Args:
+        path: Image or .npy file (may be an archive member)
+
+    Returns:
+        {"width", "height", "channels", "bit_depth", "shape"}. For .npy
+        files "shape" is the stored array shape; the other fields follow
+        load_mask, which squeezes size-1 axes and merges (regions, H, W)
+        stacks, so "channels" is the number of regions. They are None if
+        the squeezed array is neither 2-D nor 3-D
+
+    Raises:
+        Exception: If the header can't be read (corrupt or unsupported file)
+    """
+    path = Path(path)
+    if path.suffix.lower() == ".npy":
+        with open_input(path) as f:
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, _, dtype = np.lib.format.read_array_header_1_0(f)
+            elif version == (2, 0):
+                shape, _, dtype = np.lib.format.read_array_header_2_0(f)
+            else:
+                raise ValueError(f"Unsupported .npy format version {version}")
+        if dtype.hasobject:
+            raise ValueError("Object arrays can't be loaded without pickle")
+        shape = [int(d) for d in shape]
+        squeezed = [d for d in shape if d != 1]
+        if len(squeezed) in (2, 3):
+            height, width = squeezed[-2:]
+            channels = squeezed[0] if len(squeezed) == 3 else 1
+        else:
+            height = width = channels = None
+        return {
+            "width": width,
+            "height": height,
+            "channels": channels,
+            "bit_depth": 1 if dtype == np.bool_ else dtype.itemsize * 8,
+            "shape": shape
+        }
+
+    if path.suffix == ".rle":
+        with open_input(path) as f:
+            info = read_mask_rle_info(f.read(64))
+        height, width = info["shape"]
+        return {
+            "width": width,
+            "height": height,
+            "channels": 1,
+            "bit_depth": np.dtype(info["dtype"]).itemsize * 8,
+            "shape": info["shape"]
+        }
+
+    with open_input(path) as f, Image.open(f) as img:
+        width, height = img.size
+        channels = len(img.getbands())
+        return {
+            "width": width,
+            "height": height,
+            "channels": channels,
+            "bit_depth": _PIL_BIT_DEPTHS.get(img.mode, 8),
+            "shape": [height, width] if channels == 1 else [height, width, channels]
+        }
+
+
+def _describe_file(path: str, size: int, mtime_ns: int) -> dict:
+    """Full index row of one file (header + content hash)"""
+    row = {
+        "path": path,
+        "directory": os.path.dirname(path),
+        "name": os.path.basename(path),
+        "size": size,
+        "mtime_ns": mtime_ns,
+        "width": None,
+        "height": None,
+        "channels": None,
+        "bit_depth": None,
+        "shape": None,
+        "sha256": None,
+        "error": None,
+        "value_max": None
+    }
+    try:
+        header = read_file_header(Path(path))
+        row.update(header)
+        row["shape"] = json.dumps(header["shape"])
+        if path.lower().endswith(".npy"):
+            # Lets load_mask skip its own pass over the data to pick a scaling
+            # (a truncated file whose header still parses fails here)
+            array = np.load(path, mmap_mode="r", allow_pickle=False)
+            if array.size and (array.dtype.kind in "biuf"):
+                row["value_max"] = float(array.max())
+    except Exception as e:
+        row["error"] = f"{type(e).__name__}: {e}"
+    try:
+        row["sha256"] = hash_file(Path(path))
+    except OSError as e:
+        row["error"] = row["error"] or f"{type(e).__name__}: {e}"
+    return row
+
+
+class DatasetIndex:
+    """Persistent index of input directories
+
+    Rows are keyed by absolute path; query methods return paths under the
+    directory as the caller spelled it, so results match a plain listing.
+    """
+
+    def __init__(self, index_path: str = DEFAULT_INDEX_PATH, workers: int = 8):
+        """Open (or create) an index
+
+        Args:
+            index_path: SQLite database file (parent created if missing)
+            workers: Threads reading headers and hashing changed files
+        """
+        self.index_path = Path(index_path)
+        self.index_path.parent.mkdir(parents=True, exist_ok=True)
+        self.workers = max(1, workers)
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            "path TEXT PRIMARY KEY, directory TEXT NOT NULL, name TEXT NOT NULL, "
+            "size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, "
+            "width INTEGER, height INTEGER, channels INTEGER, bit_depth INTEGER, "
+            "shape TEXT, sha256 TEXT, error TEXT, value_max REAL)"
+        )
+        self._execute("CREATE INDEX IF NOT EXISTS files_directory ON files (directory)")
+        # Indexes created before value_max existed get the column; their
+        # rows just have no value until the file changes
+        if "value_max" not in {row[1] for row in self._execute("PRAGMA table_info(files)")}:
+            self._execute("ALTER TABLE files ADD COLUMN value_max REAL")
+
+    def __getstate__(self) -> dict:
+        """Pickle support for pool workers (each process opens its own connection)"""
+        state = self.__dict__.copy()
+        state["_conn"] = None
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        """Lazily opened connection, shared by this process's threads (call
+        with the lock held)"""
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.index_path, timeout=30,
+                                         isolation_level=None, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        return self._conn
+
+    def _execute(self, sql: str, params: tuple = ()) -> list:
+        """Run one statement and return all rows"""
+        with self._lock:
+            return self._connection().execute(sql, params).fetchall()
+
+    def refresh(self, directory: Path) -> dict:
+        """Bring the rows of one directory up to date
+
+        New files and files whose size or mtime changed are re-read (header
+        and hash, in parallel); rows of files that disappeared are dropped.
+
+        Args:
+            directory: Image or mask directory
+
+        Returns:
+            Counts {"added", "updated", "removed", "unchanged"}
+        """
+        directory = os.path.abspath(directory)
+        known = {
+            path: (size, mtime_ns)
+            for path, size, mtime_ns in self._execute(
+                "SELECT path, size, mtime_ns FROM files WHERE directory = ?", (directory,))
+        }
+
+        current = {}
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.is_file() and os.path.splitext(entry.name)[1] in INDEXED_EXTENSIONS:
+                    stat = entry.stat()
+                    current[entry.path] = (stat.st_size, stat.st_mtime_ns)
+
+        changed = [path for path, stamp in current.items() if known.get(path) != stamp]
+        removed = [path for path in known if path not in current]
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            rows = list(pool.map(lambda p: _describe_file(p, *current[p]), changed))
+
+        if rows or removed:
+            placeholders = ", ".join("?" for _ in _COLUMNS)
+            with self._lock:
+                conn = self._connection()
+                conn.execute("BEGIN")
+                try:
+                    conn.executemany(f"INSERT OR REPLACE INTO files ({', '.join(_COLUMNS)}) VALUES ({placeholders})",
+                                     [tuple(row[c] for c in _COLUMNS) for row in rows])
+                    conn.executemany("DELETE FROM files WHERE path = ?", [(p,) for p in removed])
+                    conn.execute("COMMIT")
+                except Exception:
+                    conn.execute("ROLLBACK")
+                    raise
+
+        added = sum(1 for path in changed if path not in known)
+        return {
+            "added": added,
+            "updated": len(changed) - added,
+            "removed": len(removed),
+            "unchanged": len(current) - len(changed)
+        }
+
+    def files(self, directory: Path) -> list[dict]:
+        """Rows of one directory, sorted by name (as of the last refresh)
+
+        Args:
+            directory: Indexed directory
+
+        Returns:
+            Row dictionaries; "path" is under directory as given and "shape"
+            is decoded to a list
+        """
+        rows = self._execute(
+            f"SELECT {', '.join(_COLUMNS)} FROM files WHERE directory = ? ORDER BY name",
+            (os.path.abspath(directory),)
+        )
+        result = []
+        for values in rows:
+            row = dict(zip(_COLUMNS, values))
+            row["path"] = Path(directory) / row["name"]
+            row["shape"] = json.loads(row["shape"]) if row["shape"] else None
+            result.append(row)
+        return result
+
+    def get(self, path: Path) -> Optional[dict]:
+        """Row of one file, or None if it is not indexed"""
+        rows = self._execute(f"SELECT {', '.join(_COLUMNS)} FROM files WHERE path = ?",
+                             (os.path.abspath(path),))
+        if not rows:
+            return None
+        row = dict(zip(_COLUMNS, rows[0]))
+        row["path"] = Path(path)
+        row["shape"] = json.loads(row["shape"]) if row["shape"] else None
+        return row
+
+    def content_hash(self, path: Optional[Path]) -> Optional[str]:
+        """Indexed SHA-256 of a file, if the file hasn't changed since
+
+        Costs one stat; returns None when the row is missing or stale so the
+        caller can hash the file itself.
+
+        Args:
+            path: File (optional)
+
+        Returns:
+            Hex digest, "" for no file, or None if unknown
+        """
+        if path is None:
+            return ""
+        return self._fresh_value(path, "sha256")
+
+    def value_max(self, path: Path) -> Optional[float]:
+        """Indexed maximum value of a .npy mask, if the file hasn't changed
+        since (None otherwise)"""
+        return self._fresh_value(path, "value_max")
+
+    def _fresh_value(self, path: Path, column: str):
+        """One column of a file's row, or None if the row is missing or
+        older than the file"""
+        rows = self._execute(f"SELECT size, mtime_ns, {column} FROM files WHERE path = ?",
+                             (os.path.abspath(path),))
+        if not rows or rows[0][2] is None:
+            return None
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        if (stat.st_size, stat.st_mtime_ns) != (rows[0][0], rows[0][1]):
+            return None
+        return rows[0][2]
+
+    def list_images(self, image_dir: Path) -> list[Path]:
+        """Indexed image files of a directory, sorted (like list_image_files)"""
+        return [row["path"] for row in self.files(image_dir)
+                if os.path.splitext(row["name"])[1] in IMAGE_EXTENSIONS]
+
+    def mask_index(self, mask_dir: Path) -> dict[str, Path]:
+        """Stem -> mask index of a directory (like build_mask_index)"""
+        return index_mask_paths([row["path"] for row in self.files(mask_dir)])
+
+    def pairs(self, image_dir: Path, mask_dir: Optional[Path]) -> list[tuple[Path, Optional[Path]]]:
+        """Refresh both directories and pair images with masks
+
+        Same result as scan_image_mask_pairs, but unchanged files are not
+        re-read and their metadata stays available for later queries.
+
+        Args:
+            image_dir: Directory containing images
+            mask_dir: Directory containing masks (optional)
+
+        Returns:
+            List of tuples: [(image_path, mask_path_or_none), ...]
+        """
+        self.refresh(image_dir)
+        mask_index = {}
+        if mask_dir and Path(mask_dir).exists():
+            self.refresh(mask_dir)
+            mask_index = self.mask_index(mask_dir)
+        return [(img_path, mask_index.get(img_path.stem)) for img_path in self.list_images(image_dir)]
@@ -0,0 +1,395 @@
+"""Geometric Fusion - Resample chains of geometric transforms only once
+
+Albumentations applies ShiftScaleRotate, Rotate, Affine, Perspective,
+OpticalDistortion and GridDistortion one after another, each resampling
+the whole image and mask. fuse_geometric_pipeline() replaces every run of
+two or more of them with a FusedWarp step that
+
+1. samples each transform's parameters exactly like Compose would (same
+   p checks and random draws, in the same order), so the fused run uses
+   the parameters the unfused one would have used,
+2. composes their coordinate mappings: one 3x3 matrix for affine and
+   perspective chains whose intermediate frames stay inside the image,
+   otherwise one dense map with the border mode of every intermediate
+   transform folded into the coordinates,
+3. resamples the image once with the first applied transform's
+   interpolation, and the mask once with nearest neighbour.
+
+The result differs from the per-transform path (one interpolation instead
+of several, sub-pixel differences at borders), so fusion is opt-in: by
+default transforms are applied exactly as configured (CONFIG_FIDELITY.md).
+When only one transform of a run fires, it is applied unchanged.
+Transforms that change the output size (Rotate crop_border, fit_output,
+Perspective keep_size=False) and all other transforms run as before.
+"""
+
+import random
+from typing import Optional
+
+import albumentations as A
+import cv2
+import numpy as np
+
+
+FUSABLE_TRANSFORMS = (
+    "ShiftScaleRotate", "Rotate", "Affine", "Perspective", "OpticalDistortion", "GridDistortion"
+)
+
+
+def is_fusable(transform) -> bool:
+    """True if a transform can join a FusedWarp (known mapping, same output size)"""
+    name = type(transform).__name__
+    if name not in FUSABLE_TRANSFORMS:
+        return False
+    if name == "Rotate":
+        return not transform.crop_border
+    if name == "Affine":
+        return not transform.fit_output
+    if name == "Perspective":
+        return transform.keep_size and not transform.fit_output
+    return True
+
+
+def optical_distortion_maps(height: int, width: int, k: float, dx: int, dy: int) -> np.ndarray:
+    """Remap grid of OpticalDistortion (as in albumentations' optical_distortion)
+
+    Returns:
+        (H, W, 2) float32 source (x, y) of every output pixel
+    """
+    camera_matrix = np.array([[width, 0, width * 0.5 + dx], [0, height, height * 0.5 + dy], [0, 0, 1]],
+                             dtype=np.float32)
+    distortion = np.array([k, k, 0, 0, 0], dtype=np.float32)
+    grid, _ = cv2.initUndistortRectifyMap(camera_matrix, distortion, None, None, (width, height), cv2.CV_32FC2)
+    return grid
+
+
+def _grid_axis(size: int, num_steps: int, steps) -> np.ndarray:
+    """Source coordinate of every output column (or row) of GridDistortion"""
+    step = size // num_steps
+    coords = np.zeros(size, np.float32)
+    prev = 0
+    for idx in range(num_steps + 1):
+        start = idx * step
+        end = start + step
+        if end > size:
+            end = size
+            cur = size
+        else:
+            cur = prev + step * steps[idx]
+        coords[start:end] = np.linspace(prev, cur, end - start)
+        prev = cur
+    return coords
+
+
+def grid_distortion_maps(height: int, width: int, num_steps: int, stepsx, stepsy) -> np.ndarray:
+    """Remap grid of GridDistortion (as in albumentations' grid_distortion)
+
+    Returns:
+        (H, W, 2) float32 source (x, y) of every output pixel
+    """
+    grid = np.empty((height, width, 2), np.float32)
+    grid[..., 0] = _grid_axis(width, num_steps, stepsx)[None, :]
+    grid[..., 1] = _grid_axis(height, num_steps, stepsy)[:, None]
+    return grid
+
+
+def _pixel_grid(shape: tuple[int, int]) -> np.ndarray:
+    """(H, W, 2) float32 coordinates of every pixel (reused while the shape is the same)"""
+    global _last_pixel_grid
+    if _last_pixel_grid is None or _last_pixel_grid.shape[:2] != shape:
+        height, width = shape
+        grid = np.empty((height, width, 2), np.float32)
+        grid[..., 0] = np.arange(width, dtype=np.float32)[None, :]
+        grid[..., 1] = np.arange(height, dtype=np.float32)[:, None]
+        grid.flags.writeable = False
+        _last_pixel_grid = grid
+    return _last_pixel_grid
+
+
+_last_pixel_grid: Optional[np.ndarray] = None
+
+
+class _Stage:
+    """One resampling step: output -> source coordinates plus its border handling"""
+
+    def __init__(self,
+                 source_size: tuple[int, int],
+                 border_mode: int,
+                 value,
+                 mask_value,
+                 interpolation: int,
+                 matrix: Optional[np.ndarray] = None,
+                 grid: Optional[np.ndarray] = None):
+        self.source_size = source_size  # (width, height) of the image it samples
+        self.border_mode = border_mode
+        self.value = value
+        self.mask_value = mask_value
+        self.interpolation = interpolation
+        self.matrix = matrix  # 3x3, output -> source
+        self.grid = grid  # (H, W, 2) source coordinates of each output pixel
+
+    def map(self, coords: Optional[np.ndarray], shape: tuple[int, int]) -> np.ndarray:
+        """Source coordinates (H, W, 2 float32) of the given output coordinates
+        (None = the output pixel grid of the given shape)"""
+        if self.grid is not None:
+            if coords is None:
+                return self.grid
+            return cv2.remap(self.grid, coords, None, cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+        if coords is None:
+            coords = _pixel_grid(shape)
+        if np.allclose(self.matrix[2], (0, 0, 1)):
+            return cv2.transform(coords, self.matrix[:2])
+        return cv2.perspectiveTransform(coords, self.matrix)
+
+
+def _inverse(forward: np.ndarray) -> np.ndarray:
+    """3x3 output -> source matrix of a forward (source -> output) 2x3 or 3x3 matrix"""
+    matrix = np.eye(3)
+    matrix[:forward.shape[0]] = forward
+    return np.linalg.inv(matrix)
+
+
+def _stages(transform, params: dict, height: int, width: int) -> list[_Stage]:
+    """Resampling stages of one transform with sampled params, in application order"""
+    name = type(transform).__name__
+    size = (width, height)
+    interpolation = params["interpolation"]
+    center = (width / 2 - 0.5, height / 2 - 0.5)
+
+    if name == "ShiftScaleRotate":
+        matrix = cv2.getRotationMatrix2D(center, params["angle"], params["scale"])
+        matrix[0, 2] += params["dx"] * width
+        matrix[1, 2] += params["dy"] * height
+        return [_Stage(size, transform.border_mode, transform.value, transform.mask_value, interpolation,
+                       matrix=_inverse(matrix))]
+    if name == "Rotate":
+        matrix = cv2.getRotationMatrix2D(center, params["angle"], 1.0)
+        return [_Stage(size, transform.border_mode, transform.value, transform.mask_value, interpolation,
+                       matrix=_inverse(matrix))]
+    if name == "Affine":
+        if np.allclose(params["matrix"].params, np.eye(3, dtype=np.float32)):
+            return []  # albumentations returns the input unchanged
+        return [_Stage(size, transform.mode, transform.cval, transform.cval_mask, interpolation,
+                       matrix=_inverse(params["matrix"].params))]
+    if name == "Perspective":
+        # Warp to (max_width, max_height), then resize back (keep_size)
+        warped_width, warped_height = params["max_width"], params["max_height"]
+        sx, sy = warped_width / width, warped_height / height
+        resize = np.array([[sx, 0, 0.5 * sx - 0.5], [0, sy, 0.5 * sy - 0.5], [0, 0, 1]])
+        return [
+            _Stage(size, transform.pad_mode, transform.pad_val, transform.pad_val, interpolation,
+                   matrix=_inverse(params["matrix"])),
+            _Stage((warped_width, warped_height), cv2.BORDER_REPLICATE, None, None, interpolation, matrix=resize)
+        ]
+    if name == "OpticalDistortion":
+        grid = optical_distortion_maps(height, width, params["k"], params["dx"], params["dy"])
+        return [_Stage(size, transform.border_mode, transform.value, transform.mask_value, interpolation, grid=grid)]
+    if name == "GridDistortion":
+        grid = grid_distortion_maps(height, width, transform.num_steps, params["stepsx"], params["stepsy"])
+        return [_Stage(size, transform.border_mode, transform.value, transform.mask_value, interpolation, grid=grid)]
+    raise ValueError(f"{name} can't be fused")
+
+
+def _border_value(value):
+    return 0 if value is None else value
+
+
+def _inside(coords: np.ndarray, width: int, height: int) -> bool:
+    """True if all (x, y) lie inside a width x height frame, give or take a
+    pixel (within it the border mode barely matters)"""
+    rows = coords.reshape(coords.shape[0], -1)
+    low = cv2.reduce(rows, 0, cv2.REDUCE_MIN).reshape(-1, 2).min(axis=0)
+    high = cv2.reduce(rows, 0, cv2.REDUCE_MAX).reshape(-1, 2).max(axis=0)
+    return low.min() >= -1 and high[0] <= width and high[1] <= height
+
+
+def _through(previous: _Stage, stage: _Stage, coords: np.ndarray) -> tuple[np.ndarray, Optional[np.ndarray]]:
+    """Map coordinates in stage's source frame (previous's output) on to
+    previous's source frame, reading out-of-frame points the way stage's
+    border mode would
+
+    Returns:
+        (coords, coverage): coverage is the weight of the image (vs stage's
+        constant border value) per pixel, None unless stage uses
+        BORDER_CONSTANT and samples outside its source
+    """
+    width, height = stage.source_size
+    if previous.grid is None and _inside(coords, width, height):
+        return previous.map(coords, (height, width)), None
+    # Sampling previous's remap grid with stage's border mode is exactly
+    # what stage does to previous's output image
+    grid = previous.grid if previous.grid is not None else previous.map(None, (height, width))
+    if stage.border_mode != cv2.BORDER_CONSTANT:
+        return cv2.remap(grid, coords, None, cv2.INTER_LINEAR, borderMode=stage.border_mode), None
+    coverage = cv2.remap(np.ones((height, width), np.float32), coords, None, cv2.INTER_LINEAR,
+                         borderMode=cv2.BORDER_CONSTANT, borderValue=0)
+    coords = cv2.remap(grid, coords, None, cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+    return coords, coverage
+
+
+def _blend_border(image: np.ndarray, coverage: np.ndarray, value) -> None:
+    """Mix a constant border value into the pixels coverage says are (partly) outside"""
+    region = coverage < 1
+    if not region.any():
+        return
+    weight = coverage[region]
+    if image.ndim == 3:
+        weight = weight[:, None]
+    mixed = image[region] * weight + np.asarray(_border_value(value), np.float32) * (1 - weight)
+    if np.issubdtype(image.dtype, np.integer):
+        info = np.iinfo(image.dtype)
+        mixed = np.clip(np.rint(mixed), info.min, info.max)
+    image[region] = mixed
+
+
+def _single_matrix(stages: list[_Stage], shape: tuple[int, int]) -> Optional[np.ndarray]:
+    """Composed output -> source matrix, if every stage is a matrix and no
+    intermediate stage samples outside its source (so borders don't matter)"""
+    if any(stage.grid is not None for stage in stages):
+        return None
+    height, width = shape
+    corners = np.array([[0, width - 1, width - 1, 0], [0, 0, height - 1, height - 1], [1, 1, 1, 1]], dtype=float)
+    total = np.eye(3)
+    for index in range(len(stages) - 1, -1, -1):
+        total = stages[index].matrix @ total
+        if index == 0:
+            break
+        points = total @ corners
+        if np.any(points[2] <= 0):
+            return None
+        source_width, source_height = stages[index].source_size
+        x, y = points[0] / points[2], points[1] / points[2]
+        if min(x.min(), y.min()) < -1e-3 or x.max() > source_width - 1 + 1e-3 or y.max() > source_height - 1 + 1e-3:
+            return None
+    return total
+
+
+def warp_stages(stages: list[_Stage], image: np.ndarray,
+                mask: Optional[np.ndarray] = None) -> tuple[np.ndarray, Optional[np.ndarray]]:
+    """Resample image (and mask) once through a chain of stages
+
+    Args:
+        stages: Stages in application order (all with the image's output size)
+        image: Input image
+        mask: Input mask (optional)
+
+    Returns:
+        (image, mask)
+    """
+    shape = image.shape[:2]
+    dsize = (shape[1], shape[0])
+    first = stages[0]
+
+    total = _single_matrix(stages, shape)
+    if total is not None:
+        flags = cv2.WARP_INVERSE_MAP
+        if np.allclose(total[2], (0, 0, 1)):
+            warp, matrix = cv2.warpAffine, total[:2]
+        else:
+            warp, matrix = cv2.warpPerspective, total
+        image = warp(image, matrix, dsize, flags=first.interpolation | flags,
+                     borderMode=first.border_mode, borderValue=_border_value(first.value))
+        if mask is not None:
+            mask = warp(mask, matrix, dsize, flags=cv2.INTER_NEAREST | flags,
+                        borderMode=first.border_mode, borderValue=_border_value(first.mask_value))
+        return image, mask
+
+    # Dense map: walk back from the output, folding in intermediate borders
+    coords = stages[-1].map(None, shape)
+    fills = []
+    for index in range(len(stages) - 1, 0, -1):
+        stage = stages[index]
+        coords, coverage = _through(stages[index - 1], stage, coords)
+        if coverage is not None:
+            fills.append((coverage, stage.value, stage.mask_value))
+
+    image = cv2.remap(image, coords, None, first.interpolation,
+                      borderMode=first.border_mode, borderValue=_border_value(first.value))
+    if mask is not None:
+        mask = cv2.remap(mask, coords, None, cv2.INTER_NEAREST,
+                         borderMode=first.border_mode, borderValue=_border_value(first.mask_value))
+    # Constant borders of intermediate stages, from the first one on
+    for coverage, value, mask_value in reversed(fills):
+        _blend_border(image, coverage, value)
+        if mask is not None:
+            mask[coverage < 0.5] = _border_value(mask_value)
+    return image, mask
+
+
+def sample_params(transform, image: np.ndarray) -> Optional[dict]:
+    """Parameters for one call of a transform, drawing random numbers exactly
+    as BasicTransform.__call__ does (None if the transform doesn't fire)"""
+    if (random.random() < transform.p) or transform.always_apply:
+        params = transform.get_params()
+        if transform.targets_as_params:
+            # Fusable transforms only read the image shape, which they preserve
+            params.update(transform.get_params_dependent_on_targets({"image": image}))
+        return transform.update_params(params, image=image)
+    return None
+
+
+class FusedWarp(A.DualTransform):
+    """Consecutive fusable geometric transforms applied as one resampling pass"""
+
+    def __init__(self, transforms: list):
+        """Initialize step
+
+        Args:
+            transforms: Fusable transforms (see is_fusable), in order
+        """
+        super().__init__(always_apply=True, p=1.0)
+        self.transforms = transforms
+
+    def __call__(self, *args, force_apply: bool = False, **data) -> dict:
+        image = data["image"]
+        height, width = image.shape[:2]
+
+        applied = []
+        for transform in self.transforms:
+            params = sample_params(transform, image)
+            if params is not None:
+                applied.append((transform, params))
+
+        if len(applied) == 1:
+            # Nothing to fuse - identical to the per-transform path
+            transform, params = applied[0]
+            return transform.apply_with_params(params, **data)
+
+        stages = [stage for transform, params in applied for stage in _stages(transform, params, height, width)]
+        if stages:
+            data["image"], mask = warp_stages(stages, image, data.get("mask"))
+            if mask is not None:
+                data["mask"] = mask
+        return data
+
+    def get_transform_init_args_names(self) -> tuple:
+        return ("transforms",)
+
+    def __repr__(self) -> str:
+        return f"FusedWarp({', '.join(type(t).__name__ for t in self.transforms)})"
+
+
+def fuse_geometric_pipeline(pipeline: Optional[A.Compose]) -> Optional[A.Compose]:
+    """Replace runs of two or more fusable transforms with FusedWarp steps
+
+    Args:
+        pipeline: Geometric pipeline (A.Compose) or None
+
+    Returns:
+        New A.Compose (random numbers are consumed exactly as by the
+        original), or None
+    """
+    if pipeline is None:
+        return None
+
+    steps = []
+    run = []
+    for transform in list(pipeline.transforms) + [None]:
+        if transform is not None and is_fusable(transform):
+            run.append(transform)
+            continue
+        steps.extend([FusedWarp(run)] if len(run) >= 2 else run)
+        run = []
+        if transform is not None:
+            steps.append(transform)
+    return A.Compose(steps, p=pipeline.p)
@@ -1,13 +1,74 @@
 """Mask Handler - Manages image-mask pairing and synchronization"""
 
+import io
+import struct
 import cv2
 import numpy as np
 from pathlib import Path
 from typing import Optional
 import albumentations as A
 
+from .archive_reader import imread_input, input_exists, is_virtual_path, list_input_files, read_input_bytes
 
-def find_mask_for_image(image_path: Path, mask_dir: Path) -> Optional[Path]:
+
+# Mask lookup priority: naming strategy first, then extension order
+MASK_NAME_SUFFIXES = ['', '_mask', '_gt']
+MASK_EXTENSIONS = ['.npy', '.png', '.PNG', '.tif', '.TIF', '.tiff', '.TIFF', '.bmp', '.BMP', '.rle']
+IMAGE_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.tif', '.tiff', '.bmp',
+                    '.JPG', '.JPEG', '.PNG', '.TIF', '.TIFF', '.BMP']
+
+# Compact mask file: header, then run values and uint32 run lengths of the
+# bounding-box crop in row-major order. Empty masks are just the header.
+RLE_MAGIC = b'RLM1'
+_RLE_HEADER = struct.Struct('<4s4s7I')  # magic, dtype, height, width, x0, y0, x1, y1, runs
+
+
+def _list_files(directory: Path) -> list[Path]:
+    """Regular files in a directory (or archive directory), listed once"""
+    return list_input_files(directory)
+
+
+def build_mask_index(mask_dir: Path) -> dict[str, Path]:
+    """Index a mask directory by image stem, listing it once
+
+    Follows the same priority as find_mask_for_image: same basename first,
+    then the _mask suffix, then _gt, each in MASK_EXTENSIONS order.
+
+    Args:
+        mask_dir: Directory containing masks
+
+    Returns:
+        {image_stem: mask_path}
+    """
+    return index_mask_paths(_list_files(mask_dir))
+
+
+def index_mask_paths(mask_paths: list[Path]) -> dict[str, Path]:
+    """Index already listed mask files by image stem (see build_mask_index)
+
+    Args:
+        mask_paths: Files of one mask directory
+
+    Returns:
+        {image_stem: mask_path}
+    """
+    best: dict[str, tuple[tuple[int, int], Path]] = {}
+    for path in mask_paths:
+        name = path.name
+        for strategy, name_suffix in enumerate(MASK_NAME_SUFFIXES):
+            for ext_rank, ext in enumerate(MASK_EXTENSIONS):
+                ending = name_suffix + ext
+                if not name.endswith(ending) or len(name) == len(ending):
+                    continue
+                stem = name[:-len(ending)]
+                rank = (strategy, ext_rank)
+                if stem not in best or rank < best[stem][0]:
+                    best[stem] = (rank, path)
+    return {stem: path for stem, (_, path) in best.items()}
+
+
+def find_mask_for_image(image_path: Path, mask_dir: Path,
+                        mask_index: Optional[dict[str, Path]] = None) -> Optional[Path]:
     """Find corresponding mask file for an image
 
     Matching strategy:
@@ -19,38 +80,60 @@ def find_mask_for_image(image_path: Path, mask_dir: Path) -> Optional[Path]:
     Args:
         image_path: Path to image file
         mask_dir: Directory containing masks
+        mask_index: Index from build_mask_index (optional). When given, no
+            filesystem calls are made - use it when looking up many images
 
     Returns:
         Path to mask file or None
     """
     base_name = image_path.stem  # e.g., "sample_001"
 
-    # Strategy 1: Same basename, different extension (including .npy for NumPy masks)
-    mask_extensions = ['.npy', '.png', '.PNG', '.tif', '.TIF', '.tiff', '.TIFF', '.bmp', '.BMP']
-    for ext in mask_extensions:
-        mask_path = mask_dir / f"{base_name}{ext}"
-        if mask_path.exists():
-            return mask_path
-
-    # Strategy 2: _mask suffix
-    for ext in mask_extensions:
-        mask_path = mask_dir / f"{base_name}_mask{ext}"
-        if mask_path.exists():
-            return mask_path
-
-    # Strategy 3: _gt (ground truth) suffix
-    for ext in mask_extensions:
-        mask_path = mask_dir / f"{base_name}_gt{ext}"
-        if mask_path.exists():
-            return mask_path
+    if mask_index is not None:
+        return mask_index.get(base_name)
+
+    for name_suffix in MASK_NAME_SUFFIXES:
+        for ext in MASK_EXTENSIONS:
+            mask_path = mask_dir / f"{base_name}{name_suffix}{ext}"
+            if input_exists(mask_path):
+                return mask_path
 
     # No mask found
     return None
 
 
+def list_image_files(image_dir: Path) -> list[Path]:
+    """Supported image files in a directory, sorted (one directory listing)
+
+    Args:
+        image_dir: Directory containing images
+
+    Returns:
+        Sorted image paths
+    """
+    return sorted(p for p in _list_files(image_dir) if p.suffix in IMAGE_EXTENSIONS)
+
+
+def list_mask_files(mask_dir: Path) -> list[Path]:
+    """Files with a mask extension in a directory, sorted
+
+    Args:
+        mask_dir: Directory containing masks
+
+    Returns:
+        Sorted mask paths
+    """
+    return sorted(p for p in _list_files(mask_dir) if p.suffix in MASK_EXTENSIONS)
+
+
 def scan_image_mask_pairs(image_dir: Path, mask_dir: Optional[Path]) -> list[tuple[Path, Optional[Path]]]:
     """Scan directories and return list of (image, mask) pairs
 
+    Each directory is listed once; masks are matched through an in-memory
+    index instead of per-image existence checks.
+
+    Either directory may be a tar/zip archive or a directory inside one
+    (see archive_reader).
+
     Args:
         image_dir: Directory containing images
         mask_dir: Directory containing masks (optional)
@@ -58,26 +141,12 @@ def scan_image_mask_pairs(image_dir: Path, mask_dir: Optional[Path]) -> list[tup
     Returns:
         List of tuples: [(image_path, mask_path_or_none), ...]
     """
-    # Find all images
-    image_extensions = ['*.jpg', '*.jpeg', '*.png', '*.tif', '*.tiff', '*.bmp',
-                       '*.JPG', '*.JPEG', '*.PNG', '*.TIF', '*.TIFF', '*.BMP']
-    image_files = []
-    for ext in image_extensions:
-        image_files.extend(image_dir.glob(ext))
-
     # Sort for consistent ordering
-    image_files = sorted(image_files)
+    image_files = list_image_files(image_dir)
 
     # Pair with masks
-    pairs = []
-    for img_path in image_files:
-        if mask_dir and mask_dir.exists():
-            mask_path = find_mask_for_image(img_path, mask_dir)
-        else:
-            mask_path = None
-        pairs.append((img_path, mask_path))
-
-    return pairs
+    mask_index = build_mask_index(mask_dir) if mask_dir and input_exists(mask_dir) else {}
+    return [(img_path, mask_index.get(img_path.stem)) for img_path in image_files]
 
 
 def validate_mask(image: np.ndarray, mask: np.ndarray) -> tuple[bool, str]:
@@ -102,13 +171,164 @@ def validate_mask(image: np.ndarray, mask: np.ndarray) -> tuple[bool, str]:
     return True, ""
 
 
-def load_mask(mask_path: Path) -> Optional[np.ndarray]:
+def mask_bbox(mask: np.ndarray) -> Optional[tuple[int, int, int, int]]:
+    """Bounding box of the nonzero pixels of a 2-D mask
+
+    Args:
+        mask: Mask array
+
+    Returns:
+        (x0, y0, x1, y1) with exclusive ends, or None for an empty mask
+    """
+    rows = np.flatnonzero(mask.any(axis=1))
+    if rows.size == 0:
+        return None
+    cols = np.flatnonzero(mask.any(axis=0))
+    return int(cols[0]), int(rows[0]), int(cols[-1]) + 1, int(rows[-1]) + 1
+
+
+def encode_mask_rle(mask: np.ndarray) -> bytes:
+    """Run-length encode a 2-D mask (lossless, any integer/bool dtype)
+
+    Only the bounding box of the nonzero pixels is encoded; an empty mask
+    is written as a bare header without scanning for runs.
+
+    Args:
+        mask: Mask array (H x W)
+
+    Returns:
+        Encoded mask (see RLE_MAGIC)
+    """
+    if mask.ndim != 2:
+        raise ValueError(f"RLE masks must be 2-D, got shape {mask.shape}")
+    dtype = mask.dtype.str.encode('ascii')
+    height, width = mask.shape
+    bbox = mask_bbox(mask)
+    if bbox is None:
+        return _RLE_HEADER.pack(RLE_MAGIC, dtype, height, width, 0, 0, 0, 0, 0)
+
+    x0, y0, x1, y1 = bbox
+    flat = np.ascontiguousarray(mask[y0:y1, x0:x1]).ravel()
+    starts = np.concatenate(([0], np.flatnonzero(flat[1:] != flat[:-1]) + 1))
+    lengths = np.diff(np.append(starts, flat.size)).astype('<u4')
+    header = _RLE_HEADER.pack(RLE_MAGIC, dtype, height, width, x0, y0, x1, y1, starts.size)
+    return header + flat[starts].tobytes() + lengths.tobytes()
+
+
+def read_mask_rle_info(data: bytes) -> dict:
+    """Shape, dtype, empty flag and bounding box of an RLE mask, from its header
+
+    Args:
+        data: Encoded mask (at least the header)
+
+    Returns:
+        {"shape": [h, w], "dtype", "empty", "bbox": [x0, y0, x1, y1] or None}
+    """
+    magic, dtype, height, width, x0, y0, x1, y1, runs = _RLE_HEADER.unpack_from(data)
+    if magic != RLE_MAGIC:
+        raise ValueError("Not an RLE mask")
+    dtype = np.dtype(dtype.rstrip(b'\0').decode('ascii'))
+    return {
+        "shape": [height, width],
+        "dtype": dtype.name,
+        "empty": runs == 0,
+        "bbox": [x0, y0, x1, y1] if runs else None
+    }
+
+
+def decode_mask_rle(data: bytes) -> np.ndarray:
+    """Decode an RLE mask written by encode_mask_rle"""
+    magic, dtype, height, width, x0, y0, x1, y1, runs = _RLE_HEADER.unpack_from(data)
+    if magic != RLE_MAGIC:
+        raise ValueError("Not an RLE mask")
+    dtype = np.dtype(dtype.rstrip(b'\0').decode('ascii'))
+    mask = np.zeros((height, width), dtype=dtype)
+    if runs:
+        offset = _RLE_HEADER.size
+        values = np.frombuffer(data, dtype=dtype, count=runs, offset=offset)
+        lengths = np.frombuffer(data, dtype='<u4', count=runs, offset=offset + runs * dtype.itemsize)
+        mask[y0:y1, x0:x1] = np.repeat(values, lengths).reshape(y1 - y0, x1 - x0)
+    return mask
+
+
+# Elements per block when checking an integer mask for values above 1
+_SCAN_BLOCK_ELEMENTS = 1 << 20
+
+
+def _exceeds_one(mask: np.ndarray) -> bool:
+    """True if an integer H x W mask holds a value above 1
+
+    Stops at the first block of rows that does: a 0/255 mask is decided at
+    its first foreground rows instead of by a max() over every pixel. Only
+    0/1 masks are scanned to the end.
+    """
+    rows = max(1, _SCAN_BLOCK_ELEMENTS // max(1, mask.shape[1]))
+    for start in range(0, mask.shape[0], rows):
+        if mask[start:start + rows].max() > 1:
+            return True
+    return False
+
+
+def _load_npy_mask(mask_path: Path, value_max: Optional[float] = None) -> Optional[np.ndarray]:
+    """Load a .npy mask through a memory map, producing one H x W buffer
+
+    Gives the same result as loading, squeezing, merging regions and
+    scaling the whole array, without the full-size intermediate copies:
+    only the merged H x W mask is ever allocated. Archive members and
+    objects in object storage can't be mapped and are loaded from memory.
+    """
+    if is_virtual_path(mask_path):
+        mask = np.squeeze(np.load(io.BytesIO(read_input_bytes(mask_path))))
+    else:
+        # Header only - pages are read as the reduction/copy below touches them
+        mask = np.squeeze(np.load(mask_path, mmap_mode='r'))
+
+    # Handle masks with multiple regions (shape like (2, H, W), (3, H, W))
+    # Merge all regions into a single binary mask using OR operation
+    if mask.ndim == 3:
+        # Single pass over the regions, accumulated into one H x W buffer
+        merged = np.empty(mask.shape[1:], dtype=mask.dtype)
+        np.maximum.reduce(mask, axis=0, out=merged)
+    elif mask.ndim == 2:
+        merged = np.array(mask)
+    else:
+        print(f"Warning: Skipping {mask_path.name} - unexpected shape {mask.shape}")
+        return None
+
+    if value_max is not None:
+        binary = value_max <= 1
+    elif merged.dtype == np.bool_:
+        binary = True
+    elif np.issubdtype(merged.dtype, np.integer) and merged.size:
+        binary = not _exceeds_one(merged)
+    else:
+        binary = merged.max() <= 1
+
+    # Ensure uint8 format and normalize to 0-255 range
+    if binary:
+        # Binary mask with values 0 and 1
+        if np.issubdtype(merged.dtype, np.floating):
+            return (merged * 255).astype(np.uint8)
+        # Integer products wrap modulo 256 either way, so scale in place
+        # after the cast instead of in a wider temporary
+        merged = merged.astype(np.uint8, copy=False)
+        np.multiply(merged, 255, out=merged)
+        return merged
+    if merged.dtype != np.uint8:
+        return merged.astype(np.uint8)
+    return merged
+
+
+def load_mask(mask_path: Path, value_max: Optional[float] = None) -> Optional[np.ndarray]:
     """Load mask file and ensure it's single-channel
 
     Supports both image formats (.png, .tif, etc.) and NumPy arrays (.npy)
 
     Args:
         mask_path: Path to mask file
+        value_max: Known maximum value of a .npy mask (optional, e.g. from
+            the dataset index). Saves a pass over the data to decide
+            whether 0/1 masks need scaling to 0/255
 
     Returns:
         Grayscale mask array or None if failed
@@ -116,35 +336,14 @@ def load_mask(mask_path: Path) -> Optional[np.ndarray]:
     try:
         # Handle .npy files (NumPy arrays)
         if mask_path.suffix.lower() == '.npy':
-            mask = np.load(mask_path)
-
-            # Remove extra dimensions (e.g., (1, H, W) -> (H, W))
-            mask = np.squeeze(mask)
-
-            # Handle masks with multiple regions (shape like (2, H, W), (3, H, W))
-            # Merge all regions into a single binary mask using OR operation
-            if len(mask.shape) == 3:
-                # Multiple regions detected - merge them
-                # Shape: (num_regions, height, width)
-                print(f"Info: Merging {mask.shape[0]} regions in {mask_path.name}")
-                # Combine all regions using max (OR operation for binary masks)
-                mask = np.max(mask, axis=0)
-            elif len(mask.shape) != 2:
-                print(f"Warning: Skipping {mask_path.name} - unexpected shape {mask.shape}")
-                return None
-
-            # Ensure uint8 format and normalize to 0-255 range
-            if mask.max() <= 1:
-                # Binary mask with values 0 and 1
-                mask = (mask * 255).astype(np.uint8)
-            elif mask.dtype != np.uint8:
-                mask = mask.astype(np.uint8)
+            return _load_npy_mask(mask_path, value_max)
 
-            return mask
+        if mask_path.suffix == '.rle':
+            return decode_mask_rle(read_input_bytes(mask_path))
 
         # Handle image files
         else:
-            mask = cv2.imread(str(mask_path), cv2.IMREAD_UNCHANGED)
+            mask = imread_input(mask_path, cv2.IMREAD_UNCHANGED)
             if mask is None:
                 return None
 
@@ -199,13 +398,20 @@ def apply_transforms_with_mask(
     return aug_image, aug_mask
 
 
-def create_mask_overlay(image: np.ndarray, mask: np.ndarray, alpha: float = 0.6) -> np.ndarray:
+def create_mask_overlay(image: np.ndarray,
+                        mask: np.ndarray,
+                        alpha: float = 0.6,
+                        bbox: Optional[list[int]] = None) -> np.ndarray:
     """Create semi-transparent mask overlay on image with bright highlighting
 
+    Only the mask's bounding box is blended; pixels outside it are copied.
+
     Args:
         image: RGB image
         mask: Grayscale mask
         alpha: Transparency (0=fully transparent, 1=fully opaque)
+        bbox: Known bounding box [x0, y0, x1, y1] of the mask, e.g. from
+            an RLE mask header (optional, computed otherwise)
 
     Returns:
         Image with mask overlay
@@ -220,6 +426,15 @@ def create_mask_overlay(image: np.ndarray, mask: np.ndarray, alpha: float = 0.6)
     if len(mask.shape) == 3:
         mask = cv2.cvtColor(mask, cv2.COLOR_BGR2GRAY)
 
+    if bbox is None:
+        bbox = mask_bbox(mask)
+    result = image.astype(np.uint8)
+    if bbox is None:
+        return result
+    x0, y0, x1, y1 = bbox
+    image = image[y0:y1, x0:x1]
+    mask = mask[y0:y1, x0:x1]
+
     # Create bright cyan/turquoise colored mask for better visibility
     colored_mask = np.zeros_like(image)
     mask_normalized = (mask > 0).astype(np.uint8) * 255
@@ -239,4 +454,5 @@ def create_mask_overlay(image: np.ndarray, mask: np.ndarray, alpha: float = 0.6)
     darkened_image = image * 0.5
     overlay = image * (1 - mask_binary) + (darkened_image * (1 - alpha) + colored_mask * alpha) * mask_binary
 
-    return overlay.astype(np.uint8)
+    result[y0:y1, x0:x1] = overlay.astype(np.uint8)
+    return result
@@ -0,0 +1,440 @@
+"""Output Store - Where variant outputs live and how they are read back
+
+Runs write their outputs in one of three layouts:
+
+- "files": individual files under distortion_NNN/images|masks
+- "shards": members of size-capped tar shards under shards/. Member names
+  are the relative paths the files layout would use, so extracting a shard
+  recreates the files layout. Every shard has a sidecar index
+  (<shard>.index.jsonl) with the data offset and size of each member.
+- "arrays": raw, unencoded arrays in preallocated files under arrays/,
+  one file per (kind, shape, dtype) bucket, indexed in <writer>.index.jsonl
+  by image, variant, file, offset, shape and dtype. Any sample can be read
+  with np.memmap - no decoding.
+
+For shards and arrays, output entries in the manifest carry the same
+reference as the index ("image_ref"/"mask_ref"), so readers go straight to
+the bytes without scanning.
+
+The files and shards layouts encode outputs with an OutputEncoder, chosen
+per run and separately for images and masks.
+"""
+
+import io
+import json
+import os
+import tarfile
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Optional
+
+import cv2
+import numpy as np
+
+from .mask_handler import decode_mask_rle, encode_mask_rle
+
+
+OUTPUT_LAYOUTS = ("files", "shards", "arrays")
+SHARDS_DIRNAME = "shards"
+ARRAYS_DIRNAME = "arrays"
+
+# Encoder format -> file extension ("source" keeps the input's extension)
+ENCODER_FORMATS = {
+    "source": None,
+    "png": ".png",
+    "webp": ".webp",
+    "jpeg": ".jpg",
+    "npy": ".npy",
+    "rle": ".rle"
+}
+
+
+def encode_image(array: np.ndarray, extension: str, params: Optional[list[int]] = None) -> bytes:
+    """Encode an array with OpenCV, using the format implied by the extension
+
+    Args:
+        array: Image array (BGR or grayscale)
+        extension: File extension including the dot, e.g. ".png"
+        params: cv2.imencode parameters (optional)
+
+    Returns:
+        Encoded file contents
+    """
+    ok, buffer = cv2.imencode(extension, array, params or [])
+    if not ok:
+        raise ValueError(f"Failed to encode image as {extension}")
+    return buffer.tobytes()
+
+
+class OutputEncoder:
+    """Encoder for one kind of output, parsed from a spec string
+
+    Specs:
+        "source"      same format as the input file, OpenCV defaults (images only)
+        "png"         PNG with OpenCV's default (fast) settings
+        "png:<0-9>"   PNG with an explicit zlib compression level
+        "webp"        lossless WebP
+        "jpeg:<1-100>" JPEG with the given quality (default 95) - lossy, previews only
+        "npy"         raw NumPy array (RGB for images), no compression
+        "rle"         run-length encoded bounding box (masks only, see
+                      mask_handler.encode_mask_rle) - tiny for sparse masks
+    """
+
+    def __init__(self, spec: str = "png"):
+        """Parse an encoder spec
+
+        Args:
+            spec: Encoder spec (see class docstring)
+        """
+        format_name, _, argument = spec.partition(":")
+        if format_name not in ENCODER_FORMATS:
+            raise ValueError(f"Unknown encoder '{spec}', expected one of {list(ENCODER_FORMATS)}")
+
+        self.params: list[int] = []
+        if argument:
+            if format_name not in ("png", "jpeg") or not argument.isdigit():
+                raise ValueError(f"Invalid encoder spec '{spec}'")
+            value = int(argument)
+            if format_name == "png":
+                if not 0 <= value <= 9:
+                    raise ValueError(f"PNG compression level must be 0-9, got {value}")
+                self.params = [cv2.IMWRITE_PNG_COMPRESSION, value]
+            else:
+                if not 1 <= value <= 100:
+                    raise ValueError(f"JPEG quality must be 1-100, got {value}")
+                self.params = [cv2.IMWRITE_JPEG_QUALITY, value]
+        elif format_name == "webp":
+            # Quality above 100 selects lossless WebP
+            self.params = [cv2.IMWRITE_WEBP_QUALITY, 101]
+
+        self.spec = spec
+        self.format = format_name
+
+    @property
+    def is_raw(self) -> bool:
+        """True if arrays are stored as-is (no BGR conversion, no encoding)"""
+        return self.format == "npy"
+
+    @property
+    def is_lossless(self) -> bool:
+        return self.format in ("png", "webp", "npy", "rle")
+
+    def extension(self, source_suffix: str) -> str:
+        """Output file extension
+
+        Args:
+            source_suffix: Extension of the input file (used by "source")
+        """
+        return ENCODER_FORMATS[self.format] or source_suffix
+
+    def encode(self, array: np.ndarray, extension: str) -> bytes:
+        """Encode one output
+
+        Args:
+            array: BGR/grayscale array (RGB for raw encoders)
+            extension: Output extension, from extension()
+
+        Returns:
+            Encoded file contents
+        """
+        if self.format == "rle":
+            return encode_mask_rle(array)
+        if self.is_raw:
+            buffer = io.BytesIO()
+            np.save(buffer, array, allow_pickle=False)
+            return buffer.getvalue()
+        return encode_image(array, extension, self.params)
+
+
+class ShardWriter:
+    """Append variant outputs to size-capped tar shards
+
+    Shards are named <prefix>-NNNNN.tar. The prefix must be unique per
+    writer (one writer per process), since each writer owns its shards.
+    Members are flushed as they are added, so a reference handed out by
+    add() stays valid even if the run is interrupted before close().
+    """
+
+    def __init__(self,
+                 shard_dir: Path,
+                 prefix: str,
+                 max_shard_bytes: int = 1024 ** 3,
+                 on_finish: Optional[Callable[[Path], None]] = None):
+        """Initialize writer
+
+        Args:
+            shard_dir: Directory for shards and their indexes (created if missing)
+            prefix: Shard name prefix, unique per writer
+            max_shard_bytes: Size after which the next shard is started
+            on_finish: Called with each shard and index file once it is
+                complete (e.g. to upload it)
+        """
+        self.shard_dir = Path(shard_dir)
+        self.shard_dir.mkdir(parents=True, exist_ok=True)
+        self.prefix = prefix
+        self.max_shard_bytes = max_shard_bytes
+        self.on_finish = on_finish
+        self._lock = threading.Lock()
+        self._sequence = 0
+        self._shard_path: Optional[Path] = None
+        self._file = None
+        self._tar: Optional[tarfile.TarFile] = None
+        self._index = None
+
+    def _open_next(self) -> None:
+        self._shard_path = self.shard_dir / f"{self.prefix}-{self._sequence:05d}.tar"
+        self._sequence += 1
+        self._file = open(self._shard_path, "wb")
+        self._tar = tarfile.open(fileobj=self._file, mode="w")
+        self._index = open(self._shard_path.with_name(self._shard_path.name + ".index.jsonl"), "w")
+
+    def _close_current(self) -> None:
+        if self._tar is None:
+            return
+        self._tar.close()  # writes the end-of-archive blocks
+        self._file.close()
+        self._index.close()
+        if self.on_finish:
+            self.on_finish(self._shard_path)
+            self.on_finish(Path(self._index.name))
+        self._tar = self._file = self._index = None
+
+    def add(self, name: str, data: bytes) -> dict:
+        """Append one member
+
+        Args:
+            name: Member name (relative output path)
+            data: Encoded file contents
+
+        Returns:
+            Reference {"shard": path relative to the run, "offset", "size"}
+        """
+        with self._lock:
+            if self._tar is None:
+                self._open_next()
+
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            info.mtime = int(time.time())
+            info.mode = 0o644
+            self._tar.addfile(info, io.BytesIO(data))
+            self._file.flush()
+            # Member list is only needed for reading; don't grow it per output
+            self._tar.members.clear()
+
+            # Data ends at the archive offset, padded to a whole block
+            padded_size = -(-info.size // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE
+            ref = {
+                "shard": f"{SHARDS_DIRNAME}/{self._shard_path.name}",
+                "offset": self._tar.offset - padded_size,
+                "size": info.size
+            }
+            self._index.write(json.dumps({"name": name, "offset": ref["offset"], "size": ref["size"]}) + "\n")
+            self._index.flush()
+
+            if self._file.tell() >= self.max_shard_bytes:
+                self._close_current()
+            return ref
+
+    def close(self) -> None:
+        """Finish the current shard"""
+        with self._lock:
+            self._close_current()
+
+
+class ArrayStoreWriter:
+    """Write raw arrays into preallocated, memory-mapped bucket files
+
+    Each (kind, shape, dtype) bucket fills files of fixed-size slots,
+    preallocated for up to capacity_hint samples (capped at max_file_bytes)
+    and truncated to the slots actually used on close. One writer per
+    process; names carry the writer prefix so writers never share a file.
+    """
+
+    def __init__(self,
+                 array_dir: Path,
+                 prefix: str,
+                 max_file_bytes: int = 1024 ** 3,
+                 capacity_hint: int = 1024,
+                 on_finish: Optional[Callable[[Path], None]] = None):
+        """Initialize writer
+
+        Args:
+            array_dir: Directory for array files and the index (created if missing)
+            prefix: File name prefix, unique per writer
+            max_file_bytes: Maximum preallocated size of one array file
+            capacity_hint: Expected number of samples per bucket (upper bound)
+            on_finish: Called with each array file once it is trimmed, and
+                with the index on close (e.g. to upload them)
+        """
+        self.array_dir = Path(array_dir)
+        self.array_dir.mkdir(parents=True, exist_ok=True)
+        self.prefix = prefix
+        self.max_file_bytes = max_file_bytes
+        self.capacity_hint = max(1, capacity_hint)
+        self.on_finish = on_finish
+        self._lock = threading.Lock()
+        self._buckets: dict[tuple, dict] = {}
+        self._index = open(self.array_dir / f"{prefix}.index.jsonl", "a")
+
+    def _open_file(self, key: tuple, sequence: int) -> dict:
+        kind, shape, dtype = key
+        slot_bytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        slots = max(1, min(self.capacity_hint, self.max_file_bytes // max(1, slot_bytes)))
+        shape_name = "x".join(str(d) for d in shape)
+        path = self.array_dir / f"{self.prefix}-{kind}-{shape_name}-{dtype}-{sequence:05d}.bin"
+        return {
+            "path": path,
+            "array": np.memmap(path, dtype=dtype, mode="w+", shape=(slots,) + shape),
+            "slot_bytes": slot_bytes,
+            "used": 0,
+            "sequence": sequence
+        }
+
+    def _finish_file(self, bucket: dict) -> None:
+        bucket["array"].flush()
+        del bucket["array"]
+        os.truncate(bucket["path"], bucket["used"] * bucket["slot_bytes"])
+        if self.on_finish:
+            self.on_finish(bucket["path"])
+
+    def add(self, kind: str, image_name: str, variant: str, array: np.ndarray) -> dict:
+        """Append one sample
+
+        Args:
+            kind: "image" or "mask"
+            image_name: Source image file name
+            variant: Variant name
+            array: Sample to store
+
+        Returns:
+            Reference {"array": path relative to the run, "offset", "shape", "dtype"}
+        """
+        key = (kind, tuple(int(d) for d in array.shape), array.dtype.str.lstrip("<>|="))
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = self._open_file(key, 0)
+            elif bucket["used"] == len(bucket["array"]):
+                self._finish_file(bucket)
+                bucket = self._buckets[key] = self._open_file(key, bucket["sequence"] + 1)
+
+            slot = bucket["used"]
+            bucket["array"][slot] = array
+            bucket["used"] += 1
+
+            ref = {
+                "array": f"{ARRAYS_DIRNAME}/{bucket['path'].name}",
+                "offset": slot * bucket["slot_bytes"],
+                "shape": list(key[1]),
+                "dtype": key[2]
+            }
+            self._index.write(json.dumps({"image": image_name, "variant": variant, "kind": kind, **ref}) + "\n")
+            self._index.flush()
+            return ref
+
+    def close(self) -> None:
+        """Flush all buckets and trim preallocated space that was not used"""
+        with self._lock:
+            for bucket in self._buckets.values():
+                self._finish_file(bucket)
+            self._buckets.clear()
+            self._index.close()
+            if self.on_finish:
+                self.on_finish(Path(self._index.name))
+
+
+def read_array(run_dir: Path, ref: dict, mmap: bool = False) -> np.ndarray:
+    """Read one sample from the array store through its reference
+
+    Args:
+        run_dir: Run directory
+        ref: {"array", "offset", "shape", "dtype"} as stored in the manifest/index
+        mmap: Return the read-only memory map instead of a copy
+
+    Returns:
+        The stored array
+    """
+    array = np.memmap(Path(run_dir) / ref["array"], dtype=ref["dtype"], mode="r",
+                      offset=ref["offset"], shape=tuple(ref["shape"]))
+    return array if mmap else np.array(array)
+
+
+def read_shard_member(run_dir: Path, ref: dict) -> bytes:
+    """Read one member's bytes through its reference
+
+    Args:
+        run_dir: Run directory
+        ref: {"shard", "offset", "size"} as stored in the manifest/index
+
+    Returns:
+        Member contents
+    """
+    with open(Path(run_dir) / ref["shard"], "rb") as f:
+        f.seek(ref["offset"])
+        return f.read(ref["size"])
+
+
+def read_output_bytes(run_dir: Path, output: dict, kind: str = "image") -> Optional[bytes]:
+    """Encoded bytes of a variant's image or mask, whatever the layout
+
+    Args:
+        run_dir: Run directory
+        output: Output entry from the run's results
+        kind: "image" or "mask"
+
+    Returns:
+        File contents, or None if the output has no such file
+    """
+    ref = output.get(f"{kind}_ref")
+    if ref and "array" in ref:
+        raise ValueError("Array store outputs are raw arrays - use load_output_image/load_output_mask")
+    if ref:
+        return read_shard_member(run_dir, ref)
+    if not output.get(kind):
+        return None
+    path = Path(run_dir) / output[kind]
+    return path.read_bytes() if path.exists() else None
+
+
+def decode_output(data: bytes, name: str, grayscale: bool = False) -> Optional[np.ndarray]:
+    """Decode stored output bytes
+
+    Args:
+        data: Encoded contents
+        name: File/member name (its suffix selects the decoder)
+        grayscale: Return a single-channel array (masks)
+
+    Returns:
+        RGB image, grayscale mask, or None if decoding failed
+    """
+    if name.lower().endswith(".npy"):
+        array = np.load(io.BytesIO(data), allow_pickle=False)
+    elif name.endswith(".rle"):
+        array = decode_mask_rle(data)
+    else:
+        array = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+        if array is None:
+            return None
+        if array.ndim == 3:
+            array = cv2.cvtColor(array, cv2.COLOR_BGR2GRAY if grayscale else cv2.COLOR_BGR2RGB)
+    return array
+
+
+def load_output_image(run_dir: Path, output: dict) -> Optional[np.ndarray]:
+    """Decoded RGB image of a variant output (None if missing)"""
+    ref = output.get("image_ref")
+    if ref and "array" in ref:
+        return read_array(run_dir, ref)
+    data = read_output_bytes(run_dir, output, "image")
+    return decode_output(data, output["image"]) if data is not None else None
+
+
+def load_output_mask(run_dir: Path, output: dict) -> Optional[np.ndarray]:
+    """Decoded mask of a variant output (None if the variant has no mask)"""
+    ref = output.get("mask_ref")
+    if ref and "array" in ref:
+        return read_array(run_dir, ref)
+    data = read_output_bytes(run_dir, output, "mask")
+    return decode_output(data, output["mask"], grayscale=True) if data is not None else None
@@ -1,5 +1,6 @@
 """Pipeline Manager - Manages pipeline configurations"""
 
+import hashlib
 import json
 import uuid
 from datetime import datetime
@@ -7,6 +8,12 @@ from pathlib import Path
 from typing import Any, Optional
 import albumentations as A
 
+from .geometric_fusion import fuse_geometric_pipeline
+from .pipeline_optimizer import collapse_flips_pipeline, optimize_transforms
+from .pixel_fusion import fuse_pixel_pipeline
+from .prefix_sharing import SharedPrefix, split_shared_prefix
+from .remap_cache import CACHED_TRANSFORMS, RemapGridCache
+
 
 # Transform classification
 GEOMETRIC_TRANSFORMS = {
@@ -168,10 +175,45 @@ class PipelineConfig:
             }
         }
 
-    def save(self, output_path: str) -> None:
-        """Save pipeline to JSON file"""
+    def fingerprint(self) -> str:
+        """Hash of everything that affects the output pixels
+
+        Metadata and transform IDs are excluded, so the same transforms and
+        parameters always give the same fingerprint.
+
+        Returns:
+            Hex SHA-256 digest
+        """
+        canonical = {
+            "transforms": [{"type": t["type"], "params": t["params"]} for t in self.transforms],
+            "compose": self.compose_type
+        }
+        payload = json.dumps(canonical, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def optimized_plan(self) -> dict:
+        """Cheaper equivalent plan of the transforms (see pipeline_optimizer)
+
+        Returns:
+            Dict with the plan's "transforms" and the "rewrites" made, each
+            with its "equivalence" level ("exact" or "approximate")
+        """
+        transforms, rewrites = optimize_transforms(self.transforms)
+        return {"transforms": transforms, "rewrites": rewrites}
+
+    def save(self, output_path: str, optimize: bool = False) -> None:
+        """Save pipeline to JSON file
+
+        Args:
+            output_path: JSON file path
+            optimize: Also save the optimized plan that is run instead of
+                the transforms (under "optimized_plan", ignored by load)
+        """
+        data = self.to_dict()
+        if optimize:
+            data["optimized_plan"] = self.optimized_plan()
         with open(output_path, 'w') as f:
-            json.dump(self.to_dict(), f, indent=2)
+            json.dump(data, f, indent=2)
 
     def load(self, config_path: str) -> None:
         """Load pipeline from JSON file
@@ -216,9 +258,28 @@ class PipelineConfig:
             # Add transform (params stored exactly as imported)
             self.add_transform(class_name, params)
 
-    def build_albumentations_pipeline(self) -> tuple[Optional[A.Compose], Optional[A.Compose]]:
+    def build_albumentations_pipeline(self,
+                                      fuse_geometric: bool = False,
+                                      fuse_pixel: bool = False,
+                                      remap_cache: Optional[RemapGridCache] = None,
+                                      optimize: bool = False
+                                      ) -> tuple[Optional[A.Compose], Optional[A.Compose]]:
         """Convert to Albumentations Compose objects
 
+        Args:
+            fuse_geometric: Apply consecutive geometric transforms (affine,
+                perspective, distortions) in one resampling pass, see
+                geometric_fusion. Approximate, so off by default
+            fuse_pixel: Apply consecutive point-wise tone transforms
+                (brightness/contrast, gamma, posterize, solarize, invert,
+                equalize, ...) as one lookup table, see pixel_fusion.
+                Output is bit-identical
+            remap_cache: Cache for the remap grids of OpticalDistortion and
+                GridDistortion (optional, output is bit-identical)
+            optimize: Build the optimized plan instead of the transforms as
+                listed (see optimized_plan). Off by default, since some
+                rewrites are approximate
+
         Returns:
             (geometric_pipeline, pixel_pipeline)
 
@@ -228,11 +289,16 @@ class PipelineConfig:
         geometric_transforms = []
         pixel_transforms = []
 
-        for t in self.transforms:
+        transforms = optimize_transforms(self.transforms)[0] if optimize else self.transforms
+        for t in transforms:
             try:
                 transform_class = getattr(A, t["type"])
+                if remap_cache is not None and t["type"] in CACHED_TRANSFORMS:
+                    transform_class = CACHED_TRANSFORMS[t["type"]]
                 # Pass params exactly as specified in config (100% config fidelity)
                 transform_instance = transform_class(**t["params"])
+                if transform_class is CACHED_TRANSFORMS.get(t["type"]):
+                    transform_instance.remap_cache = remap_cache
 
                 if t["category"] == "geometric":
                     geometric_transforms.append(transform_instance)
@@ -247,10 +313,50 @@ class PipelineConfig:
                 raise ValueError(f"Transform '{t['type']}' configuration is incompatible with Albumentations: {e}")
 
         geometric_pipeline = A.Compose(geometric_transforms) if geometric_transforms else None
+        if optimize:
+            geometric_pipeline = collapse_flips_pipeline(geometric_pipeline)
+        if fuse_geometric:
+            geometric_pipeline = fuse_geometric_pipeline(geometric_pipeline)
         pixel_pipeline = A.Compose(pixel_transforms) if pixel_transforms else None
+        if fuse_pixel:
+            pixel_pipeline = fuse_pixel_pipeline(pixel_pipeline)
 
         return geometric_pipeline, pixel_pipeline
 
+    def build_shared_prefix_pipeline(self,
+                                     fuse_geometric: bool = False,
+                                     fuse_pixel: bool = False,
+                                     remap_cache: Optional[RemapGridCache] = None,
+                                     optimize: bool = False
+                                     ) -> tuple[Optional[SharedPrefix], Optional[A.Compose], Optional[A.Compose]]:
+        """Build the pipelines with their deterministic prefix split off
+
+        Leading transforms that always fire with fixed parameters give the
+        same result for every variant, so they are returned separately to be
+        applied once per image (see prefix_sharing). Options are those of
+        build_albumentations_pipeline.
+
+        Returns:
+            (shared_prefix, geometric_pipeline, pixel_pipeline): shared_prefix
+            is None if the pipeline doesn't start with a deterministic transform
+        """
+        geometric_pipeline, pixel_pipeline = self.build_albumentations_pipeline(
+            remap_cache=remap_cache,
+            optimize=optimize
+        )
+        shared_prefix, geometric_pipeline, pixel_pipeline = split_shared_prefix(geometric_pipeline, pixel_pipeline)
+
+        if fuse_geometric:
+            geometric_pipeline = fuse_geometric_pipeline(geometric_pipeline)
+        if fuse_pixel:
+            pixel_pipeline = fuse_pixel_pipeline(pixel_pipeline)
+        if shared_prefix is not None:
+            if fuse_geometric:
+                shared_prefix.geometric = fuse_geometric_pipeline(shared_prefix.geometric)
+            if fuse_pixel:
+                shared_prefix.pixel = fuse_pixel_pipeline(shared_prefix.pixel)
+        return shared_prefix, geometric_pipeline, pixel_pipeline
+
     def to_albumentations_format(self) -> dict:
         """Export to Albumentations native JSON format
 
@@ -0,0 +1,256 @@
+"""Pipeline Optimizer - Rewrite a transform list into a cheaper equivalent plan
+
+Opt-in: without it, transforms run exactly as configured (CONFIG_FIDELITY.md).
+optimize_transforms() applies these rewrites, in this order, and records
+each one it made:
+
+- drop_noop (exact): transforms with p=0 (and not always_apply) never fire,
+  so they are not built at all.
+- push_downscale (approximate): a Resize, LongestMaxSize or SmallestMaxSize
+  that is the last geometric transform moves in front of the transforms
+  before it that commute with scaling (flips and, for the aspect-preserving
+  LongestMaxSize/SmallestMaxSize, also Transpose, RandomRotate90, Rotate,
+  ShiftScaleRotate, Perspective and GridDistortion), so they run at the
+  smaller size. Interpolation then happens in a different order, so pixels
+  differ slightly. Images smaller than the target are upscaled earlier
+  instead, which makes them slower.
+- collapse_flips (exact): runs of two or more consecutive HorizontalFlip,
+  VerticalFlip, Transpose and RandomRotate90 become one FusedFlips step,
+  which samples each of them as Compose would and rearranges the pixels
+  once.
+
+"exact" means each variant is a sample of the same distribution with the
+same pixels for the same sampled parameters. Dropping transforms changes
+which random numbers the remaining ones draw, so a seeded optimized run
+doesn't reproduce the seeded unoptimized run image for image.
+
+Pixel transforms always run after all geometric ones (see
+PipelineConfig.build_albumentations_pipeline), so they already see the
+output of a trailing downscale; only geometric order is rewritten.
+"""
+
+import copy
+from typing import Optional
+
+import albumentations as A
+import numpy as np
+
+from .geometric_fusion import sample_params
+
+
+REWRITES = {
+    "drop_noop": {
+        "equivalence": "exact",
+        "description": "Transform has p=0 and never fires"
+    },
+    "push_downscale": {
+        "equivalence": "approximate",
+        "description": "Trailing resize moved in front of transforms that commute with scaling"
+    },
+    "collapse_flips": {
+        "equivalence": "exact",
+        "description": "Consecutive flips/transposes/90-degree rotations applied as one pixel rearrangement"
+    },
+}
+
+FLIP_TRANSFORMS = ("HorizontalFlip", "VerticalFlip", "Transpose", "RandomRotate90")
+
+RESIZE_TRANSFORMS = ("Resize", "LongestMaxSize", "SmallestMaxSize")
+
+# Transforms a resize can move in front of (up to interpolation)
+_COMMUTE_WITH_ANY_RESIZE = ("HorizontalFlip", "VerticalFlip")
+_COMMUTE_WITH_UNIFORM_RESIZE = _COMMUTE_WITH_ANY_RESIZE + (
+    "Transpose", "RandomRotate90", "Rotate", "ShiftScaleRotate", "Perspective", "GridDistortion"
+)
+
+
+def _label(transform: dict) -> str:
+    return f"{transform['type']} ({transform['id']})"
+
+
+def _record(rewrite: str, transforms: list[dict], detail: str) -> dict:
+    return {
+        "rewrite": rewrite,
+        "equivalence": REWRITES[rewrite]["equivalence"],
+        "transforms": [_label(t) for t in transforms],
+        "detail": detail
+    }
+
+
+def _never_fires(transform: dict) -> bool:
+    params = transform["params"]
+    return params.get("p") == 0 and not params.get("always_apply", False)
+
+
+def _commutes(resize: dict, transform: dict) -> bool:
+    """True if resize can run before transform (same result up to interpolation)"""
+    allowed = _COMMUTE_WITH_ANY_RESIZE if resize["type"] == "Resize" else _COMMUTE_WITH_UNIFORM_RESIZE
+    if transform["type"] not in allowed:
+        return False
+    if transform["type"] == "Perspective":
+        return transform["params"].get("keep_size", True) and not transform["params"].get("fit_output", False)
+    return True
+
+
+def _push_downscale(geometric: list[dict], rewrites: list[dict]) -> list[dict]:
+    """Move a trailing resize in front of the transforms it commutes with"""
+    if len(geometric) < 2 or geometric[-1]["type"] not in RESIZE_TRANSFORMS:
+        return geometric
+    resize = geometric[-1]
+    position = len(geometric) - 1
+    while position > 0 and _commutes(resize, geometric[position - 1]):
+        position -= 1
+    if position == len(geometric) - 1:
+        return geometric
+    passed = geometric[position:-1]
+    rewrites.append(_record(
+        "push_downscale", [resize] + passed,
+        f"{resize['type']} now runs before {', '.join(t['type'] for t in passed)}"
+    ))
+    return geometric[:position] + [resize] + passed
+
+
+def _flip_runs(geometric: list[dict]) -> list[list[dict]]:
+    """Runs of two or more consecutive flip transforms"""
+    runs, run = [], []
+    for transform in geometric + [None]:
+        if transform is not None and transform["type"] in FLIP_TRANSFORMS:
+            run.append(transform)
+            continue
+        if len(run) >= 2:
+            runs.append(run)
+        run = []
+    return runs
+
+
+def optimize_transforms(transforms: list[dict]) -> tuple[list[dict], list[dict]]:
+    """Rewrite a pipeline's transform list into a cheaper plan
+
+    Args:
+        transforms: PipelineConfig.transforms (not modified)
+
+    Returns:
+        (plan_transforms, rewrites): the transforms to build, in order, and
+        one record per rewrite made ("rewrite", "equivalence",
+        "transforms", "detail")
+    """
+    rewrites = []
+    kept = []
+    for transform in transforms:
+        if _never_fires(transform):
+            rewrites.append(_record("drop_noop", [transform], "p=0"))
+        else:
+            kept.append(copy.deepcopy(transform))
+
+    # Pixel transforms run after the geometric ones regardless of their
+    # position, so only the geometric order is rewritten (in their slots)
+    slots = [i for i, t in enumerate(kept) if t["category"] == "geometric"]
+    geometric = _push_downscale([kept[i] for i in slots], rewrites)
+    for i, transform in zip(slots, geometric):
+        kept[i] = transform
+
+    for run in _flip_runs(geometric):
+        rewrites.append(_record("collapse_flips", run, f"{len(run)} transforms, one pixel rearrangement"))
+
+    return kept, rewrites
+
+
+def _probe_op(name: str, params: dict, array: np.ndarray) -> np.ndarray:
+    """Apply one flip transform with sampled params to a 2D array"""
+    if name == "HorizontalFlip":
+        return array[:, ::-1]
+    if name == "VerticalFlip":
+        return array[::-1]
+    if name == "Transpose":
+        return array.T
+    return np.rot90(array, params["factor"])
+
+
+def _canonical(applied: list[tuple]) -> tuple[bool, bool, bool]:
+    """(transpose, vertical flip, horizontal flip), applied in that order,
+    equivalent to a sequence of flip transforms"""
+    probe = np.arange(6).reshape(2, 3)
+    target = probe
+    for transform, params in applied:
+        target = _probe_op(type(transform).__name__, params, target)
+    for transpose in (False, True):
+        for vertical in (False, True):
+            for horizontal in (False, True):
+                candidate = _rearrange(probe, transpose, vertical, horizontal)
+                if candidate.shape == target.shape and np.array_equal(candidate, target):
+                    return transpose, vertical, horizontal
+    raise ValueError("Flip sequence has no canonical form")
+
+
+def _rearrange(array: np.ndarray, transpose: bool, vertical: bool, horizontal: bool) -> np.ndarray:
+    if transpose:
+        array = array.transpose((1, 0) + tuple(range(2, array.ndim)))
+    if vertical:
+        array = array[::-1]
+    if horizontal:
+        array = array[:, ::-1]
+    return array
+
+
+class FusedFlips(A.DualTransform):
+    """Consecutive flip transforms applied as one pixel rearrangement"""
+
+    def __init__(self, transforms: list):
+        """Initialize step
+
+        Args:
+            transforms: HorizontalFlip/VerticalFlip/Transpose/RandomRotate90, in order
+        """
+        super().__init__(always_apply=True, p=1.0)
+        self.transforms = transforms
+
+    def __call__(self, *args, force_apply: bool = False, **data) -> dict:
+        applied = []
+        for transform in self.transforms:
+            params = sample_params(transform, data["image"])
+            if params is not None:
+                applied.append((transform, params))
+
+        if len(applied) == 1:
+            # Nothing to fuse - identical to the per-transform path
+            transform, params = applied[0]
+            return transform.apply_with_params(params, **data)
+
+        operation = _canonical(applied)
+        if any(operation):
+            for key in ("image", "mask"):
+                if data.get(key) is not None:
+                    data[key] = np.ascontiguousarray(_rearrange(data[key], *operation))
+        return data
+
+    def get_transform_init_args_names(self) -> tuple:
+        return ("transforms",)
+
+    def __repr__(self) -> str:
+        return f"FusedFlips({', '.join(type(t).__name__ for t in self.transforms)})"
+
+
+def collapse_flips_pipeline(pipeline: Optional[A.Compose]) -> Optional[A.Compose]:
+    """Replace runs of two or more flip transforms with FusedFlips steps
+
+    Args:
+        pipeline: Geometric pipeline (A.Compose) or None
+
+    Returns:
+        New A.Compose (random numbers are consumed exactly as by the
+        original), or None
+    """
+    if pipeline is None:
+        return None
+
+    steps = []
+    run = []
+    for transform in list(pipeline.transforms) + [None]:
+        if transform is not None and type(transform).__name__ in FLIP_TRANSFORMS:
+            run.append(transform)
+            continue
+        steps.extend([FusedFlips(run)] if len(run) >= 2 else run)
+        run = []
+        if transform is not None:
+            steps.append(transform)
+    return A.Compose(steps, p=pipeline.p)
@@ -0,0 +1,200 @@
+"""Pixel Fusion - Apply runs of point-wise tone transforms as one lookup table
+
+RandomBrightnessContrast, RandomGamma, Posterize, Solarize, InvertImg,
+RGBShift, RandomToneCurve and Equalize map every uint8 value of a channel
+to a new value regardless of where the pixel is, yet albumentations passes
+over the whole image once per transform. fuse_pixel_pipeline() replaces
+every run of two or more of them with a FusedLUT step that
+
+1. samples each transform's parameters exactly like Compose would (same
+   p checks and random draws, in the same order),
+2. turns each applied transform into a 256-entry table per channel by
+   applying it to a ramp of all 256 values. Transforms whose table depends
+   on the image's values (Equalize, RandomBrightnessContrast with
+   brightness_by_max=False) are applied to a one-row image with the same
+   per-channel histogram as the image at that point instead,
+3. composes the tables and applies them with a single cv2.LUT call.
+
+Each table holds exactly what the transform does to that value, so the
+output is bit-identical to applying the transforms one by one. Blurs,
+noise and everything else that looks at more than one pixel end a run.
+Images that are not uint8, or have more than 4 channels, go through the
+transforms one by one.
+"""
+
+from typing import Optional
+
+import albumentations as A
+import cv2
+import numpy as np
+
+from .geometric_fusion import sample_params
+
+
+POINTWISE_TRANSFORMS = (
+    "RandomBrightnessContrast", "RandomGamma", "Posterize", "Solarize", "InvertImg",
+    "RGBShift", "RandomToneCurve", "Equalize"
+)
+
+
+def is_pointwise(transform) -> bool:
+    """True if a transform can join a FusedLUT (output value depends only on
+    the input value of the same channel)"""
+    name = type(transform).__name__
+    if name not in POINTWISE_TRANSFORMS:
+        return False
+    if name == "Equalize":
+        # by_channels=False equalizes the Y channel of YCrCb, which mixes channels
+        return transform.by_channels and transform.mask is None and not transform.mask_params
+    return True
+
+
+def _uses_histogram(transform) -> bool:
+    """True if a point-wise transform's table depends on the image's values"""
+    name = type(transform).__name__
+    return name == "Equalize" or (name == "RandomBrightnessContrast" and not transform.brightness_by_max)
+
+
+def _fits_lut(image: np.ndarray) -> bool:
+    """True if cv2.LUT can apply per-channel tables to the image"""
+    return image.dtype == np.uint8 and (image.ndim == 2 or (image.ndim == 3 and image.shape[2] <= 4))
+
+
+def _channels(image: np.ndarray) -> int:
+    return image.shape[2] if image.ndim == 3 else 1
+
+
+def _identity(channels: int) -> np.ndarray:
+    """(256, channels) table mapping every value to itself"""
+    return np.repeat(np.arange(256, dtype=np.uint8)[:, None], channels, axis=1)
+
+
+def _ramp_table(transform, params: dict, image: np.ndarray) -> np.ndarray:
+    """(256, C) table of a transform that only looks at each value"""
+    ramp = _identity(_channels(image))[None] if image.ndim == 3 else np.arange(256, dtype=np.uint8)[None]
+    return transform.apply(ramp, **params).reshape(256, _channels(image))
+
+
+def _histogram_table(transform, params: dict, histogram: np.ndarray, image: np.ndarray) -> np.ndarray:
+    """(256, C) table of a transform that looks at the image's histogram (or mean)
+
+    Args:
+        histogram: (256, C) value counts of the image the transform would see
+    """
+    channels = _channels(image)
+    total = int(histogram[:, 0].sum())
+    # Every value repeated as often as it occurs: the same histogram and
+    # mean as the real image, in one row
+    values = np.empty((1, total, channels), np.uint8)
+    for c in range(channels):
+        values[0, :, c] = np.repeat(np.arange(256, dtype=np.uint8), histogram[:, c])
+    out = transform.apply(values if image.ndim == 3 else values[..., 0], **params).reshape(total, channels)
+
+    # Output at the first occurrence of each value; values that don't occur
+    # are never looked up
+    starts = np.minimum(np.cumsum(histogram, axis=0) - histogram, total - 1)
+    table = np.take_along_axis(out, starts, axis=0)
+    return np.where(histogram > 0, table, _identity(channels))
+
+
+def _histogram(image: np.ndarray) -> np.ndarray:
+    """(256, C) int64 value counts of every channel"""
+    pixels = image.reshape(-1, _channels(image))
+    return np.stack([np.bincount(pixels[:, c], minlength=256) for c in range(pixels.shape[1])], axis=1)
+
+
+def compose_tables(applied: list[tuple], image: np.ndarray) -> np.ndarray:
+    """Single table of point-wise transforms applied one after another
+
+    Args:
+        applied: (transform, sampled params) in application order
+        image: Input image (uint8)
+
+    Returns:
+        (256, C) uint8 table, C = number of channels of the image
+    """
+    table = _identity(_channels(image))
+    histogram = None
+    for transform, params in applied:
+        if _uses_histogram(transform):
+            if histogram is None:
+                histogram = _histogram(image)
+            # Counts of the image as it is after the tables so far
+            current = np.stack([np.bincount(table[:, c], weights=histogram[:, c], minlength=256)
+                                for c in range(table.shape[1])], axis=1).astype(np.int64)
+            step = _histogram_table(transform, params, current, image)
+        else:
+            step = _ramp_table(transform, params, image)
+        table = np.take_along_axis(step, table.astype(np.intp), axis=0)
+    return table
+
+
+def apply_table(image: np.ndarray, table: np.ndarray) -> np.ndarray:
+    """Apply a (256, C) table to a uint8 image with one cv2.LUT call"""
+    channels = table.shape[1]
+    lut = table.reshape(256) if channels == 1 else np.ascontiguousarray(table[None])
+    return cv2.LUT(image, lut).reshape(image.shape)
+
+
+class FusedLUT(A.ImageOnlyTransform):
+    """Consecutive point-wise transforms applied as one lookup table"""
+
+    def __init__(self, transforms: list):
+        """Initialize step
+
+        Args:
+            transforms: Point-wise transforms (see is_pointwise), in order
+        """
+        super().__init__(always_apply=True, p=1.0)
+        self.transforms = transforms
+
+    def __call__(self, *args, force_apply: bool = False, **data) -> dict:
+        image = data["image"]
+
+        applied = []
+        for transform in self.transforms:
+            params = sample_params(transform, image)
+            if params is not None:
+                applied.append((transform, params))
+
+        if len(applied) == 1 or not _fits_lut(image):
+            # Nothing to fuse - identical to the per-transform path
+            for transform, params in applied:
+                data = transform.apply_with_params(params, **data)
+            return data
+
+        if applied:
+            data["image"] = apply_table(image, compose_tables(applied, image))
+        return data
+
+    def get_transform_init_args_names(self) -> tuple:
+        return ("transforms",)
+
+    def __repr__(self) -> str:
+        return f"FusedLUT({', '.join(type(t).__name__ for t in self.transforms)})"
+
+
+def fuse_pixel_pipeline(pipeline: Optional[A.Compose]) -> Optional[A.Compose]:
+    """Replace runs of two or more point-wise transforms with FusedLUT steps
+
+    Args:
+        pipeline: Pixel pipeline (A.Compose) or None
+
+    Returns:
+        New A.Compose (random numbers are consumed exactly as by the
+        original), or None
+    """
+    if pipeline is None:
+        return None
+
+    steps = []
+    run = []
+    for transform in list(pipeline.transforms) + [None]:
+        if transform is not None and is_pointwise(transform):
+            run.append(transform)
+            continue
+        steps.extend([FusedLUT(run)] if len(run) >= 2 else run)
+        run = []
+        if transform is not None:
+            steps.append(transform)
+    return A.Compose(steps, p=pipeline.p)
@@ -0,0 +1,181 @@
+"""Prefix Sharing - Run the deterministic start of a pipeline once per image
+
+Transforms that always fire and whose sampled parameters can only take one
+value (a fixed Resize, CLAHE with clip_limit [2, 2], ToGray with p=1, ...)
+produce the same output for every variant of an image. split_shared_prefix()
+moves the longest run of them at the start of the pipeline into a
+SharedPrefix, which is applied once per image; the variants only run the
+remaining, stochastic suffix.
+
+Every variant still draws the random numbers the prefix would have drawn
+(a PrefixDraws step at the head of the suffix), so the suffix sees the same
+random state as before and outputs are bit-identical to running the whole
+pipeline per variant.
+
+The pixel pipeline runs after the geometric one, so its prefix is only
+shared when the whole geometric pipeline is deterministic.
+"""
+
+from numbers import Number
+from typing import Optional
+
+import albumentations as A
+import numpy as np
+
+from .geometric_fusion import sample_params
+
+
+# Transforms whose output doesn't depend on any random draw
+FIXED_TRANSFORMS = (
+    "Resize", "CenterCrop", "Crop", "PadIfNeeded", "ToGray", "ToSepia", "InvertImg", "Normalize", "Equalize"
+)
+
+# Transforms that are fixed when each of these ranges holds a single value
+FIXED_WHEN_SINGLE_VALUED = {
+    "LongestMaxSize": ("max_size",),
+    "SmallestMaxSize": ("max_size",),
+    "CLAHE": ("clip_limit",),
+    "RandomBrightnessContrast": ("brightness_limit", "contrast_limit"),
+    "RandomGamma": ("gamma_limit",),
+    "Solarize": ("threshold",),
+    "Blur": ("blur_limit",),
+    "MedianBlur": ("blur_limit",),
+    "GaussianBlur": ("blur_limit", "sigma_limit"),
+    "Sharpen": ("alpha", "lightness"),
+}
+
+
+def _single_valued(value) -> bool:
+    """True if a number or a range/choice list can only yield one value"""
+    if isinstance(value, Number):
+        return True
+    values = list(value)
+    return all(isinstance(v, Number) for v in values) and len(set(values)) == 1
+
+
+def _random_mode(transform) -> bool:
+    """True if a transform is set to pick something at random outside of its
+    ranges (PadIfNeeded/LongestMaxSize position="random", ...)"""
+    position = getattr(transform, "position", None)
+    return getattr(position, "value", position) == "random"
+
+
+def is_deterministic(transform) -> bool:
+    """True if a transform always fires and gives the same output for the same input"""
+    if not (transform.always_apply or transform.p >= 1):
+        return False
+    if _random_mode(transform):
+        return False
+    name = type(transform).__name__
+    if name == "Equalize":
+        return not callable(transform.mask)
+    if name in FIXED_TRANSFORMS:
+        return True
+    if name in FIXED_WHEN_SINGLE_VALUED:
+        return all(_single_valued(getattr(transform, attr)) for attr in FIXED_WHEN_SINGLE_VALUED[name])
+    return False
+
+
+class PrefixDraws(A.DualTransform):
+    """Stand-in for the shared prefix in a variant's pipeline: draws the
+    random numbers of the prefix transforms and leaves the data unchanged"""
+
+    def __init__(self, transforms: list):
+        """Initialize step
+
+        Args:
+            transforms: Deterministic transforms of the shared prefix, in order
+        """
+        super().__init__(always_apply=True, p=1.0)
+        self.transforms = transforms
+
+    def __call__(self, *args, force_apply: bool = False, **data) -> dict:
+        for transform in self.transforms:
+            sample_params(transform, data["image"])
+        return data
+
+    def get_transform_init_args_names(self) -> tuple:
+        return ("transforms",)
+
+    def __repr__(self) -> str:
+        return f"PrefixDraws({', '.join(type(t).__name__ for t in self.transforms)})"
+
+
+class SharedPrefix:
+    """Deterministic leading transforms of the geometric and pixel pipelines"""
+
+    def __init__(self, geometric: Optional[A.Compose], pixel: Optional[A.Compose]):
+        """Initialize prefix
+
+        Args:
+            geometric: Leading geometric transforms (applied to image and mask)
+            pixel: Leading pixel transforms (image only)
+        """
+        self.geometric = geometric
+        self.pixel = pixel
+        # Names of the shared transforms as configured, in order
+        self.transform_names = [type(t).__name__ for pipeline in (geometric, pixel) if pipeline
+                                for t in pipeline.transforms]
+
+    def apply(self, image: np.ndarray,
+              mask: Optional[np.ndarray] = None) -> tuple[np.ndarray, Optional[np.ndarray]]:
+        """Apply the prefix once
+
+        Args:
+            image: Decoded RGB image
+            mask: Decoded mask (optional)
+
+        Returns:
+            (image, mask) as every variant's suffix should receive them
+        """
+        if self.geometric:
+            if mask is not None:
+                result = self.geometric(image=image, mask=mask)
+                image, mask = result["image"], result["mask"]
+            else:
+                image = self.geometric(image=image)["image"]
+        if self.pixel:
+            image = self.pixel(image=image)["image"]
+        return image, mask
+
+
+def _split(pipeline: Optional[A.Compose]) -> tuple[list, Optional[A.Compose]]:
+    """(deterministic leading transforms, pipeline with a PrefixDraws step in their place)"""
+    if pipeline is None:
+        return [], None
+    transforms = list(pipeline.transforms)
+    count = 0
+    while count < len(transforms) and is_deterministic(transforms[count]):
+        count += 1
+    if count == 0:
+        return [], pipeline
+    return transforms[:count], A.Compose([PrefixDraws(transforms[:count])] + transforms[count:], p=pipeline.p)
+
+
+def split_shared_prefix(geometric_pipeline: Optional[A.Compose],
+                        pixel_pipeline: Optional[A.Compose]
+                        ) -> tuple[Optional[SharedPrefix], Optional[A.Compose], Optional[A.Compose]]:
+    """Split the longest deterministic prefix off the geometric and pixel pipelines
+
+    Args:
+        geometric_pipeline: Geometric pipeline (A.Compose) or None
+        pixel_pipeline: Pixel pipeline (A.Compose) or None
+
+    Returns:
+        (shared_prefix, geometric_pipeline, pixel_pipeline): shared_prefix
+        is None if nothing can be shared; the pipelines are then returned
+        unchanged
+    """
+    geometric_prefix, geometric_suffix = _split(geometric_pipeline)
+    pixel_prefix = []
+    pixel_suffix = pixel_pipeline
+    if geometric_pipeline is None or len(geometric_prefix) == len(geometric_pipeline.transforms):
+        pixel_prefix, pixel_suffix = _split(pixel_pipeline)
+
+    if not geometric_prefix and not pixel_prefix:
+        return None, geometric_pipeline, pixel_pipeline
+    shared_prefix = SharedPrefix(
+        A.Compose(geometric_prefix) if geometric_prefix else None,
+        A.Compose(pixel_prefix) if pixel_prefix else None
+    )
+    return shared_prefix, geometric_suffix, pixel_suffix
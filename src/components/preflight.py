@@ -0,0 +1,145 @@
+"""Preflight - Validate a whole dataset from file headers before a run
+
+Reads only headers (see dataset_index.read_file_header), in parallel, and
+reports the problems that would otherwise surface one image at a time
+during processing:
+
+- unreadable_image / unreadable_mask: header can't be parsed
+- dimension_mismatch: mask size differs from its image (validate_mask)
+- unexpected_mask_shape: a mask load_mask would reject or fail on
+- unpaired_image / unpaired_mask: image without a mask, or a mask file no
+  image is paired with (warnings only)
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Optional
+
+from .dataset_index import DatasetIndex, read_file_header
+from .archive_reader import input_exists, is_virtual_path
+from .mask_handler import MASK_EXTENSIONS, list_mask_files, scan_image_mask_pairs
+
+ERROR_ISSUES = ("unreadable_image", "unreadable_mask", "dimension_mismatch", "unexpected_mask_shape")
+WARNING_ISSUES = ("unpaired_image", "unpaired_mask")
+
+
+def _header_or_error(path: Path) -> dict:
+    try:
+        return read_file_header(path)
+    except Exception as e:
+        return {"error": f"{type(e).__name__}: {e}"}
+
+
+def _mask_shape_problem(mask_path: Path, header: dict) -> Optional[str]:
+    """Why load_mask would not return a usable mask (None if it would)"""
+    if mask_path.suffix.lower() == ".npy":
+        if header["width"] is None:
+            return f"array shape {tuple(header['shape'])} is not (H, W) or (regions, H, W)"
+        return None
+    # Grayscale and BGR are converted; 2/4-channel masks (alpha) are not
+    if header["channels"] not in (1, 3):
+        return f"{header['channels']}-channel mask image (expected grayscale or RGB)"
+    return None
+
+
+def run_preflight(image_dir: Path,
+                  mask_dir: Optional[Path] = None,
+                  workers: int = 8,
+                  dataset_index: Optional[DatasetIndex] = None) -> dict:
+    """Check every image/mask pair of a dataset from headers only
+
+    Args:
+        image_dir: Directory containing images
+        mask_dir: Directory containing masks (optional)
+        workers: Threads reading headers
+        dataset_index: Index to take headers from (optional). It is
+            refreshed first, so only changed files are read. Ignored for
+            inputs inside tar/zip archives or in object storage
+
+    Returns:
+        {"images", "masks", "pairs", "issues": [{"type", "severity",
+        "image", "mask", "message"}], "counts": {type: n}, "errors",
+        "warnings", "ok", "elapsed_seconds"}
+    """
+    start = time.perf_counter()
+    image_dir = Path(image_dir)
+    mask_dir = Path(mask_dir) if mask_dir and input_exists(Path(mask_dir)) else None
+
+    if dataset_index and not (is_virtual_path(image_dir) or is_virtual_path(mask_dir)):
+        pairs = dataset_index.pairs(image_dir, mask_dir)
+        mask_rows = dataset_index.files(mask_dir) if mask_dir else []
+        headers = {str(row["path"]): row for row in dataset_index.files(image_dir) + mask_rows}
+        mask_files = [row["path"] for row in mask_rows if row["path"].suffix in MASK_EXTENSIONS]
+    else:
+        pairs = scan_image_mask_pairs(image_dir, mask_dir)
+        mask_files = list_mask_files(mask_dir) if mask_dir else []
+        to_read = [img for img, _ in pairs] + [m for _, m in pairs if m is not None]
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            headers = dict(zip((str(p) for p in to_read), pool.map(_header_or_error, to_read)))
+
+    issues = []
+
+    def report(issue_type: str, image: Optional[Path], mask: Optional[Path], message: str) -> None:
+        issues.append({
+            "type": issue_type,
+            "severity": "error" if issue_type in ERROR_ISSUES else "warning",
+            "image": str(image) if image else None,
+            "mask": str(mask) if mask else None,
+            "message": message
+        })
+
+    for img_path, mask_path in pairs:
+        image_header = headers[str(img_path)]
+        if image_header.get("error"):
+            report("unreadable_image", img_path, mask_path, image_header["error"])
+        if mask_path is None:
+            if mask_dir:
+                report("unpaired_image", img_path, None, "no mask found")
+            continue
+
+        mask_header = headers[str(mask_path)]
+        if mask_header.get("error"):
+            report("unreadable_mask", img_path, mask_path, mask_header["error"])
+            continue
+        problem = _mask_shape_problem(mask_path, mask_header)
+        if problem:
+            report("unexpected_mask_shape", img_path, mask_path, problem)
+            continue
+        if image_header.get("error"):
+            continue
+        image_size = (image_header["height"], image_header["width"])
+        mask_size = (mask_header["height"], mask_header["width"])
+        if image_size != mask_size:
+            report("dimension_mismatch", img_path, mask_path,
+                   f"Dimension mismatch: image {image_size} vs mask {mask_size}")
+
+    paired_masks = {str(m) for _, m in pairs if m is not None}
+    for mask_path in sorted(mask_files):
+        if str(mask_path) not in paired_masks:
+            report("unpaired_mask", None, mask_path, "no image is paired with this mask")
+
+    counts = {}
+    for issue in issues:
+        counts[issue["type"]] = counts.get(issue["type"], 0) + 1
+    errors = sum(1 for issue in issues if issue["severity"] == "error")
+
+    return {
+        "image_dir": str(image_dir),
+        "mask_dir": str(mask_dir) if mask_dir else None,
+        "images": len(pairs),
+        "masks": len(mask_files),
+        "pairs": sum(1 for _, m in pairs if m is not None),
+        "issues": issues,
+        "counts": counts,
+        "errors": errors,
+        "warnings": len(issues) - errors,
+        "ok": errors == 0,
+        "elapsed_seconds": time.perf_counter() - start
+    }
+
+
+def failed_images(report: dict) -> set[str]:
+    """Image paths with at least one error-level issue in a preflight report"""
+    return {issue["image"] for issue in report["issues"]
+            if issue["severity"] == "error" and issue["image"]}
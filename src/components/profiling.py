@@ -0,0 +1,193 @@
+"""Profiling - Opt-in stage and per-transform timing for batch runs
+
+Timings use time.perf_counter (monotonic, high resolution). Each image gets a
+StageTimings recorder; its events end up in the image's result record and are
+aggregated into p50/p95/p99 summaries for the manifest.
+"""
+
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Optional
+
+import numpy as np
+
+from .prefix_sharing import PrefixDraws
+
+
+class StageTimings:
+    """Timing events of one image: stage name / transform name -> [ms, ...]
+
+    Stages may be recorded from several threads (the staged writer pool
+    writes variants of one image concurrently), so updates are locked.
+    """
+
+    def __init__(self):
+        self.stages: dict[str, list[float]] = {}
+        self.transforms: dict[str, list[float]] = {}
+        self._lock = threading.Lock()
+
+    def add_stage(self, name: str, elapsed_ms: float) -> None:
+        with self._lock:
+            self.stages.setdefault(name, []).append(elapsed_ms)
+
+    def add_transform(self, name: str, elapsed_ms: float) -> None:
+        with self._lock:
+            self.transforms.setdefault(name, []).append(elapsed_ms)
+
+    @contextmanager
+    def stage(self, name: str):
+        """Time the enclosed block as one event of the given stage"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_stage(name, (time.perf_counter() - start) * 1000)
+
+    def to_dict(self) -> dict:
+        return {"stages": self.stages, "transforms": self.transforms}
+
+
+def measure(timings: Optional[StageTimings], name: str):
+    """Context manager timing a stage, or a no-op when profiling is off
+
+    Args:
+        timings: Recorder of the current image (None disables timing)
+        name: Stage name
+    """
+    return timings.stage(name) if timings is not None else nullcontext()
+
+
+class _TimedTransform:
+    """Transparent wrapper timing each call of one albumentations transform
+
+    Attribute access is delegated, so Compose sees the wrapped transform's
+    p / always_apply / targets unchanged and consumes random numbers exactly
+    as it would without the wrapper.
+    """
+
+    def __init__(self, transform, profiler: "PipelineProfiler"):
+        self.transform = transform
+        self.name = type(transform).__name__
+        self.profiler = profiler
+
+    def __call__(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return self.transform(*args, **kwargs)
+        finally:
+            timings = self.profiler.current
+            if timings is not None:
+                timings.add_transform(self.name, (time.perf_counter() - start) * 1000)
+
+    def __getattr__(self, name):
+        return getattr(self.transform, name)
+
+    def __repr__(self) -> str:
+        return repr(self.transform)
+
+
+class PipelineProfiler:
+    """Routes per-transform timings of instrumented pipelines to the
+    recorder of the image currently being augmented on this thread"""
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def __getstate__(self) -> dict:
+        """Pickle support for pool workers (thread-local state is not copied)"""
+        return {}
+
+    def __setstate__(self, state: dict) -> None:
+        self._local = threading.local()
+
+    @property
+    def current(self) -> Optional[StageTimings]:
+        return getattr(self._local, "timings", None)
+
+    def instrument(self, pipeline):
+        """Wrap the top-level transforms of an A.Compose (in place)
+
+        PrefixDraws steps (prefix_sharing) are left unwrapped: they stand in
+        for transforms already timed in the shared prefix, not for a
+        configured transform.
+
+        Args:
+            pipeline: A.Compose or None
+
+        Returns:
+            The same pipeline
+        """
+        if pipeline is not None:
+            pipeline.transforms = [t if isinstance(t, PrefixDraws) else _TimedTransform(t, self)
+                                   for t in pipeline.transforms]
+        return pipeline
+
+    @contextmanager
+    def recording(self, timings: Optional[StageTimings]):
+        """Attribute transform calls in the enclosed block to timings"""
+        previous = self.current
+        self._local.timings = timings
+        try:
+            yield
+        finally:
+            self._local.timings = previous
+
+
+def summarize(values: list[float]) -> dict:
+    """Count, total and percentiles of a list of durations in ms"""
+    array = np.asarray(values, dtype=np.float64)
+    p50, p95, p99 = np.percentile(array, [50, 95, 99])
+    return {
+        "count": int(array.size),
+        "total_ms": float(array.sum()),
+        "mean_ms": float(array.mean()),
+        "p50_ms": float(p50),
+        "p95_ms": float(p95),
+        "p99_ms": float(p99),
+        "max_ms": float(array.max())
+    }
+
+
+class TimingAggregator:
+    """Per-stage and per-transform-type durations of many images, added one
+    image at a time"""
+
+    def __init__(self):
+        self.images = 0
+        self.stages: dict[str, list[float]] = {}
+        self.transforms: dict[str, list[float]] = {}
+
+    def add(self, timings: Optional[dict]) -> None:
+        """Add the "timings" of one result record (None is skipped)"""
+        if not timings:
+            return
+        self.images += 1
+        for name, values in timings.get("stages", {}).items():
+            self.stages.setdefault(name, []).extend(values)
+        for name, values in timings.get("transforms", {}).items():
+            self.transforms.setdefault(name, []).extend(values)
+
+    def summary(self) -> dict:
+        """{"images": n, "stages": {name: summary}, "transforms": {name: summary}}"""
+        return {
+            "images": self.images,
+            "stages": {name: summarize(values) for name, values in sorted(self.stages.items())},
+            "transforms": {name: summarize(values) for name, values in sorted(self.transforms.items())}
+        }
+
+
+def aggregate_timings(results: list[dict]) -> dict:
+    """Aggregate the "timings" of result records into per-stage and
+    per-transform-type summaries
+
+    Args:
+        results: Result dictionaries (records without timings are skipped)
+
+    Returns:
+        {"images": n, "stages": {name: summary}, "transforms": {name: summary}}
+    """
+    aggregator = TimingAggregator()
+    for result in results:
+        aggregator.add(result.get("timings"))
+    return aggregator.summary()
@@ -0,0 +1,171 @@
+"""Remap Cache - Reuse OpticalDistortion / GridDistortion remap grids
+
+Both transforms build a full-size float remap grid from their sampled
+parameters, separately for the image and the mask, for every variant.
+With fixed (or repeating) parameters and images of one size, those grids
+are identical every time. The drop-in OpticalDistortion and GridDistortion
+classes here look them up in a RemapGridCache keyed by (transform, image
+shape, sampled parameters, interpolation kind) instead.
+
+Grids are stored in the fixed-point form produced by cv2.convertMaps
+(CV_16SC2 coordinates plus CV_16UC1 interpolation weights, 6 bytes per
+pixel instead of 8; 4 for the rounded nearest-neighbour grids of masks).
+cv2.remap converts float grids to exactly this form internally, so the
+output is bit-identical to the uncached transforms.
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Callable, Optional
+
+import albumentations as A
+import cv2
+import numpy as np
+
+from .geometric_fusion import grid_distortion_maps, optical_distortion_maps
+
+DEFAULT_MAX_BYTES = 256 * 1024 ** 2
+
+
+class RemapGridCache:
+    """Size-capped, in-memory LRU cache of fixed-point remap grids
+
+    Shared by all cached transforms of a process (thread-safe).
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES):
+        """Initialize cache
+
+        Args:
+            max_bytes: Total grid size above which least recently used
+                grids are evicted
+        """
+        self.max_bytes = max_bytes
+        self._grids: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __getstate__(self) -> dict:
+        """Pickle support for pool workers (each starts with an empty cache)"""
+        return {"max_bytes": self.max_bytes}
+
+    def __setstate__(self, state: dict) -> None:
+        self.__init__(state["max_bytes"])
+
+    def get(self, key: tuple, build: Callable[[], np.ndarray], nearest: bool) -> tuple:
+        """Fixed-point grid for a key, built and stored on a miss
+
+        Args:
+            key: Hashable description of the grid
+            build: Returns the (H, W, 2) float32 grid
+            nearest: Convert for INTER_NEAREST (rounded coordinates only)
+
+        Returns:
+            (map1, map2) for cv2.remap (map2 is None for nearest grids)
+        """
+        key = key + (nearest,)
+        with self._lock:
+            maps = self._grids.get(key)
+            if maps is not None:
+                self._grids.move_to_end(key)
+                self.hits += 1
+                return maps
+            self.misses += 1
+
+        map1, map2 = cv2.convertMaps(build(), None, cv2.CV_16SC2, nninterpolation=nearest)
+        maps = (map1, map2 if map2 is not None and map2.size else None)
+        size = sum(m.nbytes for m in maps if m is not None)
+        if size > self.max_bytes:
+            return maps
+
+        with self._lock:
+            if key not in self._grids:
+                self._grids[key] = maps
+                self.size_bytes += size
+                while self.size_bytes > self.max_bytes:
+                    _, evicted = self._grids.popitem(last=False)
+                    self.size_bytes -= sum(m.nbytes for m in evicted if m is not None)
+                    self.evictions += 1
+        return maps
+
+    def clear(self) -> None:
+        """Drop every grid"""
+        with self._lock:
+            self._grids.clear()
+            self.size_bytes = 0
+
+    def stats(self) -> dict:
+        """Counters for reporting"""
+        with self._lock:
+            return {
+                "grids": len(self._grids),
+                "size_bytes": self.size_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions
+            }
+
+
+class _CachedRemap:
+    """Mixin: remap with a cached grid (falls back to the parent transform
+    without a cache, or for shapes cv2.remap handles differently)
+
+    Classes using it come before the albumentations transform in the bases
+    and define:
+
+    - _grid_key(height, width, params) -> tuple: the sampled parameters
+      the grid depends on (shape and class name are added by the mixin)
+    - _build_grid(height, width, params) -> np.ndarray: the (H, W, 2)
+      float32 remap grid for those parameters
+    """
+
+    remap_cache: Optional[RemapGridCache] = None
+
+    def _remap(self, img: np.ndarray, params: dict, interpolation: int, value) -> Optional[np.ndarray]:
+        """Remapped image, or None to use the parent's implementation"""
+        # Single-channel (H, W, 1) and > 4 channel arrays take albumentations' reshaping paths
+        if self.remap_cache is None or (img.ndim == 3 and not 1 < img.shape[2] <= 4):
+            return None
+        height, width = img.shape[:2]
+        nearest = interpolation == cv2.INTER_NEAREST
+        map1, map2 = self.remap_cache.get(
+            (type(self).__name__, height, width) + self._grid_key(height, width, params),
+            lambda: self._build_grid(height, width, params),
+            nearest
+        )
+        return cv2.remap(img, map1, map2, interpolation=interpolation, borderMode=self.border_mode, borderValue=value)
+
+    def apply(self, img: np.ndarray, interpolation: int = cv2.INTER_LINEAR, **params) -> np.ndarray:
+        result = self._remap(img, params, interpolation, self.value)
+        return result if result is not None else super().apply(img, interpolation=interpolation, **params)
+
+    def apply_to_mask(self, img: np.ndarray, **params) -> np.ndarray:
+        result = self._remap(img, params, cv2.INTER_NEAREST, self.mask_value)
+        return result if result is not None else super().apply_to_mask(img, **params)
+
+
+class OpticalDistortion(_CachedRemap, A.OpticalDistortion):
+    """A.OpticalDistortion with remap grids from a RemapGridCache"""
+
+    def _grid_key(self, height: int, width: int, params: dict) -> tuple:
+        return params.get("k", 0), params.get("dx", 0), params.get("dy", 0)
+
+    def _build_grid(self, height: int, width: int, params: dict) -> np.ndarray:
+        return optical_distortion_maps(height, width, params.get("k", 0), params.get("dx", 0), params.get("dy", 0))
+
+
+class GridDistortion(_CachedRemap, A.GridDistortion):
+    """A.GridDistortion with remap grids from a RemapGridCache"""
+
+    def _grid_key(self, height: int, width: int, params: dict) -> tuple:
+        return self.num_steps, tuple(params.get("stepsx", ())), tuple(params.get("stepsy", ()))
+
+    def _build_grid(self, height: int, width: int, params: dict) -> np.ndarray:
+        return grid_distortion_maps(height, width, self.num_steps, params.get("stepsx", ()), params.get("stepsy", ()))
+
+
+CACHED_TRANSFORMS = {"OpticalDistortion": OpticalDistortion, "GridDistortion": GridDistortion}
@@ -0,0 +1,469 @@
+"""Storage - Local and S3-compatible object storage for inputs and run outputs
+
+Object storage locations are URLs, e.g. s3://datasets/sem/images. They can
+be used wherever an input directory is expected: listing, existence checks
+and reads go through archive_reader's helpers, which hand URLs and local
+paths to the backend open_storage() picks for them. Note that Path() collapses "s3://" to "s3:/"; both forms are
+accepted.
+
+An output directory given as a URL is staged locally (journal, shards and
+array files need a real filesystem) and mirrored to the bucket while the
+run progresses: each output is PUT as soon as it is written, finished
+shards and array files go up as multipart uploads, and a final sync
+uploads whatever is still missing along with the run metadata.
+
+S3 support needs boto3 (optional). Credentials come from the usual AWS
+environment variables or config files; endpoint_url points the client at
+any S3-compatible server (MinIO, Ceph, ...).
+"""
+
+import io
+import os
+import shutil
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Optional
+
+try:
+    import boto3
+    from boto3.s3.transfer import TransferConfig
+    from botocore.config import Config
+    from botocore.exceptions import ClientError
+except ImportError:  # S3 URLs are unavailable, local paths still work
+    boto3 = None
+
+
+STORAGE_SCHEMES = ("s3",)
+DEFAULT_MAX_CONNECTIONS = 32
+MULTIPART_THRESHOLD = 64 * 1024 ** 2
+MULTIPART_CHUNKSIZE = 16 * 1024 ** 2
+# Ranged GET size when an object is opened for partial reads (headers)
+RANGE_READ_SIZE = 256 * 1024
+
+
+def is_storage_url(path) -> bool:
+    """True for object storage URLs (s3://bucket/key, also as a Path)"""
+    return path is not None and str(path).startswith(tuple(f"{s}:/" for s in STORAGE_SCHEMES))
+
+
+def split_storage_url(path) -> tuple[str, str]:
+    """Split an object storage URL into (bucket, key)"""
+    _, _, rest = str(path).partition(":/")
+    bucket, _, key = rest.lstrip("/").partition("/")
+    return bucket, key.strip("/")
+
+
+def storage_url(path) -> str:
+    """Canonical s3://bucket/key form of a URL (undoes Path's "s3:/")"""
+    bucket, key = split_storage_url(path)
+    return f"s3://{bucket}/{key}" if key else f"s3://{bucket}"
+
+
+class StorageBackend(ABC):
+    """Interface of a storage location
+
+    Keys are "/"-separated paths relative to the backend's root; "" is the
+    root itself.
+    """
+
+    @abstractmethod
+    def list_dir(self, prefix: str) -> list[str]:
+        """Names of the files directly under a prefix"""
+
+    @abstractmethod
+    def list_tree(self, prefix: str) -> dict[str, int]:
+        """Every key under a prefix (recursively) -> size in bytes"""
+
+    @abstractmethod
+    def exists(self, key: str) -> bool:
+        """True if key is a file or a prefix with files under it"""
+
+    @abstractmethod
+    def content_tag(self, key: str) -> str:
+        """Cheap identifier that changes whenever the contents change"""
+
+    @abstractmethod
+    def open(self, key: str) -> io.BufferedIOBase:
+        """Open a file for (seekable) binary reading"""
+
+    @abstractmethod
+    def read(self, key: str) -> bytes:
+        """Contents of a file"""
+
+    @abstractmethod
+    def write(self, key: str, data: bytes) -> None:
+        """Create or replace a file"""
+
+    @abstractmethod
+    def upload_file(self, local_path: Path, key: str) -> None:
+        """Copy a local file to key"""
+
+
+class LocalStorage(StorageBackend):
+    """Storage backend for a directory of the local filesystem"""
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+
+    def _path(self, key: str) -> Path:
+        return self.root / key if key else self.root
+
+    def list_dir(self, prefix: str) -> list[str]:
+        directory = self._path(prefix)
+        if not directory.is_dir():
+            return []
+        with os.scandir(directory) as entries:
+            return [entry.name for entry in entries if entry.is_file()]
+
+    def list_tree(self, prefix: str) -> dict[str, int]:
+        base = self._path(prefix)
+        sizes = {}
+        for dirpath, _, filenames in os.walk(base):
+            for name in filenames:
+                path = Path(dirpath) / name
+                sizes[path.relative_to(self.root).as_posix()] = path.stat().st_size
+        return sizes
+
+    def exists(self, key: str) -> bool:
+        return self._path(key).exists()
+
+    def content_tag(self, key: str) -> str:
+        stat = self._path(key).stat()
+        return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+    def open(self, key: str) -> io.BufferedIOBase:
+        return open(self._path(key), "rb")
+
+    def read(self, key: str) -> bytes:
+        return self._path(key).read_bytes()
+
+    def write(self, key: str, data: bytes) -> None:
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(path.name + ".tmp")
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+
+    def upload_file(self, local_path: Path, key: str) -> None:
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(local_path, path)
+
+
+class _ObjectFile(io.RawIOBase):
+    """Seekable read-only view of an object, fetched with ranged GETs"""
+
+    def __init__(self, storage: "S3Storage", key: str):
+        super().__init__()
+        self._storage = storage
+        self._key = key
+        self._size: Optional[int] = None
+        self._position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def _object_size(self) -> int:
+        if self._size is None:
+            head = self._storage.client.head_object(Bucket=self._storage.bucket, Key=self._key)
+            self._size = head["ContentLength"]
+        return self._size
+
+    def readinto(self, buffer) -> int:
+        if self._size is not None and self._position >= self._size:
+            return 0
+        end = self._position + len(buffer) - 1
+        try:
+            response = self._storage.client.get_object(
+                Bucket=self._storage.bucket, Key=self._key, Range=f"bytes={self._position}-{end}"
+            )
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") == "InvalidRange":
+                self._size = self._position
+                return 0
+            raise
+        data = response["Body"].read()
+        if "ContentRange" in response:
+            # "bytes start-end/total" tells the object size without a HEAD
+            self._size = int(response["ContentRange"].rpartition("/")[2])
+        else:
+            # Server ignored the range and sent the whole object
+            self._size = len(data)
+            data = data[self._position:self._position + len(buffer)]
+        buffer[:len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_END:
+            base = self._object_size()
+        else:
+            base = {io.SEEK_SET: 0, io.SEEK_CUR: self._position}[whence]
+        self._position = max(0, base + offset)
+        return self._position
+
+    def tell(self) -> int:
+        return self._position
+
+
+class S3Storage(StorageBackend):
+    """Storage backend for one bucket of an S3-compatible object store
+
+    A single client with a connection pool of max_connections is shared by
+    all threads of the process; it is created on first use and not
+    pickled, so each pool worker opens its own.
+    """
+
+    def __init__(self,
+                 bucket: str,
+                 endpoint_url: Optional[str] = None,
+                 max_connections: int = DEFAULT_MAX_CONNECTIONS,
+                 multipart_threshold: int = MULTIPART_THRESHOLD,
+                 multipart_chunksize: int = MULTIPART_CHUNKSIZE):
+        """Initialize backend
+
+        Args:
+            bucket: Bucket name
+            endpoint_url: S3-compatible endpoint (optional, AWS otherwise)
+            max_connections: Connection pool size (also the number of
+                parallel parts of a multipart upload)
+            multipart_threshold: File size from which uploads are multipart
+            multipart_chunksize: Part size of multipart uploads
+        """
+        if boto3 is None:
+            raise ImportError("S3 storage requires boto3 (pip install boto3)")
+        self.bucket = bucket
+        self.endpoint_url = endpoint_url
+        self.max_connections = max_connections
+        self.multipart_threshold = multipart_threshold
+        self.multipart_chunksize = multipart_chunksize
+        self._client = None
+        self._lock = threading.Lock()
+
+    def __getstate__(self) -> dict:
+        """Pickle support for pool workers (the client is per process)"""
+        state = self.__dict__.copy()
+        state["_client"] = None
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        """Shared boto3 client (thread-safe, pooled connections)"""
+        with self._lock:
+            if self._client is None:
+                config = Config(max_pool_connections=self.max_connections,
+                                retries={"max_attempts": 5, "mode": "standard"})
+                self._client = boto3.client("s3", endpoint_url=self.endpoint_url, config=config)
+            return self._client
+
+    def _list(self, prefix: str, delimiter: Optional[str] = None, max_keys: int = 1000):
+        """Objects under a prefix, 1000 per request"""
+        kwargs = {"Bucket": self.bucket, "Prefix": prefix, "PaginationConfig": {"PageSize": max_keys}}
+        if delimiter:
+            kwargs["Delimiter"] = delimiter
+        for page in self.client.get_paginator("list_objects_v2").paginate(**kwargs):
+            yield from page.get("Contents", [])
+
+    def list_dir(self, prefix: str) -> list[str]:
+        prefix = prefix.strip("/") + "/" if prefix.strip("/") else ""
+        return [obj["Key"][len(prefix):] for obj in self._list(prefix, delimiter="/")
+                if not obj["Key"].endswith("/")]
+
+    def list_tree(self, prefix: str) -> dict[str, int]:
+        prefix = prefix.strip("/") + "/" if prefix.strip("/") else ""
+        return {obj["Key"]: obj["Size"] for obj in self._list(prefix) if not obj["Key"].endswith("/")}
+
+    def _head(self, key: str) -> Optional[dict]:
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=key)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+
+    def exists(self, key: str) -> bool:
+        key = key.strip("/")
+        if key and self._head(key) is not None:
+            return True
+        prefix = key + "/" if key else ""
+        response = self.client.list_objects_v2(Bucket=self.bucket, Prefix=prefix, MaxKeys=1)
+        return response.get("KeyCount", 0) > 0
+
+    def content_tag(self, key: str) -> str:
+        head = self._head(key)
+        if head is None:
+            raise FileNotFoundError(f"s3://{self.bucket}/{key} not found")
+        etag = head["ETag"].strip('"')
+        return f"{head['ContentLength']}:{etag}"
+
+    def open(self, key: str) -> io.BufferedIOBase:
+        # Header readers touch only the first block, so they cost one small GET
+        return io.BufferedReader(_ObjectFile(self, key), buffer_size=RANGE_READ_SIZE)
+
+    def read(self, key: str) -> bytes:
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=key)["Body"].read()
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey"):
+                raise FileNotFoundError(f"s3://{self.bucket}/{key} not found") from e
+            raise
+
+    def write(self, key: str, data: bytes) -> None:
+        self.client.put_object(Bucket=self.bucket, Key=key, Body=data)
+
+    def upload_file(self, local_path: Path, key: str) -> None:
+        # Large files (shards, array files) go up in parallel parts
+        transfer = TransferConfig(multipart_threshold=self.multipart_threshold,
+                                  multipart_chunksize=self.multipart_chunksize,
+                                  max_concurrency=self.max_connections)
+        self.client.upload_file(str(local_path), self.bucket, key, Config=transfer)
+
+
+# Backend options for URLs (endpoint_url, max_connections, ...), per process
+_options: dict = {}
+_backends: dict[str, S3Storage] = {}
+_backends_lock = threading.Lock()
+
+
+def configure_storage(**options) -> None:
+    """Set the S3Storage options used for URLs from here on
+
+    Args:
+        **options: S3Storage keyword arguments (endpoint_url,
+            max_connections, multipart_threshold, multipart_chunksize)
+    """
+    with _backends_lock:
+        if options != _options:
+            _options.clear()
+            _options.update(options)
+            _backends.clear()
+
+
+def get_storage(path) -> S3Storage:
+    """Cached backend of the bucket a URL points into"""
+    bucket, _ = split_storage_url(path)
+    with _backends_lock:
+        backend = _backends.get(bucket)
+        if backend is None:
+            backend = _backends[bucket] = S3Storage(bucket, **_options)
+        return backend
+
+
+def open_storage(location) -> tuple[StorageBackend, str]:
+    """Backend and key of a location (URL, or local file or directory)
+
+    Local locations get a LocalStorage rooted at the location itself, so
+    their key is "".
+    """
+    if is_storage_url(location):
+        return get_storage(location), split_storage_url(location)[1]
+    return LocalStorage(Path(location)), ""
+
+
+class StorageUploader:
+    """Mirror files of a local directory to a storage location in the background
+
+    Uploads run on a thread pool sized to the backend's connection pool,
+    so many small PUTs are in flight at once.
+    """
+
+    def __init__(self, location: str, local_root: Path, workers: int = DEFAULT_MAX_CONNECTIONS):
+        """Initialize uploader
+
+        Args:
+            location: Destination URL or directory (the local_root's mirror)
+            local_root: Local directory whose files are uploaded
+            workers: Concurrent uploads
+        """
+        self.location = location
+        self.local_root = Path(local_root)
+        self.storage, self.prefix = open_storage(location)
+        self._pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="upload")
+        self._lock = threading.Lock()
+        self._pending: set[Future] = set()
+        self.uploaded_files = 0
+        self.uploaded_bytes = 0
+        self.errors: list[str] = []
+
+    def key(self, local_path: Path) -> str:
+        """Destination key of a file under local_root"""
+        relative = Path(local_path).relative_to(self.local_root).as_posix()
+        return f"{self.prefix}/{relative}" if self.prefix else relative
+
+    def _run(self, local_path: Path, data: Optional[bytes]) -> None:
+        try:
+            if data is None:
+                size = os.path.getsize(local_path)
+                self.storage.upload_file(local_path, self.key(local_path))
+            else:
+                size = len(data)
+                self.storage.write(self.key(local_path), data)
+        except Exception as e:
+            with self._lock:
+                self.errors.append(f"{local_path}: {type(e).__name__}: {e}")
+            return
+        with self._lock:
+            self.uploaded_files += 1
+            self.uploaded_bytes += size
+
+    def _submit(self, local_path: Path, data: Optional[bytes]) -> None:
+        future = self._pool.submit(self._run, Path(local_path), data)
+        with self._lock:
+            self._pending.add(future)
+        future.add_done_callback(self._done)
+
+    def _done(self, future: Future) -> None:
+        with self._lock:
+            self._pending.discard(future)
+
+    def put_bytes(self, local_path: Path, data: bytes) -> None:
+        """Upload contents just written to local_path (no re-read)"""
+        self._submit(local_path, data)
+
+    def put_file(self, local_path: Path) -> None:
+        """Upload a finished local file (multipart if it is large)"""
+        self._submit(local_path, None)
+
+    def wait(self) -> None:
+        """Block until every submitted upload has finished"""
+        with self._lock:
+            pending = list(self._pending)
+        wait(pending)
+
+    def sync(self, always: tuple[str, ...] = ()) -> None:
+        """Upload every local file that is missing remotely or differs in size
+
+        One listing of the destination decides what to send, so files
+        written by other processes (or whose upload failed) are caught.
+
+        Args:
+            always: File names to upload even if present (files that are
+                rewritten in place, like manifests)
+        """
+        self.wait()
+        remote = self.storage.list_tree(self.prefix)
+        with self._lock:
+            self.errors.clear()
+        for dirpath, _, filenames in os.walk(self.local_root):
+            for name in filenames:
+                path = Path(dirpath) / name
+                if name.endswith(".tmp") or name == "stop.flag":
+                    continue  # leftovers of interrupted writes, cancellation marker
+                if name in always or remote.get(self.key(path)) != path.stat().st_size:
+                    self.put_file(path)
+        self.wait()
+
+    def close(self) -> None:
+        """Wait for pending uploads and stop the pool"""
+        self.wait()
+        self._pool.shutdown()
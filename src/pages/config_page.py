@@ -2,8 +2,8 @@
 
 import streamlit as st
 import cv2
-import numpy as np
 import json
+import os
 import time
 import threading
 from pathlib import Path
@@ -12,14 +12,21 @@ from functools import lru_cache
 
 from src.components.pipeline_manager import PipelineConfig
 from src.components.transform_registry import TransformRegistry
-from src.components.batch_processor import BatchProcessor
-from src.components.mask_handler import find_mask_for_image, create_mask_overlay, load_mask
+from src.components.batch_processor import BatchProcessor, JOURNAL_FILENAME, seed_variant_rngs
+from src.components.dataset_index import DEFAULT_INDEX_PATH, DatasetIndex
+from src.components.preflight import run_preflight
+from src.components.archive_reader import imread_input, input_exists, is_virtual_path, list_input_files
+from src.components.storage import configure_storage, is_storage_url
+from src.components.mask_handler import (
+    build_mask_index, create_mask_overlay, find_mask_for_image, index_mask_paths, list_image_files,
+    list_mask_files, load_mask
+)
 
 
 @st.cache_data(show_spinner=False)
 def load_image_cached(image_path: str):
     """Load and cache image to avoid repeated disk reads"""
-    img = cv2.imread(image_path)
+    img = imread_input(Path(image_path))
     if img is not None:
         img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
     return img
@@ -31,6 +38,36 @@ def load_mask_cached(mask_path: str):
     return load_mask(Path(mask_path))
 
 
+@st.cache_data(show_spinner=False)
+def mask_index_cached(mask_dir: str, dir_mtime: float):
+    """(stem -> mask index, file count) of a mask directory from one listing,
+    rebuilt when the directory changes"""
+    mask_paths = list_input_files(Path(mask_dir))
+    return index_mask_paths(mask_paths), sum(1 for path in mask_paths if "." in path.name)
+
+
+def available_cpus() -> int:
+    """CPUs this process may use: its affinity mask, capped by a cgroup CPU quota"""
+    if hasattr(os, "sched_getaffinity"):
+        cpus = len(os.sched_getaffinity(0))
+    else:
+        cpus = os.cpu_count() or 1
+    try:
+        # cgroup v2 quota, e.g. "200000 100000" (2 CPUs) or "max 100000" (none)
+        quota, period = Path("/sys/fs/cgroup/cpu.max").read_text().split()
+        if quota != "max":
+            cpus = min(cpus, int(quota) // int(period))
+    except (OSError, ValueError):
+        pass
+    return max(1, cpus)
+
+
+@st.cache_resource(show_spinner=False)
+def dataset_index_cached(index_path: str):
+    """One DatasetIndex per database, shared across reruns and sessions"""
+    return DatasetIndex(index_path)
+
+
 def render():
     """Render configuration and processing page"""
     st.title("🖼️ Image Distortion Tool - Phase 1 MVP")
@@ -75,17 +112,61 @@ def render():
     output_dir = st.sidebar.text_input(
         "Output Directory",
         value="/workspace/output",
-        help="Path where distorted images will be saved"
+        help="Path where distorted images will be saved (or an s3://bucket/prefix URL runs are uploaded to)"
     )
 
+    # Object storage URLs (s3://bucket/prefix) for inputs or outputs
+    storage_options = None
+    staging_dir = None
+    if any(is_storage_url(d) for d in (input_image_dir, input_mask_dir, output_dir)):
+        endpoint_url = st.sidebar.text_input(
+            "S3 Endpoint URL",
+            value=os.environ.get("AWS_ENDPOINT_URL", ""),
+            help="S3-compatible endpoint (MinIO, Ceph, ...); leave empty for AWS. "
+                 "Credentials come from the AWS environment variables"
+        )
+        storage_options = {"endpoint_url": endpoint_url or None}
+        configure_storage(**storage_options)
+    if is_storage_url(output_dir):
+        staging_dir = st.sidebar.text_input(
+            "Local Staging Directory",
+            value="/workspace/output",
+            help="Runs are written here and uploaded to the output URL while they progress"
+        )
+
+    use_dataset_index = st.sidebar.checkbox(
+        "Use Dataset Index",
+        value=False,
+        help="Keep file sizes, dimensions and hashes of the inputs in a database and only re-read "
+             "files that changed, instead of rescanning the directories on every run and preview. "
+             "New and changed files are hashed when the page reloads, which can take a while on "
+             "large or network-mounted datasets"
+    )
+    index_path = None
+    dataset_index = None
+    if use_dataset_index:
+        index_path = st.sidebar.text_input("Dataset Index File", value=DEFAULT_INDEX_PATH)
+        dataset_index = dataset_index_cached(index_path)
+
     # Check if directories exist
     input_img_path = Path(input_image_dir)
     input_mask_path = Path(input_mask_dir) if input_mask_dir else None
-    output_path = Path(output_dir)
+    output_path = Path(staging_dir) if staging_dir else Path(output_dir)
 
     has_masks = False
-    if input_mask_path and input_mask_path.exists():
-        mask_count = len(list(input_mask_path.glob("*.*")))
+    mask_index = None
+    if input_mask_path and input_exists(input_mask_path):
+        if is_virtual_path(input_mask_path):
+            # Archives and object storage are listed directly (no dataset index)
+            mask_index = build_mask_index(input_mask_path)
+            mask_count = len(list_mask_files(input_mask_path))
+        elif dataset_index:
+            dataset_index.refresh(input_mask_path)
+            mask_index = dataset_index.mask_index(input_mask_path)
+            mask_count = len(dataset_index.files(input_mask_path))
+        else:
+            # One directory listing per change instead of stat calls per grid cell
+            mask_index, mask_count = mask_index_cached(str(input_mask_path), input_mask_path.stat().st_mtime)
         if mask_count > 0:
             st.sidebar.success(f"✅ {mask_count} masks found")
             has_masks = True
@@ -117,6 +198,113 @@ def render():
             step=1
         )
 
+    num_workers = st.sidebar.slider(
+        "Worker Processes",
+        min_value=1,
+        max_value=available_cpus(),
+        value=1,
+        help="Process images in parallel across this many processes (1 = serial)"
+    )
+
+    io_threads = st.sidebar.slider(
+        "I/O Threads",
+        min_value=0,
+        max_value=16,
+        value=0,
+        help="Reader/writer threads that prefetch decoded images and write variants in the background "
+             "while transforms run (0 = read, transform and write in sequence). Used when Worker Processes is 1."
+    )
+
+    queue_depth = 8
+    if io_threads > 0:
+        queue_depth = st.sidebar.slider(
+            "Queue Depth",
+            min_value=1,
+            max_value=64,
+            value=8,
+            help="Max images prefetched and max variants waiting to be written. Bounds memory use."
+        )
+
+    output_layout = st.sidebar.selectbox(
+        "Output Layout",
+        options=["files", "shards", "arrays"],
+        help="files: one PNG per image/mask. shards: size-capped tar archives with an offset index "
+             "(far fewer files for large runs). arrays: unencoded memory-mapped arrays for training "
+             "(no PNG encode/decode, larger on disk)"
+    )
+    shard_max_mb = 1024
+    if output_layout != "files":
+        shard_max_mb = st.sidebar.number_input("Max Shard/Array File Size (MB)", min_value=16, value=1024, step=256)
+
+    image_encoder, mask_encoder = "source", "png"
+    if output_layout != "arrays":
+        image_format = st.sidebar.selectbox(
+            "Image Encoder",
+            options=["source", "png", "webp (lossless)", "jpeg", "npy"],
+            help="source: same format as the input. jpeg is lossy - use it for throwaway previews only. "
+                 "With I/O Threads > 0, encoding runs in parallel on the writer threads."
+        )
+        if image_format == "png":
+            png_level = st.sidebar.slider("PNG Compression Level", min_value=0, max_value=9, value=1,
+                                          help="0 = fastest/largest, 9 = slowest/smallest")
+            image_encoder = f"png:{png_level}"
+        elif image_format == "jpeg":
+            jpeg_quality = st.sidebar.slider("JPEG Quality", min_value=50, max_value=100, value=90)
+            image_encoder = f"jpeg:{jpeg_quality}"
+        else:
+            image_encoder = image_format.split(" ")[0]
+
+        mask_format = st.sidebar.selectbox(
+            "Mask Encoder",
+            options=["png", "png (fastest)", "webp (lossless)", "npy", "rle (sparse masks)"],
+            help="Masks are always stored losslessly. rle stores only the run-length encoded bounding box "
+                 "of the mask (tiny for sparse defect masks, empty masks are a 36-byte header)"
+        )
+        mask_encoder = {"png (fastest)": "png:0"}.get(mask_format, mask_format.split(" ")[0])
+
+    use_cache = st.sidebar.checkbox(
+        "Use Augmentation Cache",
+        value=False,
+        disabled=random_seed is None or output_layout != "files",
+        help="Reuse outputs from earlier runs with the same inputs, pipeline and seed "
+             "(requires a fixed seed and the files layout)"
+    )
+    cache_dir = None
+    cache_max_gb = 10.0
+    if use_cache and random_seed is not None and output_layout == "files":
+        cache_dir = st.sidebar.text_input("Cache Directory", value="/workspace/cache")
+        cache_max_gb = st.sidebar.number_input("Max Cache Size (GB)", min_value=0.1, value=10.0, step=1.0)
+
+    preflight_option = st.sidebar.selectbox(
+        "Preflight Check",
+        options=["off", "block run on errors", "skip failing images"],
+        help="Before processing, read every image and mask header to find unreadable files, "
+             "dimension mismatches and unusable masks. The report is saved as preflight.json in the run"
+    )
+    preflight_mode = {"block run on errors": "gate", "skip failing images": "filter"}.get(preflight_option)
+
+    profile_run = st.sidebar.checkbox(
+        "Record Timing Profile",
+        value=False,
+        help="Time each stage and each transform; p50/p95/p99 summaries are saved in manifest.json"
+    )
+
+    fuse_geometric = st.sidebar.checkbox(
+        "Fuse Geometric Transforms",
+        value=False,
+        help="Resample consecutive geometric transforms (ShiftScaleRotate, Rotate, Affine, Perspective, "
+             "Optical/GridDistortion) once instead of once per transform. Faster and slightly sharper, "
+             "but outputs differ slightly from applying the transforms one by one"
+    )
+
+    optimize_pipeline = st.sidebar.checkbox(
+        "Optimize Pipeline",
+        value=False,
+        help="Run a cheaper equivalent plan: drop p=0 transforms, move a trailing resize in front of the "
+             "transforms it commutes with, apply runs of flips as one step. The plan and each rewrite "
+             "(exact or approximate) are shown below the pipeline and saved in the run's pipeline.json"
+    )
+
     # Pipeline builder
     st.sidebar.markdown("---")
     st.sidebar.subheader("Pipeline Builder")
@@ -179,7 +367,6 @@ def render():
                             st.text(f"• {err}")
 
                     # Clean up temp file
-                    import os
                     os.unlink(tmp_path)
 
                 except Exception as e:
@@ -314,6 +501,22 @@ def render():
         if len(st.session_state.pipeline.transforms) > 10:
             st.sidebar.warning(f"Showing first 10 of {len(st.session_state.pipeline.transforms)} transforms")
 
+        if optimize_pipeline:
+            plan = st.session_state.pipeline.optimized_plan()
+            with st.sidebar.expander(f"⚡ Optimized Plan ({len(plan['rewrites'])} rewrite(s))", expanded=False):
+                st.markdown("**Runs as:**")
+                for i, t in enumerate(plan["transforms"]):
+                    st.text(f"{i+1}. {t['type']}")
+                if plan["rewrites"]:
+                    st.markdown("**Rewrites:**")
+                    for rewrite in plan["rewrites"]:
+                        st.caption(
+                            f"{rewrite['rewrite']} ({rewrite['equivalence']}): "
+                            f"{', '.join(rewrite['transforms'])} - {rewrite['detail']}"
+                        )
+                else:
+                    st.caption("Nothing to rewrite - the pipeline runs as listed")
+
         # Clear all button in a form to prevent accidental clicks
         with st.sidebar.form(key="clear_pipeline_form"):
             clear_button = st.form_submit_button("🗑️ Clear All Transforms", use_container_width=True, type="secondary")
@@ -351,7 +554,8 @@ def render():
                     progress_data = json.load(f)
                     current = progress_data.get("current", 0)
                     total = progress_data.get("total", 1)
-                    if current < total:  # Still processing
+                    status = progress_data.get("status")
+                    if status == "running" or (status is None and current < total):  # Still processing
                         show_progress = True
             except:
                 pass
@@ -359,6 +563,12 @@ def render():
     # Only show progress monitor if processing is active
     if show_progress:
         st.markdown("### 📊 Live Processing Monitor")
+        eta = progress_data.get("eta_seconds")
+        rate_col, eta_col = st.columns(2)
+        with rate_col:
+            st.metric("Throughput", f"{progress_data.get('images_per_sec', 0.0):.2f} images/s")
+        with eta_col:
+            st.metric("ETA", f"{eta:.0f}s" if eta is not None else "—")
         st.components.v1.iframe("http://localhost:8502/progress.html", height=350, scrolling=False)
         st.info("💡 **Tip:** The progress monitor auto-refreshes every 2 seconds. You can also open it in a [new tab](http://localhost:8502/progress.html) for full-screen view.")
         st.markdown("---")
@@ -373,6 +583,38 @@ def render():
             "Normalize should only be used for runtime preprocessing, not for saved data augmentation."
         )
 
+    # Header-only dataset check, so problems show up before a long run
+    if st.button("🔎 Run Preflight Check", help="Read image/mask headers only and report problems in seconds"):
+        if not input_exists(input_img_path):
+            st.error("Input directory does not exist")
+        else:
+            with st.spinner("Checking dataset headers..."):
+                st.session_state.preflight_report = run_preflight(
+                    input_img_path, input_mask_path, dataset_index=dataset_index
+                )
+
+    report = st.session_state.get('preflight_report')
+    if report and report["image_dir"] == str(input_img_path):
+        summary = (f"Preflight: {report['images']} images, {report['pairs']} pairs checked in "
+                   f"{report['elapsed_seconds']:.2f}s - {report['errors']} errors, {report['warnings']} warnings")
+        if report["errors"]:
+            st.error(summary)
+        elif report["warnings"]:
+            st.warning(summary)
+        else:
+            st.success(summary)
+        if report["issues"]:
+            with st.expander(f"Preflight issues ({len(report['issues'])})", expanded=report["errors"] > 0):
+                st.dataframe(
+                    [{
+                        "Severity": issue["severity"],
+                        "Issue": issue["type"],
+                        "File": Path(issue["image"] or issue["mask"]).name,
+                        "Details": issue["message"]
+                    } for issue in report["issues"]],
+                    use_container_width=True
+                )
+
     col1, col2, col3, col4 = st.columns(4)
 
     # Process button
@@ -385,7 +627,7 @@ def render():
             if not st.session_state.pipeline.transforms:
                 print(f"DEBUG: Validation failed - no transforms!")
                 st.error("⚠️ Please select at least one transform in the sidebar")
-            elif not input_img_path.exists():
+            elif not input_exists(input_img_path):
                 print(f"DEBUG: Validation failed - input dir doesn't exist!")
                 st.error("Input directory does not exist")
             else:
@@ -397,23 +639,39 @@ def render():
                         processor = BatchProcessor(
                             input_image_dir=str(input_img_path),
                             input_mask_dir=str(input_mask_path) if has_masks else None,
-                            output_dir=str(output_path),
+                            output_dir=output_dir,
                             pipeline_config=st.session_state.pipeline,
                             num_variants=num_variants,
-                            random_seed=random_seed
+                            random_seed=random_seed,
+                            num_workers=num_workers,
+                            io_threads=io_threads,
+                            queue_depth=queue_depth,
+                            cache_dir=cache_dir,
+                            cache_max_bytes=int(cache_max_gb * 1024 ** 3),
+                            profile=profile_run,
+                            output_layout=output_layout,
+                            shard_max_bytes=int(shard_max_mb * 1024 ** 2),
+                            image_encoder=image_encoder,
+                            mask_encoder=mask_encoder,
+                            dataset_index=index_path,
+                            preflight=preflight_mode,
+                            staging_dir=staging_dir,
+                            storage_options=storage_options,
+                            fuse_geometric=fuse_geometric,
+                            optimize=optimize_pipeline
                         )
 
-                        run_dir, results = processor.process()
+                        run_dir, statistics = processor.process()
 
-                        successful = sum(1 for r in results if r["status"] == "success")
-                        failed = sum(1 for r in results if r["status"] == "error")
+                        successful = statistics["successful"]
+                        failed = statistics["failed"]
 
                         st.success(f"✅ Processing complete!")
                         st.info(f"📁 Output saved to: {run_dir}")
 
                         col_metric1, col_metric2, col_metric3 = st.columns(3)
                         with col_metric1:
-                            st.metric("Total Images", len(results))
+                            st.metric("Total Images", statistics["total_images"])
                         with col_metric2:
                             st.metric("Successful", successful)
                         with col_metric3:
@@ -437,6 +695,32 @@ def render():
             else:
                 st.warning("No active processing job found.")
 
+    # Resume an interrupted run
+    with col4:
+        if st.button("⏯️ Resume Latest Run", use_container_width=True,
+                     help="Continue the most recent run, processing only the outputs it has not written yet"):
+            resumable = [r for r in sorted(output_path.glob("run_*"), key=lambda x: x.name, reverse=True)
+                         if (r / JOURNAL_FILENAME).exists()]
+            if not resumable:
+                st.warning("No resumable run found.")
+            else:
+                with st.spinner(f"Resuming {resumable[0].name}..."):
+                    try:
+                        processor = BatchProcessor.resume(
+                            str(resumable[0]),
+                            num_workers=num_workers,
+                            io_threads=io_threads,
+                            queue_depth=queue_depth,
+                            profile=profile_run,
+                            dataset_index=index_path,
+                            storage_options=storage_options
+                        )
+                        run_dir, statistics = processor.process()
+                        st.success(f"✅ Resumed {run_dir.name}: "
+                                   f"{statistics['successful']}/{statistics['total_images']} images complete")
+                    except Exception as e:
+                        st.error(f"Resume failed: {e}")
+
     # Export pipeline
     with col3:
         if st.button("📥 Export Pipeline JSON", use_container_width=True):
@@ -464,9 +748,13 @@ def render():
     if 'mask_toggles' not in st.session_state:
         st.session_state.mask_toggles = {}
 
-    if input_img_path.exists():
+    if input_exists(input_img_path):
         # Get all images for grid view
-        image_files = sorted(list(input_img_path.glob("*.jpg")) + list(input_img_path.glob("*.png")))
+        if dataset_index and not is_virtual_path(input_img_path):
+            dataset_index.refresh(input_img_path)
+            image_files = dataset_index.list_images(input_img_path)
+        else:
+            image_files = list_image_files(input_img_path)
 
         if image_files:
             # Grid view of all input images
@@ -527,7 +815,7 @@ def render():
 
                                 # Find and overlay mask if enabled (mask also cached)
                                 if show_mask:
-                                    mask_path = find_mask_for_image(img_path, input_mask_path)
+                                    mask_path = find_mask_for_image(img_path, input_mask_path, mask_index)
                                     if mask_path:
                                         mask = load_mask_cached(str(mask_path))
                                         if mask is not None:
@@ -557,13 +845,13 @@ def render():
                 show_preview_mask = st.checkbox("Show Mask in Preview", value=False)
 
             sample_img_path = image_files[preview_image_index]
-            sample_img = cv2.imread(str(sample_img_path))
+            sample_img = imread_input(sample_img_path)
             sample_img = cv2.cvtColor(sample_img, cv2.COLOR_BGR2RGB)
 
             # Find mask
             sample_mask = None
             if has_masks:
-                mask_path = find_mask_for_image(sample_img_path, input_mask_path)
+                mask_path = find_mask_for_image(sample_img_path, input_mask_path, mask_index)
                 if mask_path:
                     sample_mask = load_mask(mask_path)
 
@@ -581,16 +869,19 @@ def render():
                 st.write("**Distorted Variants:**")
 
                 # Build pipeline
-                geometric_pipeline, pixel_pipeline = st.session_state.pipeline.build_albumentations_pipeline()
+                geometric_pipeline, pixel_pipeline = st.session_state.pipeline.build_albumentations_pipeline(
+                    fuse_geometric=fuse_geometric,
+                    optimize=optimize_pipeline
+                )
 
                 # Generate up to 3 variants for preview
                 preview_variants = min(num_variants, 3)
                 cols = st.columns(preview_variants)
 
                 for i in range(preview_variants):
-                    # Set seed
+                    # Same per-(image, variant) seed as batch processing
                     if random_seed is not None:
-                        np.random.seed(random_seed + i)
+                        seed_variant_rngs(int(random_seed), sample_img_path.name, i)
 
                     # Apply transforms
                     aug_img = sample_img.copy()
@@ -3,25 +3,32 @@
 import streamlit as st
 import cv2
 from pathlib import Path
+from src.components.archive_reader import imread_input, input_exists
+from src.components.batch_processor import load_run_manifest
 from src.components.mask_handler import load_mask, create_mask_overlay
+from src.components.output_store import load_output_image, load_output_mask
 
 
 @st.cache_data(show_spinner=False)
 def load_image_cached(image_path: str):
     """Load and cache image to avoid repeated disk reads"""
-    img = cv2.imread(image_path)
+    img = imread_input(Path(image_path))
     if img is not None:
         img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
     return img
 
 
+@st.cache_data(show_spinner=False)
+def load_output_cached(run_dir: str, output: dict):
+    """Load and cache a variant's image and mask (files or shards layout)"""
+    return load_output_image(Path(run_dir), output), load_output_mask(Path(run_dir), output)
+
+
 def render():
     """Render results comparison page"""
     st.title("📊 Results Viewer - Original vs Distorted")
 
     output_path = Path("/workspace/output")
-    input_images_path = Path("/workspace/input/images")
-    input_masks_path = Path("/workspace/input/masks")
 
     # Select run
     runs = sorted(output_path.glob("run_*"), key=lambda x: x.name, reverse=True)
@@ -35,15 +42,23 @@ def render():
 
     run_dir = output_path / selected_run
 
-    # Get variant directories
-    variant_dirs = sorted(run_dir.glob("distortion_*"))
+    # Results come from the run's records, so in-progress runs show what has finished
+    manifest = load_run_manifest(run_dir)
+    if manifest is None:
+        st.warning(f"No results found in {selected_run}")
+        return
 
-    if not variant_dirs:
+    successful_results = [r for r in manifest["results"] if r["status"] == "success"]
+    variant_names = sorted({o["variant"] for r in successful_results for o in r["outputs"]})
+
+    if not variant_names:
         st.warning(f"No distorted images found in {selected_run}")
         return
 
     st.success(f"📁 Viewing results from: **{selected_run}**")
-    st.info(f"Found {len(variant_dirs)} variant(s)")
+    if manifest["in_progress"]:
+        st.info("⏳ Run still in progress (or interrupted) - showing results finished so far.")
+    st.info(f"Found {len(variant_names)} variant(s)")
 
     # Display settings
     st.sidebar.header("Display Settings")
@@ -52,42 +67,39 @@ def render():
     num_cols = st.sidebar.slider("Grid Columns", min_value=2, max_value=6, value=3)
     max_images = st.sidebar.slider("Max Images to Display", min_value=5, max_value=100, value=20)
 
-    # Get list of processed images from first variant
-    first_variant = variant_dirs[0]
-    processed_images = sorted((first_variant / "images").glob("*.png"))[:max_images]
+    processed_results = successful_results[:max_images]
 
-    if not processed_images:
+    if not processed_results:
         st.warning("No processed images found")
         return
 
-    st.markdown(f"### Showing {len(processed_images)} images")
+    st.markdown(f"### Showing {len(processed_results)} images")
 
     # Display images in grid
-    for img_file in processed_images:
-        img_name = img_file.name
+    for result in processed_results:
+        original_path = Path(result["input_image"])
+        outputs = {o["variant"]: o for o in result["outputs"] if o["status"] == "success"}
 
         st.markdown(f"---")
-        st.markdown(f"### 🖼️ {img_name}")
+        st.markdown(f"### 🖼️ {original_path.name}")
 
         # Create columns: 1 for original + N for variants
-        cols = st.columns(len(variant_dirs) + 1)
+        cols = st.columns(len(variant_names) + 1)
 
         # Column 0: Original image
         with cols[0]:
             st.markdown("**Original**")
-            original_path = input_images_path / img_name
 
-            if original_path.exists():
+            if input_exists(original_path):
                 original_img = load_image_cached(str(original_path))
 
                 if original_img is not None:
                     display_img = original_img.copy()
 
                     # Apply mask overlay if enabled
-                    if show_masks:
-                        mask_name = original_path.stem + ".npy"
-                        mask_path = input_masks_path / mask_name
-                        if mask_path.exists():
+                    if show_masks and result.get("input_mask"):
+                        mask_path = Path(result["input_mask"])
+                        if input_exists(mask_path):
                             mask = load_mask(mask_path)
                             if mask is not None:
                                 display_img = create_mask_overlay(display_img, mask)
@@ -99,30 +111,22 @@ def render():
                 st.warning("Original not found")
 
         # Columns 1+: Distorted variants
-        for idx, variant_dir in enumerate(variant_dirs, 1):
+        for idx, variant_name in enumerate(variant_names, 1):
             with cols[idx]:
-                st.markdown(f"**{variant_dir.name}**")
-
-                distorted_path = variant_dir / "images" / img_name
+                st.markdown(f"**{variant_name}**")
 
-                if distorted_path.exists():
-                    distorted_img = load_image_cached(str(distorted_path))
+                output = outputs.get(variant_name)
+                distorted_img, mask = load_output_cached(str(run_dir), output) if output else (None, None)
 
-                    if distorted_img is not None:
-                        display_img = distorted_img.copy()
+                if distorted_img is not None:
+                    display_img = distorted_img.copy()
 
-                        # Apply mask overlay if enabled
-                        if show_masks:
-                            # Distorted masks are saved as .png (transformed masks)
-                            distorted_mask_path = variant_dir / "masks" / img_name
-                            if distorted_mask_path.exists():
-                                mask = load_mask(distorted_mask_path)
-                                if mask is not None:
-                                    display_img = create_mask_overlay(display_img, mask)
+                    # Apply mask overlay if enabled (RLE masks carry their bounding box)
+                    mask_info = output.get("mask_info", {})
+                    if show_masks and mask is not None and not mask_info.get("empty"):
+                        display_img = create_mask_overlay(display_img, mask, bbox=mask_info.get("bbox"))
 
-                        st.image(display_img, use_column_width=True)
-                    else:
-                        st.error("Failed to load")
+                    st.image(display_img, use_column_width=True)
                 else:
                     st.warning("Not found")
 
@@ -6,7 +6,10 @@ import cv2
 from pathlib import Path
 from PIL import Image
 
+from src.components.archive_reader import imread_input, input_exists
+from src.components.batch_processor import load_run_manifest
 from src.components.mask_handler import create_mask_overlay, load_mask
+from src.components.output_store import load_output_image, load_output_mask
 
 
 def render():
@@ -36,14 +39,14 @@ def render():
 
     run_dir = output_dir / selected_run
 
-    # Load manifest
-    manifest_path = run_dir / "manifest.json"
-    if not manifest_path.exists():
+    # Load manifest (in-progress runs show what has finished so far)
+    manifest = load_run_manifest(run_dir)
+    if manifest is None:
         st.error(f"Manifest not found for run: {selected_run}")
         return
 
-    with open(manifest_path) as f:
-        manifest = json.load(f)
+    if manifest["in_progress"]:
+        st.info("⏳ This run is still in progress (or was interrupted) - showing results finished so far.")
 
     # Display run info
     col1, col2, col3, col4 = st.columns(4)
@@ -97,15 +100,15 @@ def render():
     # Original image
     cols[0].markdown("**Original**")
     original_img_path = Path(selected_result["input_image"])
-    if original_img_path.exists():
-        original_img = cv2.imread(str(original_img_path))
+    if input_exists(original_img_path):
+        original_img = imread_input(original_img_path)
         original_img = cv2.cvtColor(original_img, cv2.COLOR_BGR2RGB)
 
         # Load original mask if exists
         original_mask = None
         if show_masks and selected_result["input_mask"]:
             original_mask_path = Path(selected_result["input_mask"])
-            if original_mask_path.exists():
+            if input_exists(original_mask_path):
                 original_mask = load_mask(original_mask_path)
 
         if show_masks and original_mask is not None:
@@ -122,20 +125,17 @@ def render():
     for i, output_info in enumerate(selected_result["outputs"]):
         cols[i+1].markdown(f"**{output_info['variant']}**")
 
-        variant_img_path = run_dir / output_info["image"]
-        if variant_img_path.exists():
-            variant_img = cv2.imread(str(variant_img_path))
-            variant_img = cv2.cvtColor(variant_img, cv2.COLOR_BGR2RGB)
-
+        # Outputs are read through the manifest, whatever the output layout
+        variant_img = load_output_image(run_dir, output_info)
+        if variant_img is not None:
             # Load variant mask if exists
             variant_mask = None
-            if show_masks and output_info.get("mask"):
-                variant_mask_path = run_dir / output_info["mask"]
-                if variant_mask_path.exists():
-                    variant_mask = load_mask(variant_mask_path)
+            mask_info = output_info.get("mask_info", {})
+            if show_masks and not mask_info.get("empty"):
+                variant_mask = load_output_mask(run_dir, output_info)
 
             if show_masks and variant_mask is not None:
-                overlay = create_mask_overlay(variant_img, variant_mask)
+                overlay = create_mask_overlay(variant_img, variant_mask, bbox=mask_info.get("bbox"))
                 cols[i+1].image(overlay, use_column_width=True)
             else:
                 cols[i+1].image(variant_img, use_column_width=True)
@@ -177,15 +177,8 @@ def render():
         # Find variant
         variant_idx = variant_options.index(selected_variant) - 1
         output_info = selected_result["outputs"][variant_idx]
-        variant_img_path = run_dir / output_info["image"]
-        detail_img = cv2.imread(str(variant_img_path))
-        detail_img = cv2.cvtColor(detail_img, cv2.COLOR_BGR2RGB)
-
-        detail_mask = None
-        if output_info.get("mask"):
-            variant_mask_path = run_dir / output_info["mask"]
-            if variant_mask_path.exists():
-                detail_mask = load_mask(variant_mask_path)
+        detail_img = load_output_image(run_dir, output_info)
+        detail_mask = load_output_mask(run_dir, output_info)
 
     # Display detailed view
     col1, col2 = st.columns(2)
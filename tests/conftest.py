@@ -0,0 +1,28 @@
+import sys
+from pathlib import Path
+
+# Tests import the app as `src.components...`, like app.py and the scripts
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+# Helpers shared by the pipeline tests. numpy and albumentations are only
+# imported when used, so test modules that skip without them still collect.
+
+def make_pipeline(*transforms):
+    """PipelineConfig with (transform_type, params) added in order"""
+    from src.components.pipeline_manager import PipelineConfig
+
+    config = PipelineConfig()
+    for transform_type, params in transforms:
+        config.add_transform(transform_type, params)
+    return config
+
+
+def apply_pipelines(geometric, pixel, image, mask):
+    """(image, mask) after the geometric and pixel pipelines, like BatchProcessor applies them"""
+    if geometric:
+        result = geometric(image=image.copy(), mask=mask.copy())
+        image, mask = result["image"], result["mask"]
+    if pixel:
+        image = pixel(image=image.copy())["image"]
+    return image, mask
@@ -0,0 +1,80 @@
+"""FusedWarp must stay close to applying the geometric transforms one by one
+
+Fusion resamples once instead of once per transform, so outputs are not
+bit-identical. On a smooth image the interior differs by interpolation
+error only; border pixels may differ fully where the fused and unfused
+paths fill borders differently, so they are not compared.
+"""
+
+import pytest
+
+np = pytest.importorskip("numpy")
+cv2 = pytest.importorskip("cv2")
+pytest.importorskip("albumentations")
+
+from conftest import apply_pipelines, make_pipeline
+from src.components.batch_processor import seed_variant_rngs
+from src.components.geometric_fusion import FusedWarp
+
+# Interior: the central half of each axis, which no transform below moves
+# outside the source image
+INTERIOR_MEAN_TOLERANCE = 0.5
+INTERIOR_MAX_TOLERANCE = 3
+# Share of mask pixels allowed to differ (nearest-neighbour edge flips)
+MASK_DISAGREEMENT_TOLERANCE = 0.02
+
+
+def _sample() -> tuple[np.ndarray, np.ndarray]:
+    y, x = np.mgrid[0:120, 0:160]
+    image = np.stack([(x * 1.5) % 256, (y * 2) % 256, (x + y) % 256], axis=-1).astype(np.uint8)
+    image = cv2.GaussianBlur(image, (0, 0), 2)
+    mask = np.zeros((120, 160), np.uint8)
+    cv2.circle(mask, (80, 60), 35, 255, -1)
+    return image, mask
+
+
+def _variants(config, variants: int = 8):
+    """(unfused, fused) (image, mask) outputs of each seeded variant"""
+    image, mask = _sample()
+    geometric, _ = config.build_albumentations_pipeline()
+    fused, _ = config.build_albumentations_pipeline(fuse_geometric=True)
+    for variant in range(variants):
+        seed_variant_rngs(11, "sample.png", variant)
+        expected = apply_pipelines(geometric, None, image, mask)
+        seed_variant_rngs(11, "sample.png", variant)
+        yield expected, apply_pipelines(fused, None, image, mask)
+
+
+@pytest.mark.parametrize("transforms", [
+    [
+        ("ShiftScaleRotate", {"shift_limit": 0.05, "scale_limit": 0.1, "rotate_limit": 15, "p": 1.0}),
+        ("Rotate", {"limit": 15, "p": 1.0}),
+        ("Perspective", {"scale": [0.02, 0.05], "p": 1.0}),
+    ],
+    [
+        ("Rotate", {"limit": 15, "p": 1.0}),
+        ("OpticalDistortion", {"distort_limit": 0.1, "shift_limit": 0.05, "p": 1.0}),
+        ("GridDistortion", {"num_steps": 5, "distort_limit": 0.2, "p": 1.0}),
+    ],
+], ids=["matrix", "dense_map"])
+def test_fused_chain_matches_unfused_within_tolerance(transforms):
+    config = make_pipeline(*transforms)
+    fused, _ = config.build_albumentations_pipeline(fuse_geometric=True)
+    assert isinstance(fused.transforms[0], FusedWarp)
+    for (expected_image, expected_mask), (actual_image, actual_mask) in _variants(config):
+        assert actual_image.shape == expected_image.shape
+        diff = np.abs(actual_image.astype(np.int16) - expected_image.astype(np.int16))[30:90, 40:120]
+        assert diff.mean() <= INTERIOR_MEAN_TOLERANCE
+        assert diff.max() <= INTERIOR_MAX_TOLERANCE
+        assert np.mean(actual_mask != expected_mask) <= MASK_DISAGREEMENT_TOLERANCE
+
+
+@pytest.mark.parametrize("transforms", [
+    [("Rotate", {"limit": 30, "p": 1.0}), ("GaussNoise", {"var_limit": [10.0, 50.0], "p": 1.0})],
+    # Fused, but only one member fires
+    [("Rotate", {"limit": 30, "p": 1.0}), ("Perspective", {"scale": [0.02, 0.05], "p": 0.0})],
+], ids=["single_transform", "single_applied"])
+def test_single_geometric_transform_is_unchanged(transforms):
+    for (expected_image, expected_mask), (actual_image, actual_mask) in _variants(make_pipeline(*transforms)):
+        np.testing.assert_array_equal(actual_image, expected_image)
+        np.testing.assert_array_equal(actual_mask, expected_mask)
@@ -0,0 +1,56 @@
+"""FusedLUT must match applying the point-wise transforms one by one"""
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("albumentations")
+
+from conftest import apply_pipelines, make_pipeline
+from src.components.batch_processor import seed_variant_rngs
+from src.components.pipeline_manager import PipelineConfig
+from src.components.pixel_fusion import FusedLUT
+
+
+def _assert_fused_matches_unfused(config: PipelineConfig, image: np.ndarray, variants: int = 8) -> None:
+    mask = (image[..., 0] > 128).astype(np.uint8) * 255 if image.ndim == 3 else (image > 128).astype(np.uint8)
+    geometric, pixel = config.build_albumentations_pipeline()
+    _, fused_pixel = config.build_albumentations_pipeline(fuse_pixel=True)
+    assert any(isinstance(t, FusedLUT) for t in fused_pixel.transforms)
+
+    for variant in range(variants):
+        seed_variant_rngs(7, "sample.png", variant)
+        expected_image, expected_mask = apply_pipelines(geometric, pixel, image, mask)
+        seed_variant_rngs(7, "sample.png", variant)
+        actual_image, actual_mask = apply_pipelines(geometric, fused_pixel, image, mask)
+        np.testing.assert_array_equal(actual_image, expected_image)
+        np.testing.assert_array_equal(actual_mask, expected_mask)
+
+
+def test_tone_chain_matches_unfused():
+    config = make_pipeline(
+        ("HorizontalFlip", {"p": 0.5}),
+        ("RandomBrightnessContrast", {"brightness_limit": 0.3, "contrast_limit": 0.3, "p": 0.7}),
+        ("RandomGamma", {"gamma_limit": [70, 130], "p": 1.0}),
+        ("Posterize", {"num_bits": 5, "p": 0.5}),
+        ("Solarize", {"threshold": 200, "p": 0.5}),
+        ("InvertImg", {"p": 0.5}),
+        ("GaussianBlur", {"blur_limit": [3, 5], "p": 0.5}),
+        ("RandomToneCurve", {"scale": 0.2, "p": 0.8}),
+        ("RGBShift", {"r_shift_limit": 20, "g_shift_limit": 20, "b_shift_limit": 20, "p": 0.8}),
+    )
+    image = np.random.default_rng(0).integers(0, 256, (50, 60, 3), dtype=np.uint8)
+    _assert_fused_matches_unfused(config, image)
+
+
+def test_histogram_dependent_transforms_match_unfused():
+    config = make_pipeline(
+        ("VerticalFlip", {"p": 0.5}),
+        ("RandomGamma", {"gamma_limit": [60, 140], "p": 0.6}),
+        ("Equalize", {"p": 0.7}),
+        ("RandomBrightnessContrast", {"brightness_limit": 0.3, "contrast_limit": 0.3,
+                                      "brightness_by_max": False, "p": 0.8}),
+        ("Posterize", {"num_bits": 6, "p": 0.5}),
+    )
+    # Skewed values, so the histogram steps see a non-uniform image
+    image = (np.random.default_rng(1).beta(2, 5, (50, 60, 3)) * 255).astype(np.uint8)
+    _assert_fused_matches_unfused(config, image)
@@ -0,0 +1,80 @@
+"""Shared-prefix execution must match running the whole pipeline per variant"""
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("albumentations")
+
+from conftest import apply_pipelines, make_pipeline
+from src.components.batch_processor import seed_variant_rngs
+from src.components.pipeline_manager import PipelineConfig
+from src.components.prefix_sharing import is_deterministic
+
+
+def _sample(seed: int = 0) -> tuple[np.ndarray, np.ndarray]:
+    rng = np.random.default_rng(seed)
+    image = rng.integers(0, 256, (60, 70, 3), dtype=np.uint8)
+    mask = (rng.random((60, 70)) > 0.7).astype(np.uint8) * 255
+    return image, mask
+
+
+def _assert_shared_matches_unshared(config: PipelineConfig, variants: int = 4) -> None:
+    image, mask = _sample()
+    prefix, shared_geometric, shared_pixel = config.build_shared_prefix_pipeline()
+    geometric, pixel = config.build_albumentations_pipeline()
+
+    # Like BatchProcessor: the prefix runs once, before the variants are seeded
+    shared_image, shared_mask = prefix.apply(image.copy(), mask.copy()) if prefix else (image, mask)
+    for variant in range(variants):
+        seed_variant_rngs(42, "sample.png", variant)
+        expected_image, expected_mask = apply_pipelines(geometric, pixel, image, mask)
+        seed_variant_rngs(42, "sample.png", variant)
+        actual_image, actual_mask = apply_pipelines(shared_geometric, shared_pixel, shared_image, shared_mask)
+        np.testing.assert_array_equal(actual_image, expected_image)
+        np.testing.assert_array_equal(actual_mask, expected_mask)
+
+
+def test_deterministic_prefix_matches_unshared():
+    config = make_pipeline(
+        ("Resize", {"height": 48, "width": 64, "p": 1.0}),
+        ("HorizontalFlip", {"p": 0.5}),
+        ("Rotate", {"limit": 30, "p": 0.7}),
+        ("CLAHE", {"clip_limit": [2.0, 2.0], "p": 1.0}),
+        ("RandomBrightnessContrast", {"brightness_limit": 0.2, "contrast_limit": 0.2, "p": 0.5}),
+    )
+    prefix, _, _ = config.build_shared_prefix_pipeline()
+    assert prefix is not None and prefix.transform_names == ["Resize"]
+    _assert_shared_matches_unshared(config)
+
+
+def test_fully_deterministic_geometry_shares_pixel_prefix():
+    config = make_pipeline(
+        ("Resize", {"height": 48, "width": 64, "p": 1.0}),
+        ("CLAHE", {"clip_limit": [2.0, 2.0], "p": 1.0}),
+        ("GaussNoise", {"var_limit": [10.0, 50.0], "p": 0.5}),
+    )
+    prefix, _, _ = config.build_shared_prefix_pipeline()
+    assert prefix.transform_names == ["Resize", "CLAHE"]
+    _assert_shared_matches_unshared(config)
+
+
+def test_random_pad_position_is_not_shared():
+    config = make_pipeline(
+        ("PadIfNeeded", {"min_height": 80, "min_width": 80, "position": "random", "p": 1.0}),
+        ("Rotate", {"limit": 30, "p": 1.0}),
+    )
+    geometric, _ = config.build_albumentations_pipeline()
+    assert not is_deterministic(geometric.transforms[0])
+    prefix, _, _ = config.build_shared_prefix_pipeline()
+    assert prefix is None
+    _assert_shared_matches_unshared(config, variants=3)
+
+
+def test_fixed_pad_position_is_shared():
+    config = make_pipeline(
+        ("PadIfNeeded", {"min_height": 80, "min_width": 80, "p": 1.0}),
+        ("Rotate", {"limit": 30, "p": 0.5}),
+    )
+    prefix, _, _ = config.build_shared_prefix_pipeline()
+    assert prefix.transform_names == ["PadIfNeeded"]
+    _assert_shared_matches_unshared(config)
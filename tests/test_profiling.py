@@ -0,0 +1,47 @@
+"""Profiled runs must report timings under the configured transform names"""
+
+import json
+
+import pytest
+
+np = pytest.importorskip("numpy")
+cv2 = pytest.importorskip("cv2")
+pytest.importorskip("albumentations")
+
+from conftest import make_pipeline
+from src.components.batch_processor import BatchProcessor
+
+
+def _profile(tmp_path, config, **options) -> dict:
+    images = tmp_path / "images"
+    images.mkdir()
+    rng = np.random.default_rng(0)
+    for i in range(2):
+        cv2.imwrite(str(images / f"sample_{i}.png"), rng.integers(0, 256, (40, 50, 3), dtype=np.uint8))
+
+    processor = BatchProcessor(str(images), None, str(tmp_path / "output"), config, num_variants=2,
+                               random_seed=3, profile=True, **options)
+    run_dir, _ = processor.process()
+    with open(run_dir / "manifest.json") as f:
+        return json.load(f)["profile"]
+
+
+def test_fused_pixel_transforms_are_profiled_by_name(tmp_path):
+    config = make_pipeline(
+        ("HorizontalFlip", {"p": 0.5}),
+        ("RandomGamma", {"gamma_limit": [70, 130], "p": 1.0}),
+        ("Posterize", {"num_bits": 5, "p": 1.0}),
+        ("InvertImg", {"p": 1.0}),
+    )
+    profile = _profile(tmp_path, config, fuse_pixel=True)
+    assert set(profile["transforms"]) == {"HorizontalFlip", "RandomGamma", "Posterize", "InvertImg"}
+
+
+def test_shared_prefix_stand_in_is_not_profiled(tmp_path):
+    config = make_pipeline(
+        ("Resize", {"height": 32, "width": 32, "p": 1.0}),
+        ("Rotate", {"limit": 30, "p": 1.0}),
+    )
+    profile = _profile(tmp_path, config, share_prefix=True)
+    assert set(profile["transforms"]) == {"Resize", "Rotate"}
+    assert "shared_prefix" in profile["stages"]
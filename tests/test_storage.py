@@ -0,0 +1,62 @@
+"""Local paths go through LocalStorage like URLs go through S3Storage"""
+
+import pytest
+
+from src.components.storage import LocalStorage, StorageBackend, StorageUploader, open_storage
+
+
+def test_backend_interface_is_abstract():
+    with pytest.raises(TypeError):
+        StorageBackend()
+
+
+def test_uploader_mirrors_to_local_storage(tmp_path):
+    run_dir = tmp_path / "run"
+    (run_dir / "distortion_001" / "images").mkdir(parents=True)
+    (run_dir / "distortion_001" / "images" / "a.png").write_bytes(b"image a")
+    (run_dir / "manifest.json").write_text("{}")
+    (run_dir / "partial.tmp").write_bytes(b"leftover")
+    destination = tmp_path / "mirror"
+
+    uploader = StorageUploader(str(destination), run_dir, workers=2)
+    assert isinstance(uploader.storage, LocalStorage)
+    uploader.put_bytes(run_dir / "distortion_001" / "images" / "b.png", b"image b")
+    uploader.sync(always=("manifest.json",))
+    uploader.close()
+
+    assert not uploader.errors
+    assert uploader.storage.list_tree("") == {
+        "distortion_001/images/a.png": 7,
+        "distortion_001/images/b.png": 7,
+        "manifest.json": 2
+    }
+    assert (destination / "distortion_001" / "images" / "b.png").read_bytes() == b"image b"
+
+
+def test_input_scanning_reads_through_local_storage(tmp_path, monkeypatch):
+    pytest.importorskip("numpy")
+    pytest.importorskip("cv2")
+    pytest.importorskip("albumentations")
+    from src.components import archive_reader
+    from src.components.mask_handler import scan_image_mask_pairs
+
+    images, masks = tmp_path / "images", tmp_path / "masks"
+    images.mkdir()
+    masks.mkdir()
+    for name in ("a.png", "b.png", "notes.txt"):
+        (images / name).write_bytes(name.encode())
+    (masks / "a_mask.png").write_bytes(b"mask")
+
+    opened = []
+
+    def recording_open_storage(location):
+        storage, key = open_storage(location)
+        opened.append(type(storage))
+        return storage, key
+
+    monkeypatch.setattr(archive_reader, "open_storage", recording_open_storage)
+    pairs = scan_image_mask_pairs(images, masks)
+    assert pairs == [(images / "a.png", masks / "a_mask.png"), (images / "b.png", None)]
+    assert archive_reader.read_input_bytes(images / "b.png") == b"b.png"
+    assert not archive_reader.input_exists(images / "c.png")
+    assert opened and set(opened) == {LocalStorage}
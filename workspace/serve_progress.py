@@ -1,33 +1,80 @@
 #!/usr/bin/env python3
-"""Simple HTTP server to show progress"""
+"""Simple HTTP server to show progress
+
+Serves progress.html and /progress_status.json: the progress event of the
+active run (the newest running one, else the newest with a progress.json),
+as written by ProgressReporter, plus a few fields derived for the page.
+"""
 import json
 import os
+from datetime import datetime
 from pathlib import Path
 from http.server import HTTPServer, SimpleHTTPRequestHandler
 
+OUTPUT_DIR = Path(os.environ.get('PROGRESS_OUTPUT_DIR', '/workspace/output'))
+
+# Fields of the richer progress events; runs written before they existed
+# only have current/total
+EVENT_DEFAULTS = {
+    'status': None,
+    'elapsed_seconds': None,
+    'images_per_sec': None,
+    'variants_per_sec': None,
+    'bytes_written': 0,
+    'eta_seconds': None,
+    'workers': {},
+    'timestamp': None
+}
+
+
+def read_progress(run_dir: Path):
+    """Progress event of a run, or None if missing or unreadable"""
+    try:
+        with open(run_dir / 'progress.json', 'r') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    event = dict(EVENT_DEFAULTS, **data)
+    event['run_dir'] = run_dir.name
+    event['percent'] = round(100 * event['current'] / event['total'], 1) if event.get('total') else 0.0
+    # Lets the page tell a stalled or killed run from a live one
+    event['seconds_since_update'] = None
+    if event['timestamp']:
+        event['seconds_since_update'] = (datetime.now() - datetime.fromisoformat(event['timestamp'])).total_seconds()
+    return event
+
+
+def active_progress():
+    """Event of the newest running run, else of the newest run with progress"""
+    runs = sorted(OUTPUT_DIR.glob('run_*'), key=lambda x: x.name, reverse=True)
+    latest = None
+    for run_dir in runs:
+        event = read_progress(run_dir)
+        if event is None:
+            continue
+        if event['status'] == 'running' or (event['status'] is None and event['current'] < event['total']):
+            return event
+        latest = latest or event
+    return latest
+
+
 class ProgressHandler(SimpleHTTPRequestHandler):
     def do_GET(self):
         if self.path == '/progress_status.json':
-            # Find latest run with progress.json
-            output_dir = Path('/workspace/output')
-            runs = sorted(output_dir.glob('run_*'), key=lambda x: x.name, reverse=True)
-
-            for run_dir in runs:
-                progress_file = run_dir / 'progress.json'
-                if progress_file.exists():
-                    with open(progress_file, 'r') as f:
-                        data = json.load(f)
-                        data['run_dir'] = run_dir.name
-
-                    self.send_response(200)
-                    self.send_header('Content-type', 'application/json')
-                    self.end_headers()
-                    self.wfile.write(json.dumps(data).encode())
-                    return
-
-            # No progress found
-            self.send_response(404)
+            event = active_progress()
+            if event is None:
+                # No progress found
+                self.send_response(404)
+                self.end_headers()
+                return
+
+            self.send_response(200)
+            self.send_header('Content-type', 'application/json')
+            # The page polls every 2 seconds - never serve a cached event
+            self.send_header('Cache-Control', 'no-store')
             self.end_headers()
+            self.wfile.write(json.dumps(event).encode())
         else:
             super().do_GET()
 